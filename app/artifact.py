@@ -0,0 +1,189 @@
+from typing import Dict, Any, Iterator, List
+import json
+import logging
+import os
+import shutil
+import time
+import numpy as np
+from app.config import EMBEDDINGS_ARTIFACT_PATH, EMBEDDINGS_ARTIFACT_DTYPE, BATCH_SIZE
+from app.ingestion import content_hash
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_FORMAT_VERSION = 1
+
+class _StringColumnWriter:
+    """Строковая колонка: значения подряд в .bin (utf-8) и смещения в .npy"""
+
+    def __init__(self, directory: str, name: str, count: int):
+        self.data = open(os.path.join(directory, f"{name}.bin"), "wb")
+        self.offsets = np.lib.format.open_memmap(
+            os.path.join(directory, f"{name}.offsets.npy"), mode="w+", dtype=np.int64, shape=(count + 1,)
+        )
+        self.offsets[0] = 0
+        self.position = 0
+
+    def write(self, row: int, value: str):
+        encoded = value.encode("utf-8")
+        self.data.write(encoded)
+        self.position += len(encoded)
+        self.offsets[row + 1] = self.position
+
+    def close(self):
+        self.data.close()
+        self.offsets.flush()
+        del self.offsets
+
+class _StringColumn:
+    def __init__(self, directory: str, name: str):
+        self.offsets = np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode="r")
+        path = os.path.join(directory, f"{name}.bin")
+        # Пустой файл нельзя отобразить в память
+        self.data = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.zeros(0, dtype=np.uint8)
+
+    def slice(self, start: int, stop: int) -> List[str]:
+        bounds = np.asarray(self.offsets[start:stop + 1])
+        raw = bytes(self.data[bounds[0]:bounds[-1]])
+        base = bounds[0]
+        return [raw[low - base:high - base].decode("utf-8") for low, high in zip(bounds[:-1], bounds[1:])]
+
+def export_artifact(database, path: str = EMBEDDINGS_ARTIFACT_PATH, dtype: str = EMBEDDINGS_ARTIFACT_DTYPE,
+                    batch_size: int = 5000) -> Dict[str, Any]:
+    """Выгружает коллекцию с готовыми эмбеддингами в переносимый каталог.
+
+    embeddings.npy (float16/float32) и ids читаются через mmap, документы и
+    каждое поле метаданных лежат отдельными колонками.
+    """
+    count = database.collection.count()
+    columns = _metadata_keys(database, batch_size)
+
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    embeddings = None
+    ids = _StringColumnWriter(tmp_path, "ids", count)
+    documents = _StringColumnWriter(tmp_path, "documents", count)
+    # Значения метаданных храним как JSON, чтобы сохранить типы и отсутствующие ключи (null)
+    metadata_columns = [_StringColumnWriter(tmp_path, f"meta_{i}", count) for i in range(len(columns))]
+
+    row = 0
+    for batch_ids, batch_documents, batch_metadatas, batch_embeddings in database.iter_embedded(batch_size):
+        batch_embeddings = np.asarray(batch_embeddings, dtype=np.float32)
+        if embeddings is None:
+            embeddings = np.lib.format.open_memmap(
+                os.path.join(tmp_path, "embeddings.npy"), mode="w+", dtype=dtype,
+                shape=(count, batch_embeddings.shape[1])
+            )
+        embeddings[row:row + len(batch_ids)] = batch_embeddings.astype(dtype)
+
+        for offset, (doc_id, document, metadata) in enumerate(zip(batch_ids, batch_documents, batch_metadatas)):
+            ids.write(row + offset, doc_id)
+            documents.write(row + offset, document or "")
+            metadata = metadata or {}
+            for column, writer in zip(columns, metadata_columns):
+                writer.write(row + offset, json.dumps(metadata.get(column), ensure_ascii=False))
+        row += len(batch_ids)
+
+    if row != count:
+        raise RuntimeError(f"Collection changed during export: expected {count} documents, read {row}")
+
+    dim = int(embeddings.shape[1]) if embeddings is not None else 0
+    if embeddings is not None:
+        embeddings.flush()
+        del embeddings
+    for writer in [ids, documents] + metadata_columns:
+        writer.close()
+
+    manifest = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "count": count,
+        "dim": dim,
+        "dtype": dtype,
+        "columns": columns,
+        "collection_version": database.get_collection_version(),
+        "created_at": time.time()
+    }
+    with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp_path, path)
+    logger.info(f"Exported {count} embeddings ({dim}d, {dtype}) to {path}")
+    return manifest
+
+class EmbeddingArtifact:
+    """Чтение выгруженного артефакта батчами без загрузки в память целиком"""
+
+    def __init__(self, path: str = EMBEDDINGS_ARTIFACT_PATH):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format_version") != ARTIFACT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported artifact format: {self.manifest.get('format_version')}")
+
+        self.count = self.manifest["count"]
+        self.columns = self.manifest["columns"]
+        self.embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r") if self.count else None
+        self.ids = _StringColumn(path, "ids")
+        self.documents = _StringColumn(path, "documents")
+        self.metadata = [_StringColumn(path, f"meta_{i}") for i in range(len(self.columns))]
+
+    @staticmethod
+    def exists(path: str = EMBEDDINGS_ARTIFACT_PATH) -> bool:
+        return os.path.exists(os.path.join(path, "manifest.json"))
+
+    def iter_batches(self, batch_size: int = BATCH_SIZE) -> Iterator[tuple]:
+        for start in range(0, self.count, batch_size):
+            stop = min(start + batch_size, self.count)
+            values = [[json.loads(value) for value in column.slice(start, stop)] for column in self.metadata]
+            metadatas = [
+                {key: row[i] for i, key in enumerate(self.columns) if row[i] is not None}
+                for row in zip(*values)
+            ] if values else [{} for _ in range(stop - start)]
+            # Chroma хранит float32: float16 из артефакта расширяем только для текущего батча
+            embeddings = np.asarray(self.embeddings[start:stop], dtype=np.float32)
+            yield self.ids.slice(start, stop), self.documents.slice(start, stop), metadatas, embeddings
+
+def load_artifact(database, path: str = EMBEDDINGS_ARTIFACT_PATH, batch_size: int = BATCH_SIZE) -> Dict[str, Any]:
+    """Заполняет коллекцию из артефакта без вычисления эмбеддингов.
+
+    Как и обычная загрузка, пропускает документы с тем же хэшем
+    содержимого, поэтому повторный запуск контейнера почти бесплатен.
+    """
+    start_time = time.time()
+    artifact = EmbeddingArtifact(path)
+    stats = {"papers": 0, "skipped": 0}
+
+    for ids, documents, metadatas, embeddings in artifact.iter_batches(batch_size):
+        for metadata, document in zip(metadatas, documents):
+            metadata.setdefault("content_hash", content_hash(document, metadata))
+
+        existing = database.get_content_hashes(ids)
+        changed = [i for i, doc_id in enumerate(ids) if existing.get(doc_id) != metadatas[i]["content_hash"]]
+        stats["skipped"] += len(ids) - len(changed)
+        if not changed:
+            continue
+
+        database.upsert_documents(
+            [documents[i] for i in changed],
+            [metadatas[i] for i in changed],
+            [ids[i] for i in changed],
+            embeddings=embeddings[changed]
+        )
+        stats["papers"] += len(changed)
+
+    stats["seconds"] = time.time() - start_time
+    logger.info(
+        f"Bulk loaded {stats['papers']} documents from {path} ({stats['skipped']} unchanged) "
+        f"in {stats['seconds']:.1f}s"
+    )
+    return stats
+
+def _metadata_keys(database, batch_size: int) -> List[str]:
+    keys = {}
+    for _, _, metadatas, _ in database.iter_embedded(batch_size, include_embeddings=False):
+        for metadata in metadatas:
+            for key in metadata or {}:
+                keys.setdefault(key, None)
+    return list(keys)
@@ -0,0 +1,427 @@
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import numpy as np
+from app.config import BM25_INDEX_PATH, BM25_K1, BM25_B, BM25_DELTA_MAX_DOCS, COLLECTION_VERSION_CHECK_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+STOP_WORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from",
+    "has", "have", "how", "in", "is", "it", "its", "of", "on", "or", "that", "the",
+    "their", "this", "to", "was", "we", "what", "when", "where", "which", "who", "why",
+    "with", "between", "about", "into", "our", "these", "those", "there", "than"
+})
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Файлы индекса: все массивы пишутся как .npy и открываются через mmap
+INDEX_FILES = ("terms", "offsets", "postings", "freqs", "doc_ids", "sorted_doc_ids", "doc_order", "doc_norms")
+
+def tokenize(text: str) -> List[str]:
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+def extract_title_abstract(document: str) -> str:
+    """Из текста документа (см. create_document_text) берёт только название и аннотацию"""
+    title = ""
+    abstract = ""
+    for line in document.split("\n"):
+        if line.startswith("Title:"):
+            title = line[len("Title:"):].strip()
+            break
+    marker = document.find("Abstract:")
+    if marker >= 0:
+        abstract = document[marker + len("Abstract:"):].strip()
+    if not title and not abstract:
+        return document
+    return f"{title}\n{abstract}"
+
+class BM25IndexBuilder:
+    """Собирает разреженный индекс (CSR по терминам) и пишет его на диск.
+
+    Постинги копятся компактными numpy-чанками (term_id, doc, tf), а не
+    питоновскими списками, чтобы сборка по всему корпусу влезала в память.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._vocab = {}
+        self._doc_ids = []
+        self._doc_lengths = []
+        self._chunks = []
+        self._pending_terms = []
+        self._pending_docs = []
+        self._pending_freqs = []
+
+    def add(self, doc_id: str, text: str):
+        tokens = tokenize(text)
+        doc_index = len(self._doc_ids)
+        self._doc_ids.append(doc_id)
+        self._doc_lengths.append(len(tokens))
+
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            term_id = self._vocab.setdefault(token, len(self._vocab))
+            self._pending_terms.append(term_id)
+            self._pending_docs.append(doc_index)
+            self._pending_freqs.append(min(count, 65535))
+
+        if len(self._pending_terms) >= 1_000_000:
+            self._flush()
+
+    def build(self, path: str = BM25_INDEX_PATH) -> "BM25Index":
+        self._flush()
+        if self._chunks:
+            term_ids = np.concatenate([chunk[0] for chunk in self._chunks])
+            docs = np.concatenate([chunk[1] for chunk in self._chunks])
+            freqs = np.concatenate([chunk[2] for chunk in self._chunks])
+        else:
+            term_ids = np.zeros(0, dtype=np.int32)
+            docs = np.zeros(0, dtype=np.int32)
+            freqs = np.zeros(0, dtype=np.uint16)
+
+        # Термины храним отсортированными, чтобы искать их бинпоиском прямо в mmap
+        vocab_terms = list(self._vocab.keys())
+        sorted_order = np.argsort(np.array(vocab_terms, dtype=object)) if vocab_terms else np.zeros(0, dtype=np.int64)
+        rank = np.empty(len(vocab_terms), dtype=np.int32)
+        rank[sorted_order] = np.arange(len(vocab_terms), dtype=np.int32)
+        terms = np.array([vocab_terms[i] for i in sorted_order], dtype=str) if vocab_terms else np.zeros(0, dtype="<U1")
+
+        sorted_term_ids = rank[term_ids] if len(term_ids) else term_ids
+        order = np.lexsort((docs, sorted_term_ids))
+        postings = docs[order].astype(np.int32)
+        freqs = freqs[order].astype(np.uint16)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sorted_term_ids, minlength=len(terms)), out=offsets[1:])
+
+        doc_lengths = np.asarray(self._doc_lengths, dtype=np.float32)
+        avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        # Знаменатель BM25 без tf считаем заранее: k1 * (1 - b + b * |d| / avgdl)
+        doc_norms = (self.k1 * (1 - self.b + self.b * doc_lengths / (avg_doc_length or 1.0))).astype(np.float32)
+
+        doc_ids = np.array(self._doc_ids, dtype=str) if self._doc_ids else np.zeros(0, dtype="<U1")
+        doc_order = np.argsort(doc_ids, kind="stable").astype(np.int32)
+        arrays = {
+            "terms": terms,
+            "offsets": offsets,
+            "postings": postings,
+            "freqs": freqs,
+            "doc_ids": doc_ids,
+            # Отсортированные id и перестановка к ним: документ находится по id бинпоиском
+            "sorted_doc_ids": doc_ids[doc_order],
+            "doc_order": doc_order,
+            "doc_norms": doc_norms
+        }
+        meta = {
+            "num_docs": len(self._doc_ids),
+            "num_terms": len(terms),
+            "num_postings": int(len(postings)),
+            "avg_doc_length": avg_doc_length,
+            "k1": self.k1,
+            "b": self.b,
+            "built_at": time.time()
+        }
+
+        # Пишем во временный каталог и подменяем целиком, чтобы читатели
+        # никогда не видели наполовину записанный индекс
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        old_path = f"{path}.old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+        logger.info(f"BM25 index built: {meta['num_docs']} docs, {meta['num_terms']} terms, {meta['num_postings']} postings")
+        return BM25Index.load(path)
+
+    def _flush(self):
+        if not self._pending_terms:
+            return
+        self._chunks.append((
+            np.asarray(self._pending_terms, dtype=np.int32),
+            np.asarray(self._pending_docs, dtype=np.int32),
+            np.asarray(self._pending_freqs, dtype=np.uint16)
+        ))
+        self._pending_terms = []
+        self._pending_docs = []
+        self._pending_freqs = []
+
+class BM25Index:
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict[str, Any]):
+        self.terms = arrays["terms"]
+        self.offsets = arrays["offsets"]
+        self.postings = arrays["postings"]
+        self.freqs = arrays["freqs"]
+        self.doc_ids = arrays["doc_ids"]
+        self.sorted_doc_ids = arrays["sorted_doc_ids"]
+        self.doc_order = arrays["doc_order"]
+        self.doc_norms = arrays["doc_norms"]
+        self.meta = meta
+        self.k1 = meta["k1"]
+        self.num_docs = meta["num_docs"]
+        self.avg_doc_length = meta["avg_doc_length"]
+
+    @classmethod
+    def load(cls, path: str = BM25_INDEX_PATH, mmap: bool = True) -> "BM25Index":
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            for name in INDEX_FILES
+        }
+        return cls(arrays, meta)
+
+    def term_postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        i = int(np.searchsorted(self.terms, term))
+        if i >= len(self.terms) or self.terms[i] != term:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.uint16)
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.postings[start:end], self.freqs[start:end]
+
+    def idf(self, df) -> np.ndarray:
+        df = np.asarray(df, dtype=np.float32)
+        return np.log(1.0 + (self.num_docs - df + 0.5) / (df + 0.5))
+    
+    def doc_positions(self, ids: List[str]) -> np.ndarray:
+        """Позиции документов в индексе по их id (-1, если документа нет)"""
+        if self.num_docs == 0 or not ids:
+            return np.full(len(ids), -1, dtype=np.int64)
+        wanted = np.array(ids, dtype=str)
+        slots = np.clip(np.searchsorted(self.sorted_doc_ids, wanted), 0, self.num_docs - 1)
+        positions = self.doc_order[slots].astype(np.int64)
+        positions[self.sorted_doc_ids[slots] != wanted] = -1
+        return positions
+    
+    def document_frequency(self, term: str) -> int:
+        return len(self.term_postings(term)[0])
+
+    def score_documents(self, query_terms: List[str], positions: np.ndarray,
+                        idf: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """BM25 для заданного набора документов: матрица tf [термины x кандидаты] целиком в numpy.
+
+        idf - веса терминов, общие для нескольких сегментов; по умолчанию - по этому индексу.
+        """
+        scores = np.zeros(len(positions), dtype=np.float32)
+        known = positions >= 0
+        if not known.any():
+            return scores
+        candidates = positions[known]
+        norms = self.doc_norms[candidates]
+        
+        partial = np.zeros(len(candidates), dtype=np.float32)
+        for term in set(query_terms):
+            docs, freqs = self.term_postings(term)
+            if len(docs) == 0:
+                continue
+            # Постинги термина отсортированы по документу - ищем кандидатов бинпоиском
+            slots = np.clip(np.searchsorted(docs, candidates), 0, len(docs) - 1)
+            tf = np.where(docs[slots] == candidates, freqs[slots], 0).astype(np.float32)
+            weight = idf[term] if idf is not None else self.idf(len(docs))
+            partial += weight * tf * (self.k1 + 1) / (tf + norms)
+        scores[known] = partial
+        return scores
+    
+    def search(self, query: str, top_k: int = 10) -> Tuple[List[str], List[float]]:
+        doc_indices, scores = self._score_terms(tokenize(query))
+        return _top_k(self.doc_ids[doc_indices], scores, top_k)
+
+    def _score_terms(self, tokens: Iterable[str],
+                     idf: Optional[Dict[str, float]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        # Складываем вклады только затронутых документов, без массива на весь корпус
+        all_docs = []
+        all_scores = []
+        for term in set(tokens):
+            docs, freqs = self.term_postings(term)
+            if len(docs) == 0:
+                continue
+            weight = idf[term] if idf is not None else self.idf(len(docs))
+            tf = freqs.astype(np.float32)
+            all_docs.append(docs)
+            all_scores.append(weight * tf * (self.k1 + 1) / (tf + self.doc_norms[docs]))
+
+        if not all_docs:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+
+        docs = np.concatenate(all_docs)
+        contributions = np.concatenate(all_scores)
+        unique_docs, inverse = np.unique(docs, return_inverse=True)
+        return unique_docs, np.bincount(inverse, weights=contributions).astype(np.float32)
+
+def _top_k(doc_ids, scores: np.ndarray, top_k: int) -> Tuple[List[str], List[float]]:
+    if len(scores) == 0:
+        return [], []
+    k = min(top_k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind="stable")]
+    return [str(doc_ids[i]) for i in best], [float(scores[i]) for i in best]
+
+def delta_path(path: str) -> str:
+    return f"{path}.delta"
+
+class SegmentedIndex:
+    """Основной индекс и дельта-сегмент с документами, загруженными после его сборки.
+
+    Документ из дельты перекрывает свою старую версию в основном индексе.
+    IDF считается по обоим сегментам сразу (df складываются; перекрытые
+    документы учитываются дважды - погрешность в пределах размера дельты),
+    длины документов нормируются по своему сегменту. Интерфейс - как у
+    BM25Index: позиции документов дельты идут после позиций основного.
+    """
+
+    def __init__(self, base: BM25Index, delta: BM25Index):
+        self.base = base
+        self.delta = delta
+        self.k1 = base.k1
+        self.meta = base.meta
+        self.avg_doc_length = base.avg_doc_length
+        replaced = base.doc_positions([str(doc_id) for doc_id in delta.doc_ids])
+        self._replaced = np.zeros(base.num_docs, dtype=bool)
+        self._replaced[replaced[replaced >= 0]] = True
+        self.num_docs = base.num_docs - int(self._replaced.sum()) + delta.num_docs
+
+    def idf(self, df) -> np.ndarray:
+        df = np.asarray(df, dtype=np.float32)
+        return np.log(1.0 + np.maximum(self.num_docs - df + 0.5, 0.0) / (df + 0.5))
+
+    def document_frequency(self, term: str) -> int:
+        return self.base.document_frequency(term) + self.delta.document_frequency(term)
+
+    def term_weights(self, terms: Iterable[str]) -> Dict[str, float]:
+        return {term: float(self.idf(self.document_frequency(term))) for term in set(terms)}
+
+    def doc_positions(self, ids: List[str]) -> np.ndarray:
+        positions = self.base.doc_positions(ids)
+        in_delta = self.delta.doc_positions(ids)
+        found = in_delta >= 0
+        positions[found] = in_delta[found] + self.base.num_docs
+        return positions
+
+    def score_documents(self, query_terms: List[str], positions: np.ndarray) -> np.ndarray:
+        idf = self.term_weights(query_terms)
+        scores = np.zeros(len(positions), dtype=np.float32)
+        in_base = (positions >= 0) & (positions < self.base.num_docs)
+        in_delta = positions >= self.base.num_docs
+        scores[in_base] = self.base.score_documents(query_terms, positions[in_base], idf)
+        scores[in_delta] = self.delta.score_documents(query_terms, positions[in_delta] - self.base.num_docs, idf)
+        return scores
+
+    def search(self, query: str, top_k: int = 10) -> Tuple[List[str], List[float]]:
+        tokens = tokenize(query)
+        idf = self.term_weights(tokens)
+        base_docs, base_scores = self.base._score_terms(tokens, idf)
+        keep = ~self._replaced[base_docs]
+        delta_docs, delta_scores = self.delta._score_terms(tokens, idf)
+        doc_ids = np.concatenate([self.base.doc_ids[base_docs[keep]], self.delta.doc_ids[delta_docs]])
+        return _top_k(doc_ids, np.concatenate([base_scores[keep], delta_scores]), top_k)
+
+class KeywordSearcher:
+    """Лениво открывает BM25 индекс и переоткрывает его, когда загрузчик собрал новый"""
+
+    def __init__(self, path: str = BM25_INDEX_PATH):
+        self.path = path
+        self._index = None
+        self._loaded_mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_index(self) -> Optional[BM25Index]:
+        now = time.monotonic()
+        if self._index is not None and now - self._checked_at < COLLECTION_VERSION_CHECK_INTERVAL:
+            return self._index
+
+        with self._lock:
+            self._checked_at = now
+            meta_path = os.path.join(self.path, "meta.json")
+            try:
+                mtime = os.stat(meta_path).st_mtime_ns
+            except FileNotFoundError:
+                if self._index is None:
+                    logger.warning(f"BM25 index not found at {self.path}")
+                self._index = None
+                self._loaded_mtime = None
+                return None
+            try:
+                delta_mtime = os.stat(os.path.join(delta_path(self.path), "meta.json")).st_mtime_ns
+            except FileNotFoundError:
+                delta_mtime = None
+
+            if (mtime, delta_mtime) != self._loaded_mtime:
+                try:
+                    index = BM25Index.load(self.path)
+                    if delta_mtime is not None:
+                        index = SegmentedIndex(index, BM25Index.load(delta_path(self.path)))
+                    self._index = index
+                    self._loaded_mtime = (mtime, delta_mtime)
+                    logger.info(f"BM25 index loaded: {self._index.num_docs} docs")
+                except Exception as e:
+                    logger.error(f"Failed to load BM25 index: {e}")
+                    self._index = None
+            return self._index
+
+    def search(self, query: str, top_k: int = 10) -> Tuple[List[str], List[float]]:
+        index = self.get_index()
+        if index is None:
+            return [], []
+        return index.search(query, top_k)
+
+def build_index_from_collection(database, path: str = BM25_INDEX_PATH, batch_size: int = 5000) -> BM25Index:
+    """Собирает BM25 индекс по всем документам коллекции (название + аннотация)"""
+    builder = BM25IndexBuilder()
+    for ids, documents in database.iter_documents(batch_size=batch_size):
+        for doc_id, document in zip(ids, documents):
+            builder.add(doc_id, extract_title_abstract(document or ""))
+    index = builder.build(path)
+    # Новый индекс уже содержит документы дельты: пока её не удалили, они лишь перекрывают сами себя
+    shutil.rmtree(delta_path(path), ignore_errors=True)
+    return index
+
+def update_index_from_collection(database, ids: Iterable[str], path: str = BM25_INDEX_PATH,
+                                 max_delta_docs: int = BM25_DELTA_MAX_DOCS, batch_size: int = 5000):
+    """Добавляет в индекс только загруженные документы: пересобирает дельта-сегмент.
+
+    Стоимость - по размеру дельты, а не коллекции. Если основного индекса
+    нет или дельта выросла больше max_delta_docs, индекс собирается целиком
+    (компакция), а дельта удаляется.
+    """
+    delta = delta_path(path)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return build_index_from_collection(database, path, batch_size)
+
+    # Дельта пересобирается вместе с документами прошлых дозагрузок
+    delta_ids = dict.fromkeys(ids)
+    if os.path.exists(os.path.join(delta, "meta.json")):
+        previous = [str(doc_id) for doc_id in BM25Index.load(delta).doc_ids]
+        delta_ids = dict.fromkeys(previous + list(delta_ids))
+    if len(delta_ids) > max_delta_docs:
+        logger.info(f"BM25 delta reached {len(delta_ids)} documents, compacting into the main index")
+        return build_index_from_collection(database, path, batch_size)
+
+    builder = BM25IndexBuilder()
+    delta_ids = list(delta_ids)
+    for start in range(0, len(delta_ids), batch_size):
+        found = database.get_documents(delta_ids[start:start + batch_size])
+        for doc_id, document in zip(found["ids"], found["documents"]):
+            builder.add(doc_id, extract_title_abstract(document or ""))
+    builder.build(delta)
+    return SegmentedIndex(BM25Index.load(path), BM25Index.load(delta))
+
+keyword_searcher = KeywordSearcher()
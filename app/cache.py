@@ -0,0 +1,141 @@
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from app.config import RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL
+from app.database import vector_db
+from app.memory import conversation_memory
+
+logger = logging.getLogger(__name__)
+
+def normalize_question(question: str) -> str:
+    """Приводит вопрос к каноническому виду: регистр, пробелы, финальная пунктуация"""
+    normalized = re.sub(r"\s+", " ", question.strip().lower())
+    return normalized.rstrip("?!. ")
+
+class ResponseCache:
+    """Кэш готовых ответов по точному совпадению вопроса.
+
+    Два уровня: LRU в памяти процесса и (опционально) общий Redis.
+    Ключ включает версию коллекции, поэтому после загрузки новых
+    документов старые ответы перестают находиться.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttl: int = RESPONSE_CACHE_TTL,
+                 enabled: bool = RESPONSE_CACHE_ENABLED, memory=conversation_memory, database=vector_db):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.memory = memory
+        self.database = database
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.redis_hits = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def redis_client(self):
+        # Используем соединение ConversationMemory, а не открываем своё
+        return getattr(self.memory, "redis_client", None)
+
+    def make_key(self, question: str, strategy: str, top_k: int) -> str:
+        version = self._current_version()
+        raw = f"{normalize_question(question)}|{strategy}|{top_k}|{version}"
+        return "response:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, question: str, strategy: str, top_k: int) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+
+        key = self.make_key(question, strategy, top_k)
+        now = time.monotonic()
+
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                expires, value = item
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.redis_client:
+            try:
+                cached = self.redis_client.get(key)
+                if cached:
+                    value = json.loads(cached)
+                    self._store_local(key, value, now)
+                    with self._lock:
+                        self.hits += 1
+                        self.redis_hits += 1
+                    return value
+            except Exception as e:
+                logger.warning(f"Response cache Redis get failed: {e}")
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, question: str, strategy: str, top_k: int, value: Dict[str, Any]):
+        if not self.enabled:
+            return
+
+        key = self.make_key(question, strategy, top_k)
+        self._store_local(key, value, time.monotonic())
+
+        if self.redis_client:
+            try:
+                self.redis_client.setex(key, self.ttl, json.dumps(value, ensure_ascii=False))
+            except Exception as e:
+                logger.warning(f"Response cache Redis set failed: {e}")
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "redis_hits": self.redis_hits,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+    def _store_local(self, key: str, value: Dict[str, Any], now: float):
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _current_version(self) -> str:
+        version = self.database.get_collection_version()
+        if version != self._version:
+            # Коллекция изменилась: локальные записи старой версии больше не нужны.
+            # Записи в Redis просто перестанут совпадать по ключу и истекут по TTL
+            if self._version is not None:
+                logger.info("Collection version changed, invalidating response cache")
+                self.invalidate()
+            self._version = version
+        return version
+
+response_cache = ResponseCache()
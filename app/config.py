@@ -1,42 +1,173 @@
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# Gemini API Configuration
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-# ChromaDB Settings
-CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "/app/chroma_db")
-COLLECTION_NAME = "arxiv_papers_2020"
-
-# LLM Model
-LLM_MODEL = "LLM_MODEL"
-
-# RAG Settings
-TOP_K_RESULTS = 3
-MAX_CONTEXT_LENGTH = 2000
-
-# Data Settings
-DATA_PATH = os.getenv("DATA_PATH", "/app/data/filtered_arxiv_2020.json")
-BATCH_SIZE = 100
-
-# Gemini Safety Settings
-GEMINI_SAFETY_SETTINGS = [
-    {
-        "category": "HARM_CATEGORY_HARASSMENT",
-        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-    },
-    {
-        "category": "HARM_CATEGORY_HATE_SPEECH", 
-        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-    },
-    {
-        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-    },
-    {
-        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-    }
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Gemini API Configuration
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# ChromaDB Settings
+CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "/app/chroma_db")
+COLLECTION_NAME = "arxiv_papers_2020"
+# Как часто API перечитывает версию коллекции, которую меняет загрузка данных
+COLLECTION_VERSION_CHECK_INTERVAL = float(os.getenv("COLLECTION_VERSION_CHECK_INTERVAL", "2.0"))
+
+# LLM Model
+LLM_MODEL = "LLM_MODEL"
+
+# RAG Settings
+TOP_K_RESULTS = 3
+# Бюджет контекста промпта в токенах (источники + история диалога)
+MAX_CONTEXT_LENGTH = int(os.getenv("MAX_CONTEXT_LENGTH", "2000"))
+# Доля бюджета под историю; неиспользованное достаётся источникам
+CONTEXT_HISTORY_SHARE = float(os.getenv("CONTEXT_HISTORY_SHARE", "0.25"))
+# Меньше этого источник или реплику не обрезаем, а выбрасываем
+CONTEXT_MIN_SECTION_TOKENS = int(os.getenv("CONTEXT_MIN_SECTION_TOKENS", "50"))
+CHARS_PER_TOKEN = 4
+# История диалога: в промпт идут последние реплики целиком, более старые - сжатой выжимкой
+CONVERSATION_RECENT_TURNS = int(os.getenv("CONVERSATION_RECENT_TURNS", "1"))
+CONVERSATION_SUMMARY_MAX_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_MAX_TOKENS", "300"))
+CONVERSATION_SUMMARY_SENTENCES = 2
+
+# Keyword Search (BM25) Settings
+# Индекс собирается скриптом загрузки данных и лежит рядом с ChromaDB
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", os.path.join(CHROMA_DB_PATH, "bm25_index"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Дозагруженные документы индексируются отдельным сегментом; больше стольких - пересобираем индекс целиком
+BM25_DELTA_MAX_DOCS = int(os.getenv("BM25_DELTA_MAX_DOCS", "20000"))
+
+# Hybrid Fusion Settings
+# "rrf" (reciprocal rank fusion) или "weighted" (alpha-взвешенные нормализованные скоры)
+HYBRID_FUSION_METHOD = os.getenv("HYBRID_FUSION_METHOD", "rrf")
+RRF_K = 60
+
+# Reranking Settings (hierarchical RAG)
+# Вес лексического (BM25) скора против семантического сходства
+RERANK_LEXICAL_WEIGHT = float(os.getenv("RERANK_LEXICAL_WEIGHT", "0.5"))
+# Кросс-энкодер опционален (нужен sentence-transformers), пусто = выключен
+RERANK_CROSS_ENCODER_MODEL = os.getenv("RERANK_CROSS_ENCODER_MODEL", "")
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_LATENCY_BUDGET_MS = float(os.getenv("RERANK_LATENCY_BUDGET_MS", "200"))
+
+# Concurrency Settings
+# Синхронный поиск (ChromaDB + ONNX эмбеддинги) выполняется в ограниченном пуле потоков
+RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", "4"))
+# Потоки ONNX Runtime (intra-op) и BLAS на процесс API; 0 - по умолчанию библиотеки (все ядра).
+# При нескольких воркерах - примерно ядра / воркеры, иначе они отнимают ядра друг у друга
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+BLAS_NUM_THREADS = int(os.getenv("BLAS_NUM_THREADS", "0"))
+
+# Warmup Settings
+# Прогрев воркера до готовности (/ready): эмбеддинг, поиск по индексу, чтение файлов индекса в page cache
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_PRETOUCH_INDEX = os.getenv("WARMUP_PRETOUCH_INDEX", "true").lower() == "true"
+WARMUP_PRETOUCH_MAX_MB = int(os.getenv("WARMUP_PRETOUCH_MAX_MB", "1024"))
+# Проверочный запрос к Gemini (count_tokens, без генерации) - соединение готово к первому вопросу
+WARMUP_LLM = os.getenv("WARMUP_LLM", "false").lower() == "true"
+
+# Пакетные запросы: максимум вопросов в одном запросе и параллельных вызовов LLM
+BATCH_QUERY_MAX_QUESTIONS = int(os.getenv("BATCH_QUERY_MAX_QUESTIONS", "100"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
+# Request Deadline Settings
+# Срок ответа задаёт клиент (заголовок X-Request-Timeout или поле timeout, секунды); 0 - без срока
+REQUEST_TIMEOUT_DEFAULT = float(os.getenv("REQUEST_TIMEOUT_DEFAULT", "0"))
+REQUEST_TIMEOUT_MAX = float(os.getenv("REQUEST_TIMEOUT_MAX", "300"))
+# Бюджет, который бережём под генерацию: если остаток меньше, rerank и keyword-поиск пропускаются
+DEADLINE_LLM_RESERVE = float(os.getenv("DEADLINE_LLM_RESERVE", "5"))
+
+# LLM Governor Settings
+# Одновременные вызовы Gemini на воркер: предел сжимается вдвое на 429/503 и растёт на 1 за "окно" успешных
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+LLM_CONCURRENCY_DECREASE = float(os.getenv("LLM_CONCURRENCY_DECREASE", "0.5"))
+# Сколько запрос ждёт свободного слота, прежде чем получить ошибку
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+# Повторы: экспоненциальная пауза с full jitter; Retry-After дольше LLM_BACKOFF_MAX - не ждём, а отдаём ошибку
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+# Circuit breaker: после стольких ошибок подряд вызовы сразу отклоняются на LLM_BREAKER_RESET_SECONDS
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Session Storage Settings
+# "redis" - сессии общие для всех воркеров API, "memory" - в памяти процесса
+REDIS_URL = os.getenv("REDIS_URL")
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "redis" if REDIS_URL else "memory")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+# Сессия без новых реплик удаляется через столько секунд
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL", "86400"))
+CONVERSATION_MAX_TURNS = 10
+# In-process хранилище сессий: лимиты числа сессий и объёма, период фоновой очистки
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "10000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+# Rate Limiting Settings
+# Token bucket "N/период": N - ёмкость (всплеск), пополнение N за период. Redis делит лимит между воркерами
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "redis" if REDIS_URL else "memory")
+RATE_LIMIT_LLM = os.getenv("RATE_LIMIT_LLM", "10/minute")
+RATE_LIMIT_CHEAP = os.getenv("RATE_LIMIT_CHEAP", "120/minute")
+# Пакетный запрос списывает из LLM-бакета столько токенов
+RATE_LIMIT_BATCH_COST = int(os.getenv("RATE_LIMIT_BATCH_COST", "2"))
+# Ключ клиента: "ip", "api_key" (заголовок X-API-Key) или "session" (session_id); без ключа - IP
+RATE_LIMIT_KEY = os.getenv("RATE_LIMIT_KEY", "ip")
+# Сколько доверенных прокси (балансировщиков) дописывают X-Forwarded-For; 0 - адрес соединения.
+# Ставить больше 0 только за прокси: иначе клиент подделает свой адрес заголовком (Railway - 1, см. railway.toml)
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "0"))
+
+# Embedding Cache Settings
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "10000"))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+
+# Response Cache Settings
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+# Semantic Cache Settings
+# Порог косинусного сходства, начиная с которого вопрос считается перефразировкой
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "512"))
+
+# Data Settings
+DATA_PATH = os.getenv("DATA_PATH", "/app/data/filtered_arxiv_2020.json")
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "100"))
+# Ограничение числа статей при загрузке (0 = весь файл)
+MAX_PAPERS = int(os.getenv("MAX_PAPERS", "0"))
+# Конвейер загрузки: процессы для эмбеддингов, потоки ONNX на процесс, глубина очередей (в батчах)
+# По умолчанию - доступные процессу ядра (affinity учитывает cpuset контейнера), не больше 4:
+# каждый процесс держит свою копию модели, а контейнеру отводится около 1 ГБ
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", str(min(
+    4, len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+))))
+EMBED_THREADS_PER_WORKER = int(os.getenv("EMBED_THREADS_PER_WORKER", "1"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+# Манифест загрузки: позиция в источнике для продолжения прерванной загрузки
+INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", os.path.join(CHROMA_DB_PATH, "ingest_manifest.json"))
+# Готовые эмбеддинги (собираются один раз в CI) для загрузки без пересчёта
+EMBEDDINGS_ARTIFACT_PATH = os.getenv("EMBEDDINGS_ARTIFACT_PATH", "/app/data/embeddings")
+EMBEDDINGS_ARTIFACT_DTYPE = os.getenv("EMBEDDINGS_ARTIFACT_DTYPE", "float16")
+
+# Gemini Safety Settings
+GEMINI_SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH", 
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    }
 ]
\ No newline at end of file
@@ -0,0 +1,160 @@
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+import math
+from app.config import MAX_CONTEXT_LENGTH, CONTEXT_HISTORY_SHARE, CONTEXT_MIN_SECTION_TOKENS, CHARS_PER_TOKEN
+
+TRUNCATION_MARK = " [...]"
+HISTORY_HEADER = "Previous conversation:"
+SUMMARY_HEADER = "Summary of earlier conversation:"
+
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов без вызова API: у Gemini в среднем ~4 символа на токен"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Обрезает текст до бюджета по границе слова"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max(0, max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARK))
+    cut = text[:limit]
+    space = cut.rfind(" ")
+    if space > limit // 2:
+        cut = cut[:space]
+    return cut.rstrip() + TRUNCATION_MARK
+
+@dataclass
+class BuiltContext:
+    """Собранный контекст промпта и что в него вошло"""
+    text: str
+    documents: List[str] = field(default_factory=list)
+    metadatas: List[Dict[str, Any]] = field(default_factory=list)
+    source_tokens: int = 0
+    history_tokens: int = 0
+    history_turns: int = 0
+    summary_tokens: int = 0
+    truncated: int = 0
+    dropped: int = 0
+
+class ContextBuilder:
+    """Собирает контекст промпта в пределах бюджета токенов.
+
+    История диалога и источники получают отдельные бюджеты; неизрасходованная
+    часть бюджета истории переходит источникам. Первыми обрезаются и
+    выбрасываются источники с наименьшим скором и самые старые реплики.
+    """
+
+    def __init__(self, max_tokens: int = MAX_CONTEXT_LENGTH, history_share: float = CONTEXT_HISTORY_SHARE,
+                 min_section_tokens: int = CONTEXT_MIN_SECTION_TOKENS):
+        self.max_tokens = max_tokens
+        self.history_share = history_share
+        self.min_section_tokens = min_section_tokens
+
+    def build(self, documents: List[str], metadatas: List[Dict[str, Any]], scores: Optional[List[float]] = None,
+              history: Optional[List[Dict[str, Any]]] = None, summary: str = "") -> BuiltContext:
+        history_text, history_tokens, history_turns, summary_tokens = self._build_history(
+            history or [], summary, int(self.max_tokens * self.history_share)
+        )
+        source_budget = self.max_tokens - history_tokens
+        kept, source_tokens, truncated = self._select_sources(documents, metadatas, scores, source_budget)
+
+        kept_documents = [document for _, document in kept]
+        kept_metadatas = [metadatas[i] if i < len(metadatas) else {} for i, _ in kept]
+        text = format_context(kept_documents, kept_metadatas)
+        if history_text:
+            text = history_text + "\n\nCurrent context:\n" + text
+
+        return BuiltContext(
+            text=text,
+            documents=kept_documents,
+            metadatas=kept_metadatas,
+            source_tokens=source_tokens,
+            history_tokens=history_tokens,
+            history_turns=history_turns,
+            summary_tokens=summary_tokens,
+            truncated=truncated,
+            dropped=len(documents) - len(kept)
+        )
+
+    def _select_sources(self, documents, metadatas, scores, budget):
+        # Бюджет распределяем по убыванию скора, а в промпт источники идут в исходном порядке
+        if scores is None or len(scores) != len(documents):
+            scores = [-i for i in range(len(documents))]
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+
+        selected = {}
+        used = 0
+        truncated = 0
+        for i in order:
+            header = source_header(len(selected) + 1, metadatas[i] if i < len(metadatas) else {})
+            cost = estimate_tokens(header) + estimate_tokens(documents[i]) + 1
+            remaining = budget - used
+            if cost <= remaining:
+                selected[i] = documents[i]
+                used += cost
+                continue
+            # Частично влезает только если остаток ещё полезен; остальные источники хуже - выходим
+            available = remaining - estimate_tokens(header) - 1
+            if available >= self.min_section_tokens:
+                document = truncate_to_tokens(documents[i], available)
+                selected[i] = document
+                used += estimate_tokens(header) + estimate_tokens(document) + 1
+                truncated += 1
+            break
+
+        return [(i, selected[i]) for i in sorted(selected)], used, truncated
+
+    def _build_history(self, history, summary, budget):
+        # history - от новых к старым (как отдаёт ConversationMemory); в промпт - хронологически.
+        # Последние реплики важнее сводки: сводка получает то, что от них осталось
+        turns = []
+        used = estimate_tokens(HISTORY_HEADER) + 1
+        for conv in history:
+            turn = f"Q: {conv['question']}\nA: {conv['answer']}"
+            cost = estimate_tokens(turn) + 1
+            if used + cost <= budget:
+                turns.append(turn)
+                used += cost
+                continue
+            question_part = f"Q: {conv['question']}\nA: "
+            available = budget - used - estimate_tokens(question_part) - 1
+            if available >= self.min_section_tokens:
+                turn = question_part + truncate_to_tokens(conv['answer'], available)
+                turns.append(turn)
+                used += estimate_tokens(turn) + 1
+            break
+
+        summary_tokens = 0
+        if summary:
+            header_cost = estimate_tokens(SUMMARY_HEADER) + 1
+            available = budget - used - header_cost
+            if estimate_tokens(summary) > available and available >= self.min_section_tokens:
+                summary = truncate_to_tokens(summary, available)
+            if estimate_tokens(summary) <= available:
+                summary_tokens = estimate_tokens(summary) + header_cost
+            else:
+                summary = ""
+
+        if not turns and not summary:
+            return "", 0, 0, 0
+        text = ""
+        if summary:
+            text += f"\n\n{SUMMARY_HEADER}\n{summary}"
+        if turns:
+            text += f"\n\n{HISTORY_HEADER}\n" + "\n".join(reversed(turns))
+        else:
+            used = 0
+        return text, used + summary_tokens, len(turns), summary_tokens
+
+def source_header(number: int, metadata: Dict[str, Any]) -> str:
+    header = f"[Source {number}]"
+    if metadata and 'title' in metadata:
+        header += f" {metadata['title']}"
+    return header
+
+def format_context(documents, metadatas):
+    formatted = []
+    for i, (doc, meta) in enumerate(zip(documents, metadatas)):
+        formatted.append(f"{source_header(i + 1, meta)}\n{doc}")
+    return "\n\n".join(formatted)
+
+context_builder = ContextBuilder()
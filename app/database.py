@@ -1,54 +1,263 @@
-import chromadb
-from chromadb.config import Settings
-import logging
-from app.config import CHROMA_DB_PATH, COLLECTION_NAME
-
-logger = logging.getLogger(__name__)
-
-class VectorDatabase:
-    def __init__(self):
-        # ChromaDB САМ генерирует эмбеддинги!
-        self.client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-        self.collection = self.client.get_or_create_collection(
-            name=COLLECTION_NAME,
-            metadata={"hnsw:space": "cosine"}
-        )
-        logger.info("Vector database initialized (using ChromaDB embeddings)")
-    
-    def add_documents(self, documents, metadatas=None, ids=None):
-        try:
-            if ids is None:
-                ids = [f"doc_{i}" for i in range(len(documents))]
-            
-            # ChromaDB САМ создаст эмбеддинги!
-            self.collection.add(
-                documents=documents,
-                metadatas=metadatas or [{}] * len(documents),
-                ids=ids
-            )
-            logger.info(f"Added {len(documents)} documents to database")
-            
-        except Exception as e:
-            logger.error(f"Error adding documents: {str(e)}")
-            raise
-    
-    def search(self, query, top_k=3, filter_metadata=None):
-        try:
-            search_params = {
-                "query_texts": [query],  # Chroma сам сделает эмбеддинг!
-                "n_results": top_k
-            }
-            
-            if filter_metadata:
-                search_params["where"] = filter_metadata
-            
-            results = self.collection.query(**search_params)
-            
-            logger.info(f"Search found {len(results['documents'][0])} results")
-            return results
-            
-        except Exception as e:
-            logger.error(f"Search error: {str(e)}")
-            return {"documents": [], "metadatas": []}
-
+import numpy as np
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from app.config import (
+    CHROMA_DB_PATH, COLLECTION_NAME, COLLECTION_VERSION_CHECK_INTERVAL, EMBEDDING_CACHE_TTL
+)
+from app.memory import conversation_memory
+from app.timing import stage
+
+logger = logging.getLogger(__name__)
+
+class VectorDatabase:
+    # Открываются при первом обращении, то есть в процессе воркера, а не при импорте
+    LAZY_ATTRIBUTES = ("client", "embedding_function", "collection")
+    
+    def __init__(self):
+        self._connect_lock = threading.Lock()
+        
+        # Версия коллекции меняется при каждой загрузке документов; по ней
+        # кэши ответов понимают, что сохранённые ответы устарели.
+        # Хранится в файле рядом с БД, чтобы её видели все процессы API
+        self._version_path = os.path.join(CHROMA_DB_PATH, f"{COLLECTION_NAME}.version")
+        self._collection_version = None
+        self._version_checked_at = 0.0
+        
+    def __getattr__(self, name):
+        # Вызывается, только если атрибута ещё нет
+        if name not in VectorDatabase.LAZY_ATTRIBUTES:
+            raise AttributeError(name)
+        self.connect()
+        return self.__dict__[name]
+    
+    @property
+    def connected(self) -> bool:
+        return "collection" in self.__dict__
+    
+    def connect(self):
+        with self._connect_lock:
+            if self.connected:
+                return
+            import chromadb
+            from chromadb.utils import embedding_functions
+            
+            # ChromaDB САМ генерирует эмбеддинги!
+            client = self.__dict__.get("client") or chromadb.PersistentClient(path=CHROMA_DB_PATH)
+            # Та же функция эмбеддингов, что Chroma использует по умолчанию;
+            # держим ссылку, чтобы эмбеддить вопросы для семантического кэша
+            embedding_function = self.__dict__.get("embedding_function") or embedding_functions.DefaultEmbeddingFunction()
+            self.client = client
+            self.embedding_function = embedding_function
+            self.collection = client.get_or_create_collection(
+                name=COLLECTION_NAME,
+                metadata={"hnsw:space": "cosine"},
+                embedding_function=embedding_function
+            )
+            logger.info(f"Vector database initialized in process {os.getpid()} (using ChromaDB embeddings)")
+    
+    def close(self):
+        """Отпускает клиент Chroma; следующее обращение откроет его заново"""
+        with self._connect_lock:
+            for name in VectorDatabase.LAZY_ATTRIBUTES:
+                self.__dict__.pop(name, None)
+    
+    def add_documents(self, documents, metadatas=None, ids=None, embeddings=None):
+        try:
+            if ids is None:
+                ids = [f"doc_{i}" for i in range(len(documents))]
+            
+            # Без готовых эмбеддингов ChromaDB создаст их сама
+            params = {
+                "documents": documents,
+                "metadatas": metadatas or [{}] * len(documents),
+                "ids": ids
+            }
+            if embeddings is not None:
+                params["embeddings"] = embeddings
+            self.collection.add(**params)
+            logger.info(f"Added {len(documents)} documents to database")
+            self.bump_collection_version()
+            
+        except Exception as e:
+            logger.error(f"Error adding documents: {str(e)}")
+            raise
+    
+    def upsert_documents(self, documents, metadatas, ids, embeddings=None):
+        """Добавляет новые и перезаписывает изменившиеся документы (повторная загрузка безопасна)"""
+        try:
+            params = {"documents": documents, "metadatas": metadatas, "ids": ids}
+            if embeddings is not None:
+                params["embeddings"] = embeddings
+            self.collection.upsert(**params)
+            logger.info(f"Upserted {len(documents)} documents to database")
+            self.bump_collection_version()
+            
+        except Exception as e:
+            logger.error(f"Error upserting documents: {str(e)}")
+            raise
+    
+    def get_content_hashes(self, ids):
+        """Хэши содержимого уже загруженных документов: {id: hash}"""
+        if not ids:
+            return {}
+        results = self.collection.get(ids=list(ids), include=["metadatas"])
+        return {
+            doc_id: (metadata or {}).get("content_hash")
+            for doc_id, metadata in zip(results["ids"], results["metadatas"])
+        }
+    
+    def embed(self, texts) -> np.ndarray:
+        embeddings = self.embedding_function(list(texts))
+        return np.asarray(embeddings, dtype=np.float32)
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        # Эмбеддинг вопроса считаем сами и кэшируем, чтобы повторные запросы
+        # (и семантический кэш, и несколько поисков одной стратегии) не гоняли ONNX заново
+        return self.embed_queries([query])[0]
+    
+    def embed_queries(self, queries) -> list:
+        # Некэшированные вопросы эмбеддятся одним вызовом модели
+        with stage("embedding"):
+            keys = [hashlib.sha1(f"{COLLECTION_NAME}|{query}".encode("utf-8")).hexdigest() for query in queries]
+            embeddings = [conversation_memory.get_cached_embedding(key) for key in keys]
+            missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            if missing:
+                computed = self.embed([queries[i] for i in missing])
+                for i, embedding in zip(missing, computed):
+                    conversation_memory.cache_embedding(keys[i], embedding, ttl=EMBEDDING_CACHE_TTL)
+                    embeddings[i] = embedding
+            return embeddings
+    
+    def search(self, query, top_k=3, filter_metadata=None, query_embedding=None):
+        try:
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
+            
+            search_params = {
+                "query_embeddings": [query_embedding],
+                "n_results": top_k,
+                "include": ["documents", "metadatas", "distances"]
+            }
+            
+            if filter_metadata:
+                search_params["where"] = filter_metadata
+            
+            with stage("vector_search"):
+                results = self.collection.query(**search_params)
+            # Косинусная дистанция -> сходство, чтобы скоры шли "больше = лучше"
+            results["scores"] = [[1.0 - distance for distance in distances] for distances in results.get("distances") or []]
+            
+            logger.info(f"Search found {len(results['documents'][0])} results")
+            return results
+            
+        except Exception as e:
+            # Сбой поиска - не "ничего не найдено": пусть вызывающий сообщит об ошибке
+            logger.error(f"Search error: {str(e)}")
+            raise
+    
+    def search_batch(self, queries, top_k=3, filter_metadata=None):
+        """Поиск сразу по нескольким вопросам одним запросом к коллекции.
+        
+        Возвращает список результатов в формате search (по одному на вопрос).
+        """
+        if not queries:
+            return []
+        try:
+            search_params = {
+                "query_embeddings": self.embed_queries(list(queries)),
+                "n_results": top_k,
+                "include": ["documents", "metadatas", "distances"]
+            }
+            
+            if filter_metadata:
+                search_params["where"] = filter_metadata
+            
+            with stage("vector_search"):
+                results = self.collection.query(**search_params)
+            
+            per_query = []
+            for i in range(len(queries)):
+                distances = results["distances"][i]
+                per_query.append({
+                    "ids": [results["ids"][i]],
+                    "documents": [results["documents"][i]],
+                    "metadatas": [results["metadatas"][i]],
+                    "distances": [distances],
+                    "scores": [[1.0 - distance for distance in distances]]
+                })
+            logger.info(f"Batch search for {len(queries)} queries")
+            return per_query
+            
+        except Exception as e:
+            logger.error(f"Batch search error: {str(e)}")
+            raise
+    
+    def get_documents(self, ids):
+        # Chroma не гарантирует порядок, возвращаем в порядке запрошенных ids
+        if not ids:
+            return {"ids": [], "documents": [], "metadatas": []}
+        results = self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+        by_id = {
+            doc_id: (document, metadata)
+            for doc_id, document, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+        }
+        found = [doc_id for doc_id in ids if doc_id in by_id]
+        return {
+            "ids": found,
+            "documents": [by_id[doc_id][0] for doc_id in found],
+            "metadatas": [by_id[doc_id][1] for doc_id in found]
+        }
+    
+    def iter_documents(self, batch_size=5000):
+        offset = 0
+        while True:
+            results = self.collection.get(limit=batch_size, offset=offset, include=["documents"])
+            if not results["ids"]:
+                break
+            yield results["ids"], results["documents"]
+            offset += len(results["ids"])
+    
+    def iter_embedded(self, batch_size=5000, include_embeddings=True):
+        """Отдаёт коллекцию батчами (ids, documents, metadatas, embeddings) для выгрузки"""
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        offset = 0
+        while True:
+            results = self.collection.get(limit=batch_size, offset=offset, include=include)
+            if not results["ids"]:
+                break
+            embeddings = results["embeddings"] if include_embeddings else None
+            yield results["ids"], results["documents"], results["metadatas"], embeddings
+            offset += len(results["ids"])
+    
+    def get_collection_version(self) -> str:
+        now = time.monotonic()
+        if self._collection_version is None or now - self._version_checked_at >= COLLECTION_VERSION_CHECK_INTERVAL:
+            try:
+                with open(self._version_path, "r", encoding="utf-8") as f:
+                    self._collection_version = f.read().strip() or "0"
+            except FileNotFoundError:
+                self._collection_version = "0"
+            except OSError as e:
+                logger.warning(f"Failed to read collection version: {e}")
+                self._collection_version = self._collection_version or "0"
+            self._version_checked_at = now
+        return self._collection_version
+    
+    def bump_collection_version(self) -> str:
+        version = uuid.uuid4().hex
+        tmp_path = f"{self._version_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(version)
+            os.replace(tmp_path, self._version_path)
+        except OSError as e:
+            logger.warning(f"Failed to store collection version: {e}")
+        self._collection_version = version
+        self._version_checked_at = time.monotonic()
+        return version
+
 vector_db = VectorDatabase()
\ No newline at end of file
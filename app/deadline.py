@@ -0,0 +1,89 @@
+from typing import Optional
+import asyncio
+import contextvars
+import time
+
+class DeadlineExceeded(Exception):
+    """Срок ответа на запрос истёк: клиент ответа уже не ждёт"""
+
+class Deadline:
+    """Срок ответа на запрос по monotonic-часам; seconds=None - без срока.
+
+    Этапы запроса проверяют остаток бюджета: опциональные шаги пропускают,
+    если остатка мало, а ожидание обрывают, когда срок прошёл.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    @property
+    def bounded(self) -> bool:
+        return self.expires_at is not None
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return float("inf")
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def timeout(self) -> Optional[float]:
+        """Остаток в формате таймаутов asyncio и SDK (None - без ограничения)"""
+        return self.remaining() if self.bounded else None
+
+    def allows(self, seconds: float) -> bool:
+        """Успеем ли потратить ещё seconds до срока"""
+        return self.remaining() >= seconds
+
+    def check(self, what: str = "request"):
+        if self.expired:
+            raise DeadlineExceeded(f"Deadline of {self.seconds:g}s exceeded before {what}")
+
+    def copy(self) -> "Deadline":
+        deadline = Deadline()
+        deadline.seconds, deadline.expires_at = self.seconds, self.expires_at
+        return deadline
+
+    def extend_to(self, other: "Deadline"):
+        """Сдвигает срок до более позднего из двух: общее вычисление ждут несколько запросов"""
+        if self.expires_at is None:
+            return
+        if other.expires_at is None or other.expires_at > self.expires_at:
+            self.seconds, self.expires_at = other.seconds, other.expires_at
+
+    async def run(self, awaitable, what: str = "request"):
+        """Ждёт awaitable не дольше срока; по истечении отменяет его"""
+        if not self.bounded:
+            return await awaitable
+        task = asyncio.ensure_future(awaitable)
+        try:
+            # Срок могут продлить, пока ждём, поэтому по таймауту проверяем его заново
+            while not task.done() and not self.expired:
+                await asyncio.wait({task}, timeout=self.remaining())
+            if not task.done():
+                task.cancel()
+                await asyncio.wait({task})
+                raise DeadlineExceeded(f"Deadline of {self.seconds:g}s exceeded during {what}")
+            return task.result()
+        finally:
+            if not task.done():
+                task.cancel()
+
+NO_DEADLINE = Deadline()
+
+_current_deadline = contextvars.ContextVar("request_deadline", default=NO_DEADLINE)
+
+def start_deadline(seconds: Optional[float]) -> Deadline:
+    """Заводит срок для текущего запроса (контекст наследуют задачи и run_blocking)"""
+    deadline = Deadline(seconds)
+    _current_deadline.set(deadline)
+    return deadline
+
+def set_deadline(deadline: Deadline):
+    _current_deadline.set(deadline)
+
+def current_deadline() -> Deadline:
+    return _current_deadline.get()
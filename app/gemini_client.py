@@ -1,56 +1,210 @@
-import google.generativeai as genai
-import logging
-import time
-from app.config import GEMINI_API_KEY, LLM_MODEL, GEMINI_SAFETY_SETTINGS
-
-logger = logging.getLogger(__name__)
-
-class GeminiClient:
-    def __init__(self):
-        if not GEMINI_API_KEY:
-            raise ValueError("GEMINI_API_KEY not found in environment variables")
-        
-        genai.configure(api_key=GEMINI_API_KEY)
-        self.model = genai.GenerativeModel(LLM_MODEL)
-        
-        self.safety_settings = GEMINI_SAFETY_SETTINGS
-        
-        logger.info("Gemini client initialized successfully")
-    
-    def generate_response(self, prompt: str, temperature: float = 0.1) -> str:
-        max_retries = 3
-        retry_delay = 2
-        
-        for attempt in range(max_retries):
-            try:
-                response = self.model.generate_content(
-                    prompt,
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=temperature,
-                        top_p=0.8,
-                        top_k=40,
-                        max_output_tokens=2048,
-                    ),
-                    safety_settings=self.safety_settings
-                )
-                
-                if response.prompt_feedback.block_reason:
-                    block_reason = response.prompt_feedback.block_reason
-                    logger.warning(f"Content blocked: {block_reason}")
-                    return f"I cannot answer this question due to content safety restrictions. Please try rephrasing your question."
-                
-                if not response.parts:
-                    logger.warning("Empty response from Gemini")
-                    return "I couldn't generate a response for this question. Please try again."
-                
-                return response.text
-                
-            except Exception as e:
-                logger.warning(f"Gemini API attempt {attempt + 1} failed: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay * (attempt + 1))
-                else:
-                    logger.error(f"All Gemini API attempts failed: {str(e)}")
-                    return "Sorry, I'm experiencing technical difficulties. Please try again later."
-
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import AsyncIterator, Optional
+from app.config import GEMINI_API_KEY, LLM_MODEL, GEMINI_SAFETY_SETTINGS
+from app.llm_governor import llm_governor, LLMUnavailableError
+from app.deadline import Deadline, DeadlineExceeded, current_deadline
+
+logger = logging.getLogger(__name__)
+
+BLOCKED_RESPONSE = "I cannot answer this question due to content safety restrictions. Please try rephrasing your question."
+EMPTY_RESPONSE = "I couldn't generate a response for this question. Please try again."
+ERROR_RESPONSE = "Sorry, I'm experiencing technical difficulties. Please try again later."
+
+def is_fallback_response(answer: str) -> bool:
+    """Ответ-заглушка вместо реального ответа модели (не стоит кэшировать)"""
+    return answer in (BLOCKED_RESPONSE, EMPTY_RESPONSE, ERROR_RESPONSE)
+
+def _genai():
+    # SDK тяжёлый (~1 с на импорт) и держит gRPC-каналы: подключаем только в процессе воркера
+    import google.generativeai as genai
+    return genai
+
+class GeminiClient:
+    def __init__(self, api_key: str = GEMINI_API_KEY):
+        self.api_key = api_key
+        self.safety_settings = GEMINI_SAFETY_SETTINGS
+        self._model = None
+        self._lock = threading.Lock()
+    
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    if not self.api_key:
+                        raise ValueError("GEMINI_API_KEY not found in environment variables")
+                    genai = _genai()
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(LLM_MODEL)
+                    logger.info(f"Gemini client initialized successfully in process {os.getpid()}")
+        return self._model
+    
+    @model.setter
+    def model(self, value):
+        self._model = value
+    
+    @property
+    def initialized(self) -> bool:
+        return self._model is not None
+    
+    def close(self):
+        self._model = None
+    
+    def _generation_config(self, temperature: float):
+        return _genai().types.GenerationConfig(
+            temperature=temperature,
+            top_p=0.8,
+            top_k=40,
+            max_output_tokens=2048,
+        )
+    
+    def _extract_text(self, response) -> str:
+        if response.prompt_feedback.block_reason:
+            block_reason = response.prompt_feedback.block_reason
+            logger.warning(f"Content blocked: {block_reason}")
+            return BLOCKED_RESPONSE
+        
+        if not response.parts:
+            logger.warning("Empty response from Gemini")
+            return EMPTY_RESPONSE
+        
+        return response.text
+    
+    def generate_response(self, prompt: str, temperature: float = 0.1, deadline: Optional[Deadline] = None) -> str:
+        deadline = deadline or current_deadline()
+        # Отсутствие ключа - ошибка конфигурации, повторять бессмысленно
+        model = self.model
+        
+        for attempt in range(llm_governor.max_retries):
+            deadline.check("llm")
+            try:
+                with llm_governor.sync_slot():
+                    response = model.generate_content(
+                        prompt,
+                        generation_config=self._generation_config(temperature),
+                        safety_settings=self.safety_settings,
+                        # Синхронный вызов не отменить - ограничиваем его таймаутом SDK
+                        **self._request_options(deadline)
+                    )
+                return self._extract_text(response)
+                
+            except Exception as e:
+                deadline.check("llm")
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    return ERROR_RESPONSE
+                time.sleep(delay)
+        return ERROR_RESPONSE
+    
+    async def generate_response_async(self, prompt: str, temperature: float = 0.1,
+                                      deadline: Optional[Deadline] = None) -> str:
+        # Неблокирующий вариант для async-обработчиков: ожидание слота, ответа
+        # и паузы между попытками не занимают event loop. По сроку запроса вызов отменяется
+        deadline = deadline or current_deadline()
+        model = self.model
+        
+        for attempt in range(llm_governor.max_retries):
+            try:
+                # Срок ограничивает и очередь к слоту, и сам вызов
+                response = await deadline.run(self._governed_call(model, prompt, temperature), "llm")
+                return self._extract_text(response)
+                
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                deadline.check("llm")
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    return ERROR_RESPONSE
+                await asyncio.sleep(delay)
+        return ERROR_RESPONSE
+    
+    async def stream_response(self, prompt: str, temperature: float = 0.1,
+                              deadline: Optional[Deadline] = None) -> AsyncIterator[str]:
+        # Отдаём текст по мере генерации. Повторяем попытку только пока
+        # клиент ещё ничего не получил, иначе ответ склеится из двух генераций.
+        # Слот занят до конца потока: генерация идёт, пока мы читаем чанки.
+        # Срок ограничивает ожидание первого чанка: дальше клиент видит, что ответ идёт
+        deadline = deadline or current_deadline()
+        model = self.model
+        
+        for attempt in range(llm_governor.max_retries):
+            emitted = False
+            try:
+                async with llm_governor.slot(timeout=deadline.timeout()):
+                    response = await deadline.run(model.generate_content_async(
+                        prompt,
+                        generation_config=self._generation_config(temperature),
+                        safety_settings=self.safety_settings,
+                        stream=True
+                    ), "llm")
+                    
+                    chunks = response.__aiter__()
+                    while True:
+                        try:
+                            if emitted:
+                                chunk = await chunks.__anext__()
+                            else:
+                                chunk = await deadline.run(chunks.__anext__(), "llm")
+                        except StopAsyncIteration:
+                            break
+                        if chunk.prompt_feedback and chunk.prompt_feedback.block_reason:
+                            logger.warning(f"Content blocked: {chunk.prompt_feedback.block_reason}")
+                            yield BLOCKED_RESPONSE
+                            return
+                        if not chunk.parts:
+                            continue
+                        emitted = True
+                        yield chunk.text
+                
+                if not emitted:
+                    logger.warning("Empty response from Gemini")
+                    yield EMPTY_RESPONSE
+                return
+                
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if emitted:
+                    logger.warning(f"Gemini API stream broke after partial output: {str(e)}")
+                    raise
+                deadline.check("llm")
+                delay = self._retry_delay(e, attempt, deadline)
+                if delay is None:
+                    yield ERROR_RESPONSE
+                    return
+                await asyncio.sleep(delay)
+        yield ERROR_RESPONSE
+    
+    async def _governed_call(self, model, prompt: str, temperature: float):
+        async with llm_governor.slot():
+            return await model.generate_content_async(
+                prompt,
+                generation_config=self._generation_config(temperature),
+                safety_settings=self.safety_settings
+            )
+    
+    def _request_options(self, deadline: Deadline):
+        if not deadline.bounded:
+            return {}
+        return {"request_options": {"timeout": deadline.remaining()}}
+    
+    def _retry_delay(self, error: Exception, attempt: int, deadline: Deadline):
+        if isinstance(error, LLMUnavailableError):
+            logger.warning(f"Gemini API call rejected: {str(error)}")
+            return None
+        delay = llm_governor.retry_delay(error, attempt)
+        if delay is None:
+            logger.error(f"Gemini API attempt {attempt + 1} failed, giving up: {str(error)}")
+        elif not deadline.allows(delay):
+            logger.error(f"Gemini API attempt {attempt + 1} failed, no time left to retry: {str(error)}")
+            return None
+        else:
+            logger.warning(f"Gemini API attempt {attempt + 1} failed, retrying in {delay:.1f}s: {str(error)}")
+        return delay
+
 gemini_client = GeminiClient()
\ No newline at end of file
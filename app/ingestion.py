@@ -0,0 +1,401 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Iterator, Iterable, List, Optional, Tuple
+import gzip
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import threading
+import time
+import numpy as np
+from app.config import BATCH_SIZE, EMBED_WORKERS, EMBED_THREADS_PER_WORKER, PIPELINE_QUEUE_SIZE, BM25_DELTA_MAX_DOCS
+from app.onnx_threads import configure_onnx_threads
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 1 << 20
+
+def open_text(path: str):
+    """Открывает файл данных как текст, распаковывая gzip по сигнатуре"""
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == b"\x1f\x8b":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+def iter_papers(path: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """Отдаёт статьи по одной из JSON-массива или JSONL (в т.ч. .gz).
+
+    Файл читается кусками, поэтому память не зависит от размера корпуса.
+    """
+    with open_text(path) as f:
+        head = f.read(chunk_size)
+        stripped = head.lstrip()
+        if stripped.startswith("["):
+            yield from _iter_json_array(f, stripped[1:], chunk_size)
+        else:
+            yield from _iter_json_lines(f, head, chunk_size)
+
+def _iter_json_lines(f, head: str, chunk_size: int) -> Iterator[Dict[str, Any]]:
+    buffer = head
+    line_number = 0
+    while True:
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            line_number += 1
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Invalid JSON on line {line_number}: {e}") from e
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+
+    if buffer.strip():
+        yield json.loads(buffer)
+
+def _iter_json_array(f, buffer: str, chunk_size: int) -> Iterator[Dict[str, Any]]:
+    decoder = json.JSONDecoder()
+    position = 0
+
+    while True:
+        # Пропускаем пробелы и запятые между элементами
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+
+        if position < len(buffer) and buffer[position] == "]":
+            return
+
+        if position >= len(buffer):
+            buffer = f.read(chunk_size)
+            position = 0
+            if not buffer:
+                raise ValueError("Unexpected end of JSON array")
+            continue
+
+        try:
+            paper, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # Элемент не поместился в буфер целиком - дочитываем и пробуем снова
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        yield paper
+        position = end
+
+        # Не даём буферу расти: отбрасываем уже разобранную часть
+        if position > chunk_size:
+            buffer = buffer[position:]
+            position = 0
+
+def peak_rss_mb() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS - байты
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+_worker_embedding_function = None
+
+def _init_embedding_worker(threads: int):
+    global _worker_embedding_function
+    from chromadb.utils import embedding_functions
+    configure_onnx_threads(threads)
+    _worker_embedding_function = embedding_functions.DefaultEmbeddingFunction()
+
+def embed_documents(documents: List[str]) -> np.ndarray:
+    """Выполняется в процессе пула: та же модель, что у коллекции"""
+    return np.asarray(_worker_embedding_function(documents), dtype=np.float32)
+
+def content_hash(document: str, metadata: Dict[str, Any]) -> str:
+    """Хэш текста и метаданных статьи: по нему повторная загрузка пропускает неизменённые"""
+    payload = {key: value for key, value in metadata.items() if key != "content_hash"}
+    raw = document + "\x00" + json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class IngestionCheckpoint:
+    """Манифест загрузки: сколько записей источника уже записано в БД.
+
+    Писатель фиксирует позицию после каждого батча, поэтому прерванная
+    загрузка продолжается с места остановки. Если в файл источника только
+    дописали статьи, загрузка продолжается с сохранённой позиции; если он
+    изменился иначе, позиция сбрасывается, а неизменённые статьи
+    отсеиваются по хэшу содержимого. Загрузка, обрезанная лимитом
+    статей (MAX_PAPERS), завершена только для этого лимита: с другим
+    лимитом она продолжается с сохранённой позиции.
+    """
+
+    def __init__(self, path: str, source: str, limit: int = 0):
+        self.path = path
+        self.source = source
+        self.source_state = _file_state(source)
+        self.limit = limit
+        self.position = 0
+        self.completed = False
+        self.appended = False
+        # Прошлая загрузка оборвалась: часть статей записана не этим запуском
+        self.interrupted = False
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable ingestion manifest {path}: {e}")
+            return
+
+        if manifest.get("source") != source:
+            logger.info("New ingestion source, scanning from the start")
+        elif manifest.get("source_state") == self.source_state:
+            self.position = int(manifest.get("position", 0))
+            # Лимит режет источник по префиксу, поэтому позиция остаётся верной
+            self.completed = bool(manifest.get("completed", False)) and manifest.get("limit", 0) == limit
+            self.interrupted = self.position > 0 and not manifest.get("completed", False)
+        elif _appended(source, manifest.get("source_state") or {}, self.source_state):
+            # Ежедневная дозагрузка дописывает статьи в конец: прежние записи на своих местах
+            self.position = int(manifest.get("position", 0))
+            self.appended = True
+            self.interrupted = self.position > 0 and not manifest.get("completed", False)
+            logger.info(f"Source grew since last ingestion, resuming after {self.position} records")
+        else:
+            logger.info("Source changed since last ingestion, rescanning with content hashes")
+
+    def save(self, position: int, completed: bool = False):
+        self.position = position
+        self.completed = completed
+        manifest = {
+            "source": self.source,
+            "source_state": self.source_state,
+            "position": position,
+            "limit": self.limit,
+            "completed": completed,
+            "updated_at": time.time()
+        }
+        tmp_path = f"{self.path}.tmp"
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.path)
+
+# Начало и конец файла, по которым узнаём, что источник только дописан
+FINGERPRINT_BYTES = 64 * 1024
+
+def _file_state(path: str) -> Dict[str, Any]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {}
+    size = stat.st_size
+    return {
+        "size": size,
+        "mtime": int(stat.st_mtime),
+        "head": _digest(path, 0, min(size, FINGERPRINT_BYTES)),
+        "tail": _digest(path, max(0, size - FINGERPRINT_BYTES), size)
+    }
+
+def _digest(path: str, start: int, end: int) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            f.seek(start)
+            return hashlib.sha1(f.read(end - start)).hexdigest()
+    except OSError:
+        return None
+
+def _appended(path: str, previous: Dict[str, Any], current: Dict[str, Any]) -> bool:
+    """Файл вырос, а прежние начало и конец на месте - записи только дописаны (JSONL, gzip-члены).
+
+    У JSON-массива меняется закрывающая скобка, поэтому он перечитывается с начала.
+    """
+    size = previous.get("size")
+    if not size or "head" not in previous or current.get("size", 0) <= size:
+        return False
+    return (_digest(path, 0, min(size, FINGERPRINT_BYTES)) == previous["head"]
+            and _digest(path, max(0, size - FINGERPRINT_BYTES), size) == previous["tail"])
+
+_END = object()
+
+class IngestionPipeline:
+    """Конвейер загрузки: разбор -> эмбеддинги в пуле процессов -> один писатель.
+
+    Между стадиями ограниченные очереди: если писатель или эмбеддинг не
+    успевают, разбор файла останавливается, а не копит данные в памяти.
+    Загрузка идемпотентна: статьи с тем же хэшем содержимого пропускаются,
+    новые и изменённые записываются через upsert.
+    """
+
+    def __init__(self, database, workers: int = EMBED_WORKERS, batch_size: int = BATCH_SIZE,
+                 queue_size: int = PIPELINE_QUEUE_SIZE, executor=None, embed_fn=embed_documents,
+                 max_tracked_ids: int = BM25_DELTA_MAX_DOCS):
+        self.database = database
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.executor = executor
+        self.embed_fn = embed_fn
+
+        self.stats = {"papers": 0, "skipped": 0, "batches": 0, "seconds": 0.0}
+        # id записанных статей для дозагрузки в BM25; None - их слишком много, индекс собирается целиком
+        self.max_tracked_ids = max_tracked_ids
+        self.upserted_ids = []
+        self._errors = []
+
+    def run(self, records: Iterable[Tuple[str, str, Dict[str, Any]]],
+            checkpoint: Optional[IngestionCheckpoint] = None) -> Dict[str, Any]:
+        start_time = time.time()
+        if checkpoint and checkpoint.completed:
+            logger.info(f"Source already ingested ({checkpoint.position} records), nothing to do")
+            self.stats["seconds"] = time.time() - start_time
+            return self.stats
+
+        parsed = queue.Queue(maxsize=self.queue_size)
+        embedded = queue.Queue(maxsize=self.queue_size)
+
+        own_executor = self.executor is None
+        executor = self.executor or ProcessPoolExecutor(
+            max_workers=self.workers,
+            # spawn: процессы не наследуют потоки конвейера и их блокировки
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_embedding_worker,
+            initargs=(EMBED_THREADS_PER_WORKER,)
+        )
+
+        resume_from = checkpoint.position if checkpoint else 0
+        if resume_from:
+            logger.info(f"Resuming ingestion after {resume_from} records")
+
+        parser = threading.Thread(target=self._parse_stage, args=(records, parsed, resume_from),
+                                  name="ingest-parse", daemon=True)
+        writer = threading.Thread(target=self._write_stage, args=(embedded, checkpoint),
+                                  name="ingest-write", daemon=True)
+        parser.start()
+        writer.start()
+
+        try:
+            self._embed_stage(executor, parsed, embedded)
+        except Exception as e:
+            self._errors.append(e)
+            _drain(parsed, parser)
+        finally:
+            embedded.put(_END)
+            writer.join()
+            parser.join()
+            if own_executor:
+                executor.shutdown(wait=True)
+
+        if self._errors:
+            raise self._errors[0]
+
+        if checkpoint:
+            checkpoint.save(checkpoint.position, completed=True)
+        self.stats["seconds"] = time.time() - start_time
+        return self.stats
+
+    def _parse_stage(self, records, parsed: queue.Queue, resume_from: int):
+        # В очередь идут (записи, позиция в источнике после батча)
+        try:
+            batch = []
+            position = 0
+            for record in records:
+                if self._errors:
+                    break
+                position += 1
+                if position <= resume_from:
+                    continue
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    parsed.put((self._changed_only(batch), position))
+                    batch = []
+            if batch:
+                parsed.put((self._changed_only(batch), position))
+        except Exception as e:
+            self._errors.append(e)
+        finally:
+            parsed.put(_END)
+
+    def _changed_only(self, batch):
+        records = []
+        for record_id, document, metadata in batch:
+            metadata = {**metadata, "content_hash": content_hash(document, metadata)}
+            records.append((record_id, document, metadata))
+
+        existing = self.database.get_content_hashes([record_id for record_id, _, _ in records])
+        changed = [record for record in records if existing.get(record[0]) != record[2]["content_hash"]]
+        self.stats["skipped"] += len(records) - len(changed)
+        return changed
+
+    def _embed_stage(self, executor, parsed: queue.Queue, embedded: queue.Queue):
+        # Не больше двух батчей на процесс в работе: пул загружен, а память ограничена
+        in_flight = deque()
+        while True:
+            item = parsed.get()
+            if item is _END:
+                break
+            if self._errors:
+                continue
+            batch, position = item
+            # Пустой батч (всё без изменений) всё равно проходит до писателя, чтобы сдвинуть позицию
+            future = executor.submit(self.embed_fn, [document for _, document, _ in batch]) if batch else None
+            in_flight.append((batch, position, future))
+            if len(in_flight) >= self.workers * 2:
+                embedded.put(_resolve(in_flight.popleft()))
+
+        while in_flight:
+            embedded.put(_resolve(in_flight.popleft()))
+
+    def _write_stage(self, embedded: queue.Queue, checkpoint: Optional[IngestionCheckpoint]):
+        while True:
+            item = embedded.get()
+            if item is _END:
+                return
+            if self._errors:
+                continue
+            batch, position, embeddings = item
+            try:
+                if batch:
+                    ids = [record_id for record_id, _, _ in batch]
+                    documents = [document for _, document, _ in batch]
+                    metadatas = [metadata for _, _, metadata in batch]
+                    self.database.upsert_documents(documents, metadatas, ids, embeddings=embeddings)
+                    self._track(ids)
+                    self.stats["papers"] += len(batch)
+                    self.stats["batches"] += 1
+                if checkpoint:
+                    checkpoint.save(position)
+            except Exception as e:
+                self._errors.append(e)
+
+    def _track(self, ids: List[str]):
+        if self.upserted_ids is None:
+            return
+        if len(self.upserted_ids) + len(ids) > self.max_tracked_ids:
+            self.upserted_ids = None
+        else:
+            self.upserted_ids.extend(ids)
+
+def _resolve(item):
+    batch, position, future = item
+    return batch, position, future.result() if future else None
+
+def _drain(q: queue.Queue, producer: threading.Thread):
+    # Освобождаем очередь до _END, чтобы стадия разбора не зависла на put.
+    # Чтение источника может надолго задержать её, поэтому ждём, пока она жива;
+    # если _END уже был прочитан, поток завершён и очередь пуста
+    while True:
+        try:
+            if q.get(timeout=0.1) is _END:
+                return
+        except queue.Empty:
+            if not producer.is_alive() and q.empty():
+                return
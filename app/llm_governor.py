@@ -0,0 +1,312 @@
+from typing import Any, Dict, Optional
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from app.config import (
+    LLM_MAX_CONCURRENCY, LLM_MIN_CONCURRENCY, LLM_CONCURRENCY_DECREASE, LLM_QUEUE_TIMEOUT, LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE, LLM_BACKOFF_MAX, LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS
+)
+from app.timing import stage
+from app.deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# Провайдер перегружен: уменьшаем параллелизм
+THROTTLE_STATUSES = (429, 503)
+# Ошибка в самом запросе (ключ, промпт): повтор не поможет, провайдер при этом здоров
+CLIENT_ERROR_STATUSES = (400, 401, 403, 404)
+STATUS_PATTERN = re.compile(r"^\s*(\d{3})\s")
+RETRY_IN_PATTERN = re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE)
+RETRY_DELAY_PATTERN = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)")
+
+class LLMUnavailableError(Exception):
+    """Вызов LLM отклонён без обращения к провайдеру"""
+
+class CircuitOpenError(LLMUnavailableError):
+    pass
+
+class QueueTimeoutError(LLMUnavailableError):
+    pass
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP-статус ошибки SDK (google.api_core: атрибут code, в тексте - "429 Quota exceeded")"""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    match = STATUS_PATTERN.match(str(error))
+    return int(match.group(1)) if match else None
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Пауза, которую просит провайдер: заголовок Retry-After, RetryInfo gRPC или текст ошибки"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    value = headers.get("Retry-After") if headers else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    text = str(error)
+    match = RETRY_IN_PATTERN.search(text) or RETRY_DELAY_PATTERN.search(text)
+    return float(match.group(1)) if match else None
+
+def full_jitter(attempt: int, base: float = LLM_BACKOFF_BASE, cap: float = LLM_BACKOFF_MAX) -> float:
+    # Случайная пауза от 0 до экспоненты: повторы одновременно упавших запросов расходятся во времени
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class CircuitBreaker:
+    """Размыкается после failure_threshold ошибок подряд.
+
+    Пока разомкнут, вызовы отклоняются сразу. Через reset_timeout пропускает
+    один пробный вызов (half-open): успех замыкает цепь, ошибка снова размыкает.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES,
+                 reset_timeout: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.opens = 0
+        self._probing = False
+
+    def before_call(self) -> bool:
+        """Проверка перед вызовом; возвращает True, если вызов пробный"""
+        if self.state == "closed":
+            return False
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        raise CircuitOpenError("LLM circuit breaker is open")
+
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opens += 1
+                logger.warning(f"LLM circuit breaker opened after {self.consecutive_failures} consecutive failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def abandon_probe(self):
+        # Пробный вызов отменён без ответа провайдера - пропустим следующий
+        self._probing = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        retry_in = None
+        if self.state == "open":
+            retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opens": self.opens,
+            "retry_in_seconds": retry_in
+        }
+
+class LLMGovernor:
+    """Ограничивает и выравнивает вызовы LLM в процессе воркера.
+
+    Параллелизм регулируется по AIMD: предел растёт на 1 за каждые
+    "предел" успешных вызовов и умножается на decrease при 429/503.
+    Уменьшаем не чаще раза на поколение вызовов: ответы, начатые до
+    прошлого уменьшения, на него уже учтены. Повторы ждут Retry-After
+    провайдера или экспоненциальную паузу с full jitter. Поверх -
+    circuit breaker, который не пускает к провайдеру, пока тот болен.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, min_concurrency: int = LLM_MIN_CONCURRENCY,
+                 decrease: float = LLM_CONCURRENCY_DECREASE, queue_timeout: float = LLM_QUEUE_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, backoff_base: float = LLM_BACKOFF_BASE,
+                 backoff_max: float = LLM_BACKOFF_MAX, breaker: Optional[CircuitBreaker] = None):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.decrease = decrease
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        # Синхронный generate_response вызывается из потоков
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self.reset()
+
+    def reset(self):
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self._waiters.clear()
+        self._last_decrease = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.throttled = 0
+        self.retries = 0
+        self.rejected = 0
+
+    @property
+    def concurrency_limit(self) -> int:
+        return max(self.min_concurrency, int(self.limit))
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None):
+        """Слот для одного обращения к провайдеру; исход вызова учитывается автоматически.
+
+        timeout сокращает ожидание в очереди (например, до срока запроса).
+        """
+        self._check_breaker()
+        with stage("llm_queue"):
+            await self._acquire(self.queue_timeout if timeout is None else min(timeout, self.queue_timeout))
+        try:
+            with self._lock:
+                probe = self._before_call()
+        except CircuitOpenError:
+            self._release()
+            raise
+        try:
+            with self._outcome(probe):
+                yield
+        finally:
+            self._release()
+
+    @contextmanager
+    def sync_slot(self):
+        """Синхронный вариант: breaker и учёт исходов без ограничения параллелизма"""
+        with self._lock:
+            probe = self._before_call()
+        with self._outcome(probe):
+            yield
+
+    def retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Пауза перед следующей попыткой или None, если повторять не нужно"""
+        status = error_status(error)
+        if isinstance(error, LLMUnavailableError) or status in CLIENT_ERROR_STATUSES:
+            return None
+        if attempt + 1 >= self.max_retries or self.breaker.state == "open":
+            return None
+        requested = retry_after_seconds(error)
+        if requested is not None:
+            if requested > self.backoff_max:
+                logger.warning(f"LLM provider asked to retry in {requested:.1f}s, not waiting")
+                return None
+            # Не раньше, чем просит провайдер, плюс разброс, чтобы повторы не пришли разом
+            delay = requested + random.uniform(0, self.backoff_base)
+        else:
+            delay = full_jitter(attempt, self.backoff_base, self.backoff_max)
+        self.retries += 1
+        return delay
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency_limit": self.concurrency_limit,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "calls": self.calls,
+            "failures": self.failures,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "circuit_breaker": self.breaker.get_stats()
+        }
+
+    def _check_breaker(self):
+        # Разомкнутая цепь отклоняет запрос сразу, не ставя его в очередь
+        if self.breaker.state == "open" and time.monotonic() - self.breaker.opened_at < self.breaker.reset_timeout:
+            self.rejected += 1
+            raise CircuitOpenError("LLM circuit breaker is open")
+
+    def _before_call(self) -> bool:
+        try:
+            return self.breaker.before_call()
+        except CircuitOpenError:
+            self.rejected += 1
+            raise
+
+    @contextmanager
+    def _outcome(self, probe: bool):
+        started = time.monotonic()
+        try:
+            yield
+        except DeadlineExceeded:
+            # Отмена (клиент ушёл, истёк срок запроса) ничего не говорит о здоровье провайдера
+            if probe:
+                self.breaker.abandon_probe()
+            raise
+        except Exception as e:
+            with self._lock:
+                self._record_failure(e, started)
+            raise
+        except BaseException:
+            if probe:
+                self.breaker.abandon_probe()
+            raise
+        else:
+            with self._lock:
+                self.calls += 1
+                self.breaker.record_success()
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+    def _record_failure(self, error: Exception, started: float):
+        self.calls += 1
+        self.failures += 1
+        status = error_status(error)
+        if status in THROTTLE_STATUSES:
+            self.throttled += 1
+            if started >= self._last_decrease:
+                self.limit = max(float(self.min_concurrency), self.limit * self.decrease)
+                self._last_decrease = time.monotonic()
+                logger.warning(f"LLM throttled ({status}), concurrency limit lowered to {self.concurrency_limit}")
+        if status in CLIENT_ERROR_STATUSES:
+            # Провайдер ответил - он здоров, цепь не размыкаем
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    async def _acquire(self, timeout: float):
+        if self.in_flight < self.concurrency_limit and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Слот успели передать - возвращаем его следующему
+                self._release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise QueueTimeoutError(f"No LLM slot within {timeout:g}s") from None
+            raise
+
+    def _release(self):
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < self.concurrency_limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+llm_governor = LLMGovernor()
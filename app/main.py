@@ -1,243 +1,568 @@
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-import logging
-import time
-from typing import Dict, Any
-
-from app.config import TOP_K_RESULTS
-from app.database import vector_db
-from app.models import QueryRequest, QueryResponse, RAGStrategyRequest
-from app.prompts import SYSTEM_PROMPT_TEMPLATE
-from app.gemini_client import gemini_client
-from app.modular_rag import modular_rag, RAGStrategy
-from app.memory import conversation_memory
-
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-# Rate Limiter
-limiter = Limiter(key_func=get_remote_address)
-app = FastAPI(
-    title="Academic Research Assistant - Gemini",
-    description="AI-powered research assistant using arXiv data and Gemini Pro",
-    version="1.0.0"
-)
-
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
-# CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Метрики производительности
-class PerformanceMetrics:
-    def __init__(self):
-        self.request_times = []
-        self.error_count = 0
-        self.success_count = 0
-    
-    def record_request(self, duration: float, success: bool = True):
-        self.request_times.append(duration)
-        if success:
-            self.success_count += 1
-        else:
-            self.error_count += 1
-        
-        if len(self.request_times) > 100:
-            self.request_times.pop(0)
-    
-    def get_metrics(self) -> Dict[str, Any]:
-        if not self.request_times:
-            return {"average_response_time": 0, "success_rate": 1.0}
-        
-        avg_time = sum(self.request_times) / len(self.request_times)
-        total_requests = self.success_count + self.error_count
-        success_rate = self.success_count / total_requests if total_requests > 0 else 1.0
-        
-        return {
-            "average_response_time": round(avg_time, 2),
-            "success_rate": round(success_rate, 2),
-            "total_requests": total_requests,
-            "error_count": self.error_count
-        }
-
-metrics = PerformanceMetrics()
-
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
-    
-    metrics.record_request(process_time, success=response.status_code < 400)
-    
-    return response
-
-@app.get("/")
-async def root():
-    return {
-        "message": "Academic Research Assistant API",
-        "version": "1.0.0", 
-        "llm": "Gemini Pro",
-        "data_source": "arXiv 2020",
-        "features": ["modular_rag", "conversation_memory", "rate_limiting"]
-    }
-
-@app.post("/query", response_model=QueryResponse)
-@limiter.limit("10/minute")
-async def query_documents(
-    request: Request,
-    query_request: QueryRequest,
-    session_id: str = "default"
-):
-    start_time = time.time()
-    
-    try:
-        logger.info(f"Processing question: {query_request.question}")
-        
-        rag_strategy = query_request.strategy
-
-        if isinstance(rag_strategy, str):
-            rag_strategy = RAGStrategy(rag_strategy.lower())
-            
-        rag_results = modular_rag.execute_rag(
-            question=query_request.question,
-            strategy=rag_strategy,
-            top_k=query_request.top_k
-        )
-        
-        if not rag_results['documents']:
-            response = QueryResponse(
-                answer="I couldn't find any relevant research papers in my database to answer your question. Please try rephrasing or asking about a different topic.",
-                sources=[],
-                context=[],
-                strategy=rag_strategy.value
-            )
-            
-            conversation_memory.store_conversation(
-                session_id, query_request.question, 
-                response.answer, response.sources
-            )
-            return response
-        
-        context_documents = rag_results['documents']
-        metadatas = rag_results.get('metadatas', [])
-        
-        formatted_context = format_context(context_documents, metadatas)
-        
-        conversation_history = conversation_memory.get_conversation_history(session_id, limit=3)
-        if conversation_history:
-            history_context = "\n\nPrevious conversation:\n" + "\n".join(
-                [f"Q: {conv['question']}\nA: {conv['answer']}" for conv in reversed(conversation_history)]
-            )
-            formatted_context = history_context + "\n\nCurrent context:\n" + formatted_context
-        
-        prompt = SYSTEM_PROMPT_TEMPLATE.format(
-            context=formatted_context,
-            question=query_request.question
-        )
-        
-        answer = gemini_client.generate_response(prompt)
-        
-        sources = format_sources(metadatas)
-        
-        response = QueryResponse(
-            answer=answer,
-            sources=sources,
-            context=context_documents,
-            strategy=rag_strategy.value,
-            processing_time=round(time.time() - start_time, 2)
-        )
-        
-        conversation_memory.store_conversation(
-            session_id, query_request.question, answer, sources
-        )
-        
-        return response
-        
-    except Exception as e:
-        logger.error(f"Error processing query: {str(e)}")
-        metrics.record_request(time.time() - start_time, success=False)
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-
-@app.post("/query/strategy", response_model=QueryResponse)
-@limiter.limit("10/minute")
-async def query_with_strategy(
-    request: Request,
-    strategy_request: RAGStrategyRequest
-):
-    query_request = QueryRequest(
-        question=strategy_request.question,
-        top_k=strategy_request.top_k
-    )
-    return await query_documents(
-        request, query_request, strategy_request.session_id
-    )
-
-@app.get("/conversation/{session_id}")
-async def get_conversation(session_id: str, limit: int = 10):
-    history = conversation_memory.get_conversation_history(session_id, limit)
-    return {"session_id": session_id, "history": history}
-
-@app.delete("/conversation/{session_id}")
-async def clear_conversation(session_id: str):
-    conversation_memory.clear_conversation(session_id)
-    return {"message": f"Conversation history for {session_id} cleared"}
-
-@app.get("/metrics")
-async def get_metrics():
-    return metrics.get_metrics()
-
-@app.get("/strategies")
-async def get_available_strategies():
-    return {
-        "available_strategies": [strategy.value for strategy in RAGStrategy],
-        "default_strategy": RAGStrategy.BASIC.value
-    }
-
-@app.get("/stats")
-async def get_stats():
-    try:
-        collection_stats = vector_db.collection.count()
-        return {
-            "total_documents": collection_stats,
-            "embedding_model": "all-MiniLM-L6-v2",
-            "llm_model": "Gemini Pro"
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy", "service": "Academic Research Assistant"}
-
-def format_context(documents, metadatas):
-    formatted = []
-    for i, (doc, meta) in enumerate(zip(documents, metadatas)):
-        source_info = f"[Source {i+1}]"
-        if meta and 'title' in meta:
-            source_info += f" {meta['title']}"
-        formatted.append(f"{source_info}\n{doc}")
-    return "\n\n".join(formatted)
-
-def format_sources(metadatas):
-    sources = []
-    for i, meta in enumerate(metadatas):
-        if meta:
-            source = f"Source {i+1}: {meta.get('title', 'Unknown title')}"
-            if meta.get('authors'):
-                source += f" by {meta['authors']}"
-            sources.append(source)
-        else:
-            sources.append(f"Source {i+1}")
+from fastapi import FastAPI, HTTPException, Request, Depends
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import logging
+import math
+import time
+
+from app.config import (
+    TOP_K_RESULTS, BATCH_LLM_CONCURRENCY, CONVERSATION_RECENT_TURNS, RATE_LIMIT_BATCH_COST, REQUEST_TIMEOUT_DEFAULT,
+    REQUEST_TIMEOUT_MAX
+)
+from app.database import vector_db
+from app.models import (
+    QueryRequest, QueryResponse, RAGStrategyRequest, BatchQueryRequest, BatchQueryResponse, BatchQueryResult
+)
+from app.prompts import SYSTEM_PROMPT_TEMPLATE
+from app.gemini_client import gemini_client, is_fallback_response, ERROR_RESPONSE
+from app.llm_governor import llm_governor
+from app.modular_rag import modular_rag, RAGStrategy
+from app.memory import conversation_memory
+from app.cache import response_cache
+from app.semantic_cache import semantic_cache
+from app.singleflight import retrieval_flight, llm_flight, prompt_key
+from app.metrics import metrics, EXCLUDED_PATHS
+from app.timing import start_timings, stage
+from app.deadline import start_deadline, DeadlineExceeded
+from app.context_builder import context_builder, estimate_tokens
+from app.rate_limit import limiter
+from app.resources import resources
+from app.warmup import warmup
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await resources.startup()
+    yield
+    # Пулы соединений Redis привязаны к циклу событий воркера - закрываем в нём же
+    await resources.shutdown()
+
+app = FastAPI(
+    title="Academic Research Assistant - Gemini",
+    description="AI-powered research assistant using arXiv data and Gemini Pro",
+    version="1.0.0",
+    lifespan=lifespan
+)
+
+# CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+# Сколько клиент готов ждать ответа, секунды (frontend присылает свой таймаут)
+DEADLINE_HEADER = "X-Request-Timeout"
+
+# Ни реплик, ни сводки: пакетные вопросы и сессии без истории
+NO_HISTORY = ((), "")
+
+NO_DOCUMENTS_ANSWER = "I couldn't find any relevant research papers in my database to answer your question. Please try rephrasing or asking about a different topic."
+
+@app.middleware("http")
+async def add_process_time_header(request: Request, call_next):
+    start_time = time.perf_counter()
+    response = await call_next(request)
+    process_time = time.perf_counter() - start_time
+    response.headers["X-Process-Time"] = str(process_time)
+    
+    timings = getattr(request.state, "timings", None)
+    if timings is not None:
+        response.headers["Server-Timing"] = timings.server_timing(total=process_time)
+        metrics.record_stages(timings.stages)
+    
+    # Потоковые ответы учитываются по завершении самим endpoint'ом, здесь было бы время до заголовков
+    if request.url.path not in EXCLUDED_PATHS and not response.headers.get("content-type", "").startswith("text/event-stream"):
+        metrics.record_request(
+            endpoint_label(request), response.status_code, process_time,
+            strategy=getattr(request.state, "strategy", None)
+        )
+    
+    return response
+
+@app.get("/")
+async def root():
+    return {
+        "message": "Academic Research Assistant API",
+        "version": "1.0.0", 
+        "llm": "Gemini Pro",
+        "data_source": "arXiv 2020",
+        "features": ["modular_rag", "conversation_memory", "rate_limiting", "streaming", "batch_queries"]
+    }
+
+@app.post("/query", response_model=QueryResponse, dependencies=[Depends(limiter.bucket("llm"))])
+async def query_documents(
+    request: Request,
+    query_request: QueryRequest,
+    session_id: str = "default"
+):
+    start_time = time.time()
+    timings = start_timings()
+    request.state.timings = timings
+    start_deadline(request_timeout(request, query_request.timeout))
+    
+    try:
+        logger.info(f"Processing question: {query_request.question}")
+        
+        rag_strategy = query_request.strategy
+
+        if isinstance(rag_strategy, str):
+            rag_strategy = RAGStrategy(rag_strategy.lower())
+        request.state.strategy = rag_strategy.value
+        
+        history = await load_history(session_id)
+        cached = await lookup_cached_answer(query_request.question, rag_strategy.value, query_request.top_k, history)
+        if cached:
+            response = QueryResponse(
+                answer=cached["answer"],
+                sources=cached["sources"],
+                context=cached["context"],
+                strategy=cached["strategy"],
+                processing_time=round(time.time() - start_time, 2)
+            )
+            await store_conversation(session_id, query_request.question, response.answer, response.sources)
+            response.timings = timings.as_dict()
+            return response
+            
+        rag_results = await retrieve(query_request.question, rag_strategy, query_request.top_k)
+        
+        if not rag_results['documents']:
+            response = QueryResponse(
+                answer=NO_DOCUMENTS_ANSWER,
+                sources=[],
+                context=[],
+                strategy=rag_strategy.value
+            )
+            
+            await store_conversation(session_id, query_request.question, response.answer, response.sources)
+            response.timings = timings.as_dict()
+            return response
+        
+        prompt, built = await build_prompt(
+            query_request.question, rag_results['documents'], rag_results.get('metadatas', []), history,
+            scores=rag_results.get('scores')
+        )
+        # В ответе - ровно те источники, что попали в промпт (после бюджета токенов)
+        context_documents, metadatas = built.documents, built.metadatas
+        
+        llm_start = time.perf_counter()
+        answer = await generate_answer(prompt)
+        record_prompt_metrics(prompt, built, time.perf_counter() - llm_start)
+        
+        sources = format_sources(metadatas)
+        
+        response = QueryResponse(
+            answer=answer,
+            sources=sources,
+            context=context_documents,
+            strategy=rag_strategy.value,
+            processing_time=round(time.time() - start_time, 2)
+        )
+        
+        if not is_fallback_response(answer):
+            await remember_answer(query_request.question, rag_strategy.value, query_request.top_k, {
+                "answer": answer,
+                "sources": sources,
+                "context": context_documents,
+                "strategy": rag_strategy.value
+            }, history)
+        
+        await store_conversation(session_id, query_request.question, answer, sources)
+        
+        response.timings = timings.as_dict()
+        return response
+        
+    except DeadlineExceeded as e:
+        logger.warning(f"Query abandoned: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error processing query: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.post("/query/stream", dependencies=[Depends(limiter.bucket("llm"))])
+async def query_documents_stream(
+    request: Request,
+    query_request: QueryRequest,
+    session_id: str = "default"
+):
+    # Server-Sent Events: сначала источники, затем ответ по частям
+    rag_strategy = query_request.strategy
+    if isinstance(rag_strategy, str):
+        rag_strategy = RAGStrategy(rag_strategy.lower())
+    
+    endpoint = endpoint_label(request)
+    timeout = request_timeout(request, query_request.timeout)
+    
+    async def event_stream():
+        start_time = time.time()
+        timings = start_timings()
+        start_deadline(timeout)
+        status_code = 200
+        try:
+            logger.info(f"Streaming answer for question: {query_request.question}")
+            
+            history = await load_history(session_id)
+            cached = await lookup_cached_answer(query_request.question, rag_strategy.value, query_request.top_k, history)
+            if cached:
+                yield format_sse("sources", {
+                    "sources": cached["sources"],
+                    "context": cached["context"],
+                    "strategy": cached["strategy"]
+                })
+                yield format_sse("chunk", {"text": cached["answer"]})
+                await store_conversation(session_id, query_request.question, cached["answer"], cached["sources"])
+                yield format_sse("done", {
+                    "processing_time": round(time.time() - start_time, 2),
+                    "timings": timings.as_dict()
+                })
+                return
+            
+            rag_results = await retrieve(query_request.question, rag_strategy, query_request.top_k)
+            
+            prompt = None
+            context_documents = rag_results['documents']
+            metadatas = rag_results.get('metadatas', [])
+            if context_documents:
+                # Промпт собираем до отправки источников, чтобы показать только вошедшие в него
+                prompt, built = await build_prompt(
+                    query_request.question, context_documents, metadatas, history,
+                    scores=rag_results.get('scores')
+                )
+                context_documents, metadatas = built.documents, built.metadatas
+            sources = format_sources(metadatas)
+            
+            yield format_sse("sources", {
+                "sources": sources,
+                "context": context_documents,
+                "strategy": rag_strategy.value
+            })
+            
+            if prompt is None:
+                answer = NO_DOCUMENTS_ANSWER
+                yield format_sse("chunk", {"text": answer})
+            else:
+                answer_parts = []
+                llm_start = time.perf_counter()
+                async for text in gemini_client.stream_response(prompt):
+                    answer_parts.append(text)
+                    yield format_sse("chunk", {"text": text})
+                answer = "".join(answer_parts)
+                timings.add("llm", time.perf_counter() - llm_start)
+                record_prompt_metrics(prompt, built, time.perf_counter() - llm_start)
+                
+                if not is_fallback_response(answer):
+                    await remember_answer(query_request.question, rag_strategy.value, query_request.top_k, {
+                        "answer": answer,
+                        "sources": sources,
+                        "context": context_documents,
+                        "strategy": rag_strategy.value
+                    }, history)
+            
+            await store_conversation(session_id, query_request.question, answer, sources)
+            
+            yield format_sse("done", {
+                "processing_time": round(time.time() - start_time, 2),
+                "timings": timings.as_dict()
+            })
+            
+        except DeadlineExceeded as e:
+            logger.warning(f"Streaming query abandoned: {str(e)}")
+            status_code = 504
+            yield format_sse("error", {"detail": str(e)})
+        except Exception as e:
+            logger.error(f"Error streaming query: {str(e)}")
+            status_code = 500
+            yield format_sse("error", {"detail": f"Internal server error: {str(e)}"})
+        finally:
+            metrics.record_request(endpoint, status_code, time.time() - start_time, strategy=rag_strategy.value)
+            metrics.record_stages(timings.stages)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post(
+    "/query/batch", response_model=BatchQueryResponse,
+    dependencies=[Depends(limiter.bucket("llm", cost=RATE_LIMIT_BATCH_COST))]
+)
+async def query_documents_batch(
+    request: Request,
+    batch_request: BatchQueryRequest
+):
+    # Без истории диалога: пакет - это независимые вопросы (оценка, внутренние инструменты)
+    start_time = time.time()
+    rag_strategy = batch_request.strategy
+    if isinstance(rag_strategy, str):
+        rag_strategy = RAGStrategy(rag_strategy.lower())
+    strategy_name = rag_strategy.value
+    request.state.strategy = strategy_name
+    questions = batch_request.questions
+    top_k = batch_request.top_k
+    # Вопросы, не успевшие к сроку, получают ошибку; готовые ответы отдаём
+    deadline = start_deadline(request_timeout(request, batch_request.timeout))
+    
+    logger.info(f"Processing batch of {len(questions)} questions")
+    
+    results = [None] * len(questions)
+    cached_answers = await asyncio.gather(
+        *(lookup_cached_answer(question, strategy_name, top_k) for question in questions),
+        return_exceptions=True
+    )
+    pending = []
+    for i, cached in enumerate(cached_answers):
+        if isinstance(cached, dict):
+            results[i] = BatchQueryResult(question=questions[i], **cached)
+        else:
+            pending.append(i)
+    
+    if pending:
+        # Поиск по всем оставшимся вопросам одним запросом к ChromaDB
+        try:
+            rag_batch = await deadline.run(modular_rag.run_blocking(
+                modular_rag.execute_rag_batch, [questions[i] for i in pending], rag_strategy, top_k
+            ), "retrieval")
+        except Exception as e:
+            logger.error(f"Batch retrieval failed: {str(e)}")
+            rag_batch = [e] * len(pending)
+        
+        semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+        
+        async def answer_one(i, rag_results):
+            question = questions[i]
+            if isinstance(rag_results, Exception):
+                return BatchQueryResult(question=question, strategy=strategy_name, error=f"Retrieval failed: {rag_results}")
+            
+            if not rag_results['documents']:
+                return BatchQueryResult(question=question, answer=NO_DOCUMENTS_ANSWER, strategy=strategy_name)
+            
+            prompt, built = await build_prompt(
+                question, rag_results['documents'], rag_results.get('metadatas', []), NO_HISTORY,
+                scores=rag_results.get('scores')
+            )
+            context_documents, metadatas = built.documents, built.metadatas
+            sources = format_sources(metadatas)
+            try:
+                async with semaphore:
+                    llm_start = time.perf_counter()
+                    answer = await generate_answer(prompt)
+                record_prompt_metrics(prompt, built, time.perf_counter() - llm_start)
+            except Exception as e:
+                logger.error(f"Batch generation failed for '{question}': {str(e)}")
+                return BatchQueryResult(question=question, sources=sources, context=context_documents,
+                                        strategy=strategy_name, error=f"Generation failed: {e}")
+            
+            if answer == ERROR_RESPONSE:
+                return BatchQueryResult(question=question, sources=sources, context=context_documents,
+                                        strategy=strategy_name, error="Generation failed")
+            
+            if not is_fallback_response(answer):
+                await remember_answer(question, strategy_name, top_k, {
+                    "answer": answer,
+                    "sources": sources,
+                    "context": context_documents,
+                    "strategy": strategy_name
+                })
+            return BatchQueryResult(question=question, answer=answer, sources=sources,
+                                    context=context_documents, strategy=strategy_name)
+        
+        answered = await asyncio.gather(*(answer_one(i, rag) for i, rag in zip(pending, rag_batch)))
+        for i, result in zip(pending, answered):
+            results[i] = result
+    
+    return BatchQueryResponse(results=results, processing_time=round(time.time() - start_time, 2))
+
+@app.post("/query/strategy", response_model=QueryResponse, dependencies=[Depends(limiter.bucket("llm"))])
+async def query_with_strategy(
+    request: Request,
+    strategy_request: RAGStrategyRequest
+):
+    query_request = QueryRequest(
+        question=strategy_request.question,
+        top_k=strategy_request.top_k,
+        timeout=strategy_request.timeout
+    )
+    return await query_documents(
+        request, query_request, strategy_request.session_id
+    )
+
+@app.get("/conversation/{session_id}", dependencies=[Depends(limiter.bucket("cheap"))])
+async def get_conversation(session_id: str, limit: int = 10):
+    history = await conversation_memory.get_conversation_history(session_id, limit)
+    summary = await conversation_memory.get_conversation_summary(session_id)
+    return {"session_id": session_id, "history": history, "summary": summary}
+
+@app.delete("/conversation/{session_id}")
+async def clear_conversation(session_id: str):
+    await conversation_memory.clear_conversation(session_id)
+    return {"message": f"Conversation history for {session_id} cleared"}
+
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        **metrics.get_metrics(),
+        "response_cache": response_cache.get_stats(),
+        "semantic_cache": semantic_cache.get_stats(),
+        "coalescing": {
+            "retrieval": retrieval_flight.get_stats(),
+            "llm": llm_flight.get_stats()
+        },
+        "memory": conversation_memory.get_memory_stats(),
+        "rate_limit": limiter.get_stats(),
+        "llm": llm_governor.get_stats()
+    }
+
+@app.get("/metrics/prometheus", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    return PlainTextResponse(metrics.prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/strategies", dependencies=[Depends(limiter.bucket("cheap"))])
+async def get_available_strategies():
+    return {
+        "available_strategies": [strategy.value for strategy in RAGStrategy],
+        "default_strategy": RAGStrategy.BASIC.value
+    }
+
+@app.get("/stats", dependencies=[Depends(limiter.bucket("cheap"))])
+async def get_stats():
+    try:
+        collection_stats = vector_db.collection.count()
+        return {
+            "total_documents": collection_stats,
+            "embedding_model": "all-MiniLM-L6-v2",
+            "llm_model": "Gemini Pro"
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/health")
+async def health_check():
+    return {"status": "healthy", "service": "Academic Research Assistant", "resources": resources.status()}
+
+@app.get("/ready")
+async def readiness_check():
+    # 503, пока воркер не прогрет: балансировщик не шлёт на него запросы
+    status = warmup.status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+def request_timeout(request, timeout=None):
+    """Срок ответа в секундах: поле запроса, заголовок X-Request-Timeout или REQUEST_TIMEOUT_DEFAULT; None - без срока"""
+    if timeout is None:
+        header = request.headers.get(DEADLINE_HEADER)
+        if header:
+            try:
+                timeout = float(header)
+            except ValueError:
+                timeout = float("nan")
+            # nan и inf - тоже мусор: срок nan никогда не истекает, а Deadline.run крутился бы вхолостую
+            if not math.isfinite(timeout):
+                raise HTTPException(status_code=400, detail=f"Invalid {DEADLINE_HEADER} header: {header}")
+    elif not math.isfinite(timeout):
+        raise HTTPException(status_code=400, detail=f"Invalid timeout: {timeout}")
+    if timeout is None:
+        timeout = REQUEST_TIMEOUT_DEFAULT
+    if timeout <= 0:
+        return None
+    return min(timeout, REQUEST_TIMEOUT_MAX)
+
+def endpoint_label(request):
+    # Шаблон маршрута, а не сам путь: /conversation/{session_id} - одна серия, а не по серии на сессию
+    route = request.scope.get("route")
+    path = getattr(route, "path", None) or "unmatched"
+    return f"{request.method} {path}"
+
+def has_dialogue(history):
+    # Ответ на уточняющий вопрос ("а вторая статья?") построен на истории своей сессии:
+    # такой ответ нельзя ни отдавать из общего кэша, ни класть в него для других сессий
+    conversation_history, summary = history
+    return bool(conversation_history or summary)
+
+async def lookup_cached_answer(question, strategy, top_k, history=NO_HISTORY):
+    # Сначала точное совпадение (дёшево), затем перефразировки (нужен эмбеддинг)
+    # Redis и файл версии коллекции - блокирующий ввод-вывод, держим его вне event loop
+    # Перефразировка уточняющего вопроса ещё опаснее: похожий вопрос из чужой сессии совпадёт по смыслу
+    if has_dialogue(history):
+        return None
+    with stage("cache_lookup"):
+        cached = await modular_rag.run_blocking(response_cache.get, question, strategy, top_k)
+        if cached:
+            return cached
+        return await modular_rag.run_blocking(semantic_cache.lookup, question, strategy, top_k)
+
+async def remember_answer(question, strategy, top_k, value, history=NO_HISTORY):
+    if has_dialogue(history):
+        return
+    with stage("cache_store"):
+        await modular_rag.run_blocking(response_cache.set, question, strategy, top_k, value)
+        await modular_rag.run_blocking(semantic_cache.store, question, strategy, top_k, value)
+
+async def load_history(session_id):
+    """Последние реплики и сводка сессии для промпта; без сессии - пусто"""
+    if not session_id:
+        return NO_HISTORY
+    with stage("history"):
+        # Дословно - только последние реплики, остальное уже свёрнуто в сводку
+        return await conversation_memory.get_prompt_history(session_id, limit=CONVERSATION_RECENT_TURNS)
+
+async def store_conversation(session_id, question, answer, sources):
+    with stage("memory_store"):
+        await conversation_memory.store_conversation(session_id, question, answer, sources)
+
+async def retrieve(question, strategy, top_k):
+    # Одинаковые одновременные запросы делят один поиск
+    # Ожидание обрывается по сроку запроса; поиск в потоке сам проверяет срок между этапами
+    key = f"{question}|{strategy.value}|{top_k}"
+    return await retrieval_flight.do(
+        key, lambda: modular_rag.execute_rag_async(question=question, strategy=strategy, top_k=top_k)
+    )
+
+async def generate_answer(prompt):
+    # Ключ - сам промпт: с разной историей диалога ответы не склеиваются
+    return await llm_flight.do(prompt_key(prompt), lambda: timed_generate(prompt))
+
+async def timed_generate(prompt):
+    with stage("llm"):
+        return await gemini_client.generate_response_async(prompt)
+
+async def build_prompt(question, documents, metadatas, history, scores=None):
+    """Промпт с контекстом в пределах MAX_CONTEXT_LENGTH токенов; возвращает (промпт, BuiltContext)"""
+    conversation_history, summary = history
+    with stage("prompt_build"):
+        built = context_builder.build(documents, metadatas, scores, conversation_history, summary)
+        if built.dropped or built.truncated:
+            logger.info(f"Context budget: dropped {built.dropped}, truncated {built.truncated} sources")
+        
+        prompt = SYSTEM_PROMPT_TEMPLATE.format(
+            context=built.text,
+            question=question
+        )
+    return prompt, built
+
+def record_prompt_metrics(prompt, built, llm_seconds):
+    metrics.record_prompt(estimate_tokens(prompt), built.source_tokens, built.history_tokens, llm_seconds)
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def format_sources(metadatas):
+    sources = []
+    for i, meta in enumerate(metadatas):
+        if meta:
+            source = f"Source {i+1}: {meta.get('title', 'Unknown title')}"
+            if meta.get('authors'):
+                source += f" by {meta['authors']}"
+            sources.append(source)
+        else:
+            sources.append(f"Source {i+1}")
     return sources
\ No newline at end of file
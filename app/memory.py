@@ -1,95 +1,150 @@
-from typing import List, Dict, Any
-import redis
-import json
-import logging
-from datetime import datetime, timedelta
-
-logger = logging.getLogger(__name__)
-
-class ConversationMemory:
-    def __init__(self, redis_url: str = None):
-        self.redis_client = None
-        if redis_url:
-            try:
-                self.redis_client = redis.Redis.from_url(redis_url)
-                self.redis_client.ping()
-                logger.info("Redis connected successfully")
-            except Exception as e:
-                logger.warning(f"Redis connection failed: {e}. Using in-memory storage.")
-                self.redis_client = None
-        
-        self._memory_cache = {}
-        self._conversation_history = {}
-    
-    def cache_embedding(self, key: str, embedding: List[float], ttl: int = 3600):
-        try:
-            if self.redis_client:
-                self.redis_client.setex(
-                    f"embedding:{key}", 
-                    timedelta(seconds=ttl),
-                    json.dumps(embedding)
-                )
-            else:
-                self._memory_cache[f"embedding:{key}"] = {
-                    "data": embedding,
-                    "expires": datetime.now() + timedelta(seconds=ttl)
-                }
-        except Exception as e:
-            logger.error(f"Cache set failed: {e}")
-    
-    def get_cached_embedding(self, key: str) -> List[float]:
-        try:
-            if self.redis_client:
-                cached = self.redis_client.get(f"embedding:{key}")
-                return json.loads(cached) if cached else None
-            else:
-                cache_item = self._memory_cache.get(f"embedding:{key}")
-                if cache_item and cache_item["expires"] > datetime.now():
-                    return cache_item["data"]
-                return None
-        except Exception as e:
-            logger.error(f"Cache get failed: {e}")
-            return None
-    
-    def store_conversation(self, session_id: str, question: str, answer: str, sources: List[str]):
-        conversation = {
-            "timestamp": datetime.now().isoformat(),
-            "question": question,
-            "answer": answer,
-            "sources": sources
-        }
-        
-        try:
-            if self.redis_client:
-                self.redis_client.lpush(f"conversation:{session_id}", json.dumps(conversation))
-                self.redis_client.ltrim(f"conversation:{session_id}", 0, 9)
-            else:
-                if session_id not in self._conversation_history:
-                    self._conversation_history[session_id] = []
-                self._conversation_history[session_id].insert(0, conversation)
-                self._conversation_history[session_id] = self._conversation_history[session_id][:10]
-                
-        except Exception as e:
-            logger.error(f"Conversation storage failed: {e}")
-    
-    def get_conversation_history(self, session_id: str, limit: int = 5) -> List[Dict[str, Any]]:
-        try:
-            if self.redis_client:
-                history = self.redis_client.lrange(f"conversation:{session_id}", 0, limit-1)
-                return [json.loads(item) for item in reversed(history)]
-            else:
-                return self._conversation_history.get(session_id, [])[:limit]
-        except Exception as e:
-            logger.error(f"Conversation retrieval failed: {e}")
-            return []
-    
-    def clear_conversation(self, session_id: str):
-        try:
-            if self.redis_client:
-                self.redis_client.delete(f"conversation:{session_id}")
-            else:
-                self._conversation_history.pop(session_id, None)
-        except Exception as e:
-            logger.error(f"Conversation clear failed: {e}")
-
-conversation_memory = ConversationMemory()
\ No newline at end of file
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+import redis
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from app.config import EMBEDDING_CACHE_MAX_ENTRIES, REDIS_URL, MEMORY_BACKEND
+from app.session_store import InMemoryConversationStore, RedisConversationStore
+
+logger = logging.getLogger(__name__)
+
+class ConversationMemory:
+    def __init__(self, redis_url: str = None, embedding_cache_size: int = EMBEDDING_CACHE_MAX_ENTRIES,
+                 backend: str = None):
+        # Клиент соединяется при первой команде; доступность проверяет connect() при старте воркера
+        self.redis_client = redis.Redis.from_url(redis_url) if redis_url else None
+        
+        # LRU: ключ -> (срок жизни, float32 байты)
+        self._memory_cache = OrderedDict()
+        self._memory_cache_size = embedding_cache_size
+        # Эмбеддинги кэшируются из потоков пула поиска
+        self._cache_lock = threading.Lock()
+        
+        # Сессии: асинхронное хранилище, Redis общий для воркеров
+        backend = backend or ("redis" if redis_url else "memory")
+        if backend == "redis" and self.redis_client:
+            self.sessions = RedisConversationStore(redis_url)
+        else:
+            if backend == "redis":
+                logger.warning("MEMORY_BACKEND=redis, but Redis is unavailable. Sessions are kept in process memory.")
+            self.sessions = InMemoryConversationStore()
+    
+    def connect(self):
+        """Проверяет Redis; если он недоступен, кэш и сессии работают в памяти процесса"""
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.ping()
+            logger.info("Redis connected successfully")
+        except Exception as e:
+            logger.warning(f"Redis connection failed: {e}. Using in-memory storage.")
+            self.redis_client = None
+            if isinstance(self.sessions, RedisConversationStore):
+                self.sessions = InMemoryConversationStore()
+    
+    def cache_embedding(self, key: str, embedding, ttl: int = 3600):
+        # Храним компактно: сырые float32 байты вместо JSON-списка
+        payload = np.asarray(embedding, dtype=np.float32).tobytes()
+        try:
+            if self.redis_client:
+                self.redis_client.setex(
+                    f"embedding:{key}", 
+                    timedelta(seconds=ttl),
+                    payload
+                )
+            else:
+                cache_key = f"embedding:{key}"
+                with self._cache_lock:
+                    self._memory_cache[cache_key] = (time.monotonic() + ttl, payload)
+                    self._memory_cache.move_to_end(cache_key)
+                    while len(self._memory_cache) > self._memory_cache_size:
+                        self._memory_cache.popitem(last=False)
+        except Exception as e:
+            logger.error(f"Cache set failed: {e}")
+    
+    def get_cached_embedding(self, key: str) -> Optional[np.ndarray]:
+        try:
+            if self.redis_client:
+                cached = self.redis_client.get(f"embedding:{key}")
+                return np.frombuffer(cached, dtype=np.float32) if cached else None
+            else:
+                cache_key = f"embedding:{key}"
+                with self._cache_lock:
+                    cache_item = self._memory_cache.get(cache_key)
+                    if cache_item is None:
+                        return None
+                    expires, payload = cache_item
+                    if expires <= time.monotonic():
+                        del self._memory_cache[cache_key]
+                        return None
+                    self._memory_cache.move_to_end(cache_key)
+                return np.frombuffer(payload, dtype=np.float32)
+        except Exception as e:
+            logger.error(f"Cache get failed: {e}")
+            return None
+    
+    async def store_conversation(self, session_id: str, question: str, answer: str, sources: List[str]):
+        conversation = {
+            "timestamp": datetime.now().isoformat(),
+            "question": question,
+            "answer": answer,
+            "sources": sources
+        }
+        
+        try:
+            await self.sessions.append(session_id, conversation)
+        except Exception as e:
+            logger.error(f"Conversation storage failed: {e}")
+    
+    async def get_conversation_history(self, session_id: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Реплики сессии от новых к старым"""
+        try:
+            return await self.sessions.history(session_id, limit)
+        except Exception as e:
+            logger.error(f"Conversation retrieval failed: {e}")
+            return []
+    
+    async def get_conversation_summary(self, session_id: str) -> str:
+        """Сводка всех реплик сессии, кроме последней"""
+        try:
+            return await self.sessions.summary(session_id)
+        except Exception as e:
+            logger.error(f"Conversation summary retrieval failed: {e}")
+            return ""
+    
+    async def get_prompt_history(self, session_id: str, limit: int) -> Tuple[List[Dict[str, Any]], str]:
+        """Последние реплики и сводка остальных - одним обращением к хранилищу"""
+        try:
+            return await self.sessions.prompt_history(session_id, limit)
+        except Exception as e:
+            logger.error(f"Conversation retrieval failed: {e}")
+            return [], ""
+    
+    async def clear_conversation(self, session_id: str):
+        try:
+            await self.sessions.clear(session_id)
+        except Exception as e:
+            logger.error(f"Conversation clear failed: {e}")
+    
+    async def close(self):
+        await self.sessions.close()
+    
+    def get_memory_stats(self) -> Dict[str, Any]:
+        """Объём сессий и in-process кэша эмбеддингов (для /metrics)"""
+        with self._cache_lock:
+            cache_entries = len(self._memory_cache)
+            cache_bytes = sum(len(payload) for _, payload in self._memory_cache.values())
+        return {
+            "sessions": self.sessions.get_stats(),
+            "embedding_cache": {
+                "backend": "redis" if self.redis_client else "memory",
+                "entries": cache_entries,
+                "bytes": cache_bytes,
+                "max_entries": self._memory_cache_size
+            }
+        }
+
+conversation_memory = ConversationMemory(REDIS_URL, backend=MEMORY_BACKEND)
@@ -0,0 +1,222 @@
+from bisect import bisect_left
+from typing import Dict, Any, List, Optional, Tuple
+import threading
+
+# Верхние границы корзин, секунды. Память фиксирована: по счётчику на корзину
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75,
+    1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 60.0
+)
+
+# Корзины для размера промпта, токены
+TOKEN_BUCKETS = (128, 256, 512, 1024, 1536, 2048, 3072, 4096, 8192, 16384, 32768)
+
+# Служебные запросы (проверки живости, опрос метрик) не смешиваем с пользовательскими
+EXCLUDED_PATHS = frozenset({"/health", "/ready", "/metrics", "/metrics/prometheus"})
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными корзинами (как histogram в Prometheus)"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # Последняя корзина - всё, что больше верхней границы (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram"):
+        for i, value in enumerate(other.counts):
+            self.counts[i] += value
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля линейной интерполяцией внутри корзины (как histogram_quantile)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, value in enumerate(self.counts):
+            if cumulative + value >= rank and value:
+                if i == len(self.buckets):
+                    return self.max
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i]
+                # Оценка не может превышать наблюдавшийся максимум
+                return min(lower + (upper - lower) * (rank - cumulative) / value, self.max)
+            cumulative += value
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": round(self.sum / self.count, 4) if self.count else 0.0,
+            "p50": round(self.quantile(0.50), 4),
+            "p95": round(self.quantile(0.95), 4),
+            "p99": round(self.quantile(0.99), 4)
+        }
+
+class PerformanceMetrics:
+    """Метрики запросов: гистограмма на каждую серию (endpoint, стратегия, статус) и на каждую стадию"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, str, str], LatencyHistogram] = {}
+        self._stages: Dict[str, LatencyHistogram] = {}
+        self._prompt_tokens = {part: LatencyHistogram(TOKEN_BUCKETS) for part in ("prompt", "sources", "history")}
+        # Задержка LLM в разрезе размера промпта (по верхней границе корзины токенов)
+        self._llm_by_prompt_size: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+        self.error_count = 0
+        self.success_count = 0
+
+    def record_request(self, endpoint: str, status_code: int, duration: float, strategy: Optional[str] = None):
+        key = (endpoint, strategy or "none", str(status_code))
+        with self._lock:
+            histogram = self._series.get(key)
+            if histogram is None:
+                histogram = self._series[key] = LatencyHistogram(self.buckets)
+            histogram.observe(duration)
+            if status_code < 400:
+                self.success_count += 1
+            else:
+                self.error_count += 1
+
+    def record_stages(self, stages: Dict[str, float]):
+        """Время стадий одного запроса (секунды) - в гистограмму по каждой стадии"""
+        with self._lock:
+            for name, seconds in stages.items():
+                histogram = self._stages.get(name)
+                if histogram is None:
+                    histogram = self._stages[name] = LatencyHistogram(self.buckets)
+                histogram.observe(seconds)
+
+    def record_prompt(self, prompt_tokens: int, source_tokens: int, history_tokens: int,
+                      llm_seconds: Optional[float] = None):
+        with self._lock:
+            self._prompt_tokens["prompt"].observe(prompt_tokens)
+            self._prompt_tokens["sources"].observe(source_tokens)
+            self._prompt_tokens["history"].observe(history_tokens)
+            if llm_seconds is not None:
+                size = _bucket_label(TOKEN_BUCKETS, prompt_tokens)
+                histogram = self._llm_by_prompt_size.get(size)
+                if histogram is None:
+                    histogram = self._llm_by_prompt_size[size] = LatencyHistogram(self.buckets)
+                histogram.observe(llm_seconds)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            series = list(self._series.items())
+            stages = {name: histogram.summary() for name, histogram in sorted(self._stages.items())}
+            prompt_tokens = {part: histogram.summary() for part, histogram in self._prompt_tokens.items()}
+            prompt_tokens["llm_latency_by_prompt_size"] = {
+                size: self._llm_by_prompt_size[size].summary()
+                for size in sorted(self._llm_by_prompt_size, key=_bucket_sort_key)
+            }
+            success_count, error_count = self.success_count, self.error_count
+
+        overall = self._merged(series, lambda key: "all")["all"] if series else LatencyHistogram(self.buckets)
+        total_requests = success_count + error_count
+
+        return {
+            "average_response_time": round(overall.sum / overall.count, 2) if overall.count else 0,
+            "success_rate": round(success_count / total_requests, 2) if total_requests else 1.0,
+            "total_requests": total_requests,
+            "error_count": error_count,
+            "latency": {
+                "overall": overall.summary(),
+                "by_endpoint": self._summaries(series, lambda key: key[0]),
+                "by_strategy": self._summaries(series, lambda key: key[1]),
+                "by_status": self._summaries(series, lambda key: key[2])
+            },
+            "stages": stages,
+            "prompt_tokens": prompt_tokens
+        }
+
+    def prometheus(self, prefix: str = "rag") -> str:
+        """Текстовый формат экспозиции Prometheus"""
+        with self._lock:
+            series = sorted((key, list(h.counts), h.sum, h.count) for key, h in self._series.items())
+            stages = sorted((name, list(h.counts), h.sum, h.count) for name, h in self._stages.items())
+            tokens = [(part, list(h.counts), h.sum, h.count) for part, h in self._prompt_tokens.items()]
+            llm = sorted(
+                ((size, list(h.counts), h.sum, h.count) for size, h in self._llm_by_prompt_size.items()),
+                key=lambda item: _bucket_sort_key(item[0])
+            )
+
+        name = f"{prefix}_request_duration_seconds"
+        lines = [
+            f"# HELP {name} Request latency by endpoint, RAG strategy and status.",
+            f"# TYPE {name} histogram"
+        ]
+        for (endpoint, strategy, status), counts, total, count in series:
+            method, _, path = endpoint.partition(" ")
+            labels = (
+                f'method="{_escape(method)}",endpoint="{_escape(path or method)}",'
+                f'strategy="{_escape(strategy)}",status="{status}"'
+            )
+            lines.extend(self._histogram_lines(name, labels, counts, total, count))
+
+        name = f"{prefix}_stage_duration_seconds"
+        lines.append(f"# HELP {name} Time spent in each query pipeline stage.")
+        lines.append(f"# TYPE {name} histogram")
+        for stage_name, counts, total, count in stages:
+            lines.extend(self._histogram_lines(name, f'stage="{_escape(stage_name)}"', counts, total, count))
+
+        name = f"{prefix}_prompt_tokens"
+        lines.append(f"# HELP {name} Estimated prompt size in tokens (whole prompt, sources, history).")
+        lines.append(f"# TYPE {name} histogram")
+        for part, counts, total, count in tokens:
+            lines.extend(self._histogram_lines(name, f'part="{part}"', counts, total, count, TOKEN_BUCKETS))
+
+        name = f"{prefix}_llm_duration_seconds"
+        lines.append(f"# HELP {name} LLM call latency by prompt size bucket.")
+        lines.append(f"# TYPE {name} histogram")
+        for size, counts, total, count in llm:
+            lines.extend(self._histogram_lines(name, f'prompt_tokens="{size}"', counts, total, count))
+        return "\n".join(lines) + "\n"
+
+    def _histogram_lines(self, name: str, labels: str, counts: List[int], total: float, count: int,
+                         buckets: Optional[Tuple[float, ...]] = None) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, value in zip(buckets or self.buckets, counts):
+            cumulative += value
+            lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {total:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {count}")
+        return lines
+
+    def _merged(self, series: List, label) -> Dict[str, LatencyHistogram]:
+        merged = {}
+        for key, histogram in series:
+            target = merged.get(label(key))
+            if target is None:
+                target = merged[label(key)] = LatencyHistogram(self.buckets)
+            target.merge(histogram)
+        return merged
+
+    def _summaries(self, series: List, label) -> Dict[str, Dict[str, Any]]:
+        return {name: histogram.summary() for name, histogram in sorted(self._merged(series, label).items())}
+
+def _bucket_label(buckets: Tuple[float, ...], value: float) -> str:
+    index = bisect_left(buckets, value)
+    return f"<={buckets[index]:g}" if index < len(buckets) else f">{buckets[-1]:g}"
+
+def _bucket_sort_key(label: str) -> float:
+    value = float(label.lstrip("<=>"))
+    return value + 0.5 if label.startswith(">") else value
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+metrics = PerformanceMetrics()
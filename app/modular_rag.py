@@ -1,175 +1,333 @@
-from enum import Enum
-from typing import List, Dict, Any
-import logging
-from app.database import vector_db
-from app.config import TOP_K_RESULTS
-
-logger = logging.getLogger(__name__)
-
-class RAGStrategy(Enum):
-    BASIC = "basic"
-    HIERARCHICAL = "hierarchical" 
-    HYBRID = "hybrid"
-    ADAPTIVE = "adaptive"
-
-class ModularRAG:
-    def __init__(self):
-        self.strategies = {
-            RAGStrategy.BASIC: self._basic_rag,
-            RAGStrategy.HIERARCHICAL: self._hierarchical_rag,
-            RAGStrategy.HYBRID: self._hybrid_rag,
-            RAGStrategy.ADAPTIVE: self._adaptive_rag
-        }
-    
-    def execute_rag(self, question: str, strategy: RAGStrategy = RAGStrategy.BASIC, **kwargs):
-        if isinstance(strategy, str):
-            strategy = RAGStrategy(strategy.lower())
-        
-        if strategy not in self.strategies:
-            raise ValueError(f"Unknown strategy: {strategy}")
-        
-        logger.info(f"Executing {strategy.value} RAG for: {question}")
-        
-        # ПРАВИЛЬНЫЙ ВЫЗОВ ДЛЯ КАЖДОЙ СТРАТЕГИИ
-        if strategy == RAGStrategy.HIERARCHICAL:
-            return self._hierarchical_rag(
-                question, 
-                broad_top_k=10, 
-                final_top_k=kwargs.get('top_k', 3)
-            )
-        else:
-            return self.strategies[strategy](question, **kwargs)
-    
-    def _basic_rag(self, question: str, top_k: int = TOP_K_RESULTS) -> Dict[str, Any]:
-        results = vector_db.search(question, top_k=top_k)
-        return {
-            "documents": results['documents'][0] if results['documents'] else [],
-            "metadatas": results['metadatas'][0] if results['metadatas'] else [],
-            "strategy": "basic",
-            "search_type": "semantic"
-        }
-    
-    def _hierarchical_rag(self, question: str, broad_top_k: int = 10, final_top_k: int = 3) -> Dict[str, Any]:
-        broad_results = vector_db.search(question, top_k=broad_top_k)
-        
-        if not broad_results['documents']:
-            return {"documents": [], "metadatas": [], "strategy": "hierarchical", "search_type": "two_stage"}
-        
-        reranked_docs = self._rerank_documents(question, broad_results['documents'][0])
-        
-        final_docs = reranked_docs[:final_top_k]
-        final_metadatas = broad_results['metadatas'][0][:final_top_k] if broad_results['metadatas'] else []
-        
-        return {
-            "documents": final_docs,
-            "metadatas": final_metadatas,
-            "strategy": "hierarchical", 
-            "search_type": "two_stage"
-        }
-    
-    def _hybrid_rag(self, question: str, top_k: int = TOP_K_RESULTS, alpha: float = 0.5) -> Dict[str, Any]:
-        semantic_results = vector_db.search(question, top_k=top_k)
-        
-        keywords = self._extract_keywords(question)
-        
-        if keywords:
-            keyword_results = self._keyword_search(keywords, top_k=top_k)
-            
-            combined_results = self._merge_results(semantic_results, keyword_results, alpha)
-            return {
-                **combined_results,
-                "strategy": "hybrid",
-                "search_type": "semantic_keyword"
-            }
-        
-        return {
-            **semantic_results,
-            "strategy": "hybrid",
-            "search_type": "semantic_only"
-        }
-    
-    def _adaptive_rag(self, question: str, top_k: int = TOP_K_RESULTS) -> Dict[str, Any]:
-        question_complexity = self._assess_question_complexity(question)
-        
-        if question_complexity == "simple":
-            return self._basic_rag(question, top_k)
-        elif question_complexity == "medium":
-            return self._hybrid_rag(question, top_k)
-        else:
-            return self._hierarchical_rag(question, broad_top_k=15, final_top_k=top_k)
-    
-    def _rerank_documents(self, question: str, documents: List[str]) -> List[str]:
-        scored_docs = []
-        for doc in documents:
-            score = sum(1 for word in question.lower().split() if word in doc.lower())
-            scored_docs.append((score, doc))
-        
-        scored_docs.sort(key=lambda x: x[0], reverse=True)
-        return [doc for _, doc in scored_docs]
-    
-    def _extract_keywords(self, question: str) -> List[str]:
-        stop_words = {"what", "is", "the", "a", "an", "in", "on", "at", "to", "for", "of", "with", "by"}
-        words = question.lower().split()
-        keywords = [word for word in words if len(word) > 3 and word not in stop_words]
-        return keywords[:5]
-    
-    def _keyword_search(self, keywords: List[str], top_k: int) -> Dict[str, Any]:
-        try:
-            # ЗАМЕНИ $contains на $in
-            filter_conditions = {
-                "$or": [
-                    {"title": {"$in": keywords}} for keyword in keywords
-                ] + [
-                    {"abstract": {"$in": keywords}} for keyword in keywords
-                ]
-            }
-            
-            dummy_query = " ".join(keywords)
-            results = vector_db.search(dummy_query, top_k=top_k, filter_metadata=filter_conditions)
-            return results
-            
-        except Exception as e:
-            logger.warning(f"Keyword search failed: {e}")
-            return {"documents": [], "metadatas": []}
-    
-    def _merge_results(self, results1: Dict, results2: Dict, alpha: float) -> Dict[str, Any]:
-        docs1 = results1.get('documents', [[]])[0]
-        docs2 = results2.get('documents', [[]])[0]
-        metas1 = results1.get('metadatas', [[]])[0]
-        metas2 = results2.get('metadatas', [[]])[0]
-        
-        seen_docs = set()
-        merged_docs = []
-        merged_metas = []
-        
-        for doc, meta in zip(docs1, metas1):
-            if doc not in seen_docs:
-                seen_docs.add(doc)
-                merged_docs.append(doc)
-                merged_metas.append(meta)
-        
-        for doc, meta in zip(docs2, metas2):
-            if doc not in seen_docs and len(merged_docs) < len(docs1) + len(docs2):
-                seen_docs.add(doc)
-                merged_docs.append(doc)
-                merged_metas.append(meta)
-        
-        return {
-            "documents": [merged_docs],
-            "metadatas": [merged_metas]
-        }
-    
-    def _assess_question_complexity(self, question: str) -> str:
-        question_lower = question.lower()
-        
-        simple_indicators = {"what", "who", "when", "where"}
-        complex_indicators = {"how", "why", "compare", "difference", "advantages", "disadvantages"}
-        
-        if any(indicator in question_lower for indicator in complex_indicators):
-            return "complex"
-        elif any(indicator in question_lower for indicator in simple_indicators):
-            return "medium"
-        else:
-            return "simple"
-
+from enum import Enum
+from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
+import logging
+import threading
+from app.database import vector_db
+from app.bm25 import keyword_searcher
+from app.reranker import reranker
+from app.timing import stage
+from app.deadline import Deadline, current_deadline
+from app.config import TOP_K_RESULTS, RETRIEVAL_MAX_WORKERS, HYBRID_FUSION_METHOD, RRF_K, DEADLINE_LLM_RESERVE
+
+logger = logging.getLogger(__name__)
+
+class RAGStrategy(Enum):
+    BASIC = "basic"
+    HIERARCHICAL = "hierarchical" 
+    HYBRID = "hybrid"
+    ADAPTIVE = "adaptive"
+
+class ModularRAG:
+    def __init__(self):
+        self.strategies = {
+            RAGStrategy.BASIC: self._basic_rag,
+            RAGStrategy.HIERARCHICAL: self._hierarchical_rag,
+            RAGStrategy.HYBRID: self._hybrid_rag,
+            RAGStrategy.ADAPTIVE: self._adaptive_rag
+        }
+        # Пул создаётся при первом запросе: потоки не переживают fork
+        self._executor = None
+        self._executor_lock = threading.Lock()
+    
+    def execute_rag(self, question: str, strategy: RAGStrategy = RAGStrategy.BASIC,
+                    deadline: Optional[Deadline] = None, **kwargs):
+        if isinstance(strategy, str):
+            strategy = RAGStrategy(strategy.lower())
+        
+        if strategy not in self.strategies:
+            raise ValueError(f"Unknown strategy: {strategy}")
+        
+        logger.info(f"Executing {strategy.value} RAG for: {question}")
+        # По умолчанию - срок текущего запроса; запрос мог истечь, пока ждал поток пула
+        deadline = deadline or current_deadline()
+        deadline.check("retrieval")
+        
+        # ПРАВИЛЬНЫЙ ВЫЗОВ ДЛЯ КАЖДОЙ СТРАТЕГИИ
+        if strategy == RAGStrategy.HIERARCHICAL:
+            return self._hierarchical_rag(
+                question, 
+                broad_top_k=10, 
+                final_top_k=kwargs.get('top_k', 3),
+                search_results=kwargs.get('search_results'),
+                deadline=deadline
+            )
+        else:
+            return self.strategies[strategy](question, deadline=deadline, **kwargs)
+    
+    def execute_rag_batch(self, questions: List[str], strategy: RAGStrategy = RAGStrategy.BASIC,
+                          top_k: int = TOP_K_RESULTS, deadline: Optional[Deadline] = None) -> List[Any]:
+        """RAG для пачки вопросов: векторный поиск по всем вопросам одним запросом к коллекции.
+        
+        Возвращает результаты в порядке вопросов; на месте упавшего вопроса - исключение.
+        """
+        if isinstance(strategy, str):
+            strategy = RAGStrategy(strategy.lower())
+        if not questions:
+            return []
+        deadline = deadline or current_deadline()
+        deadline.check("retrieval")
+        
+        # Один запрос с максимальным числом кандидатов; каждой стратегии отдаём её префикс
+        candidate_k = max(self._candidate_k(question, strategy, top_k) for question in questions)
+        searches = vector_db.search_batch(questions, top_k=candidate_k)
+        
+        results = []
+        for question, search_results in zip(questions, searches):
+            try:
+                results.append(self.execute_rag(question, strategy, deadline=deadline, top_k=top_k,
+                                                search_results=search_results))
+            except Exception as e:
+                logger.error(f"Batch RAG failed for '{question}': {e}")
+                results.append(e)
+        return results
+    
+    async def execute_rag_async(self, question: str, strategy: RAGStrategy = RAGStrategy.BASIC, **kwargs):
+        # Поиск блокирующий, поэтому уводим его с event loop в ограниченный пул
+        return await self.run_blocking(self.execute_rag, question, strategy, **kwargs)
+    
+    async def run_blocking(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Копируем контекст, чтобы замеры стадий из потока попали в текущий запрос
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self.executor,
+            functools.partial(context.run, func, *args, **kwargs)
+        )
+    
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=RETRIEVAL_MAX_WORKERS,
+                        thread_name_prefix="rag-retrieval"
+                    )
+        return self._executor
+    
+    def close(self, wait: bool = True):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+    
+    def _basic_rag(self, question: str, top_k: int = TOP_K_RESULTS, search_results: Dict = None,
+                   deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        results = self._vector_search(question, top_k, search_results)
+        hits = self._ranked_hits(results)
+        return {
+            "ids": [hit["id"] for hit in hits],
+            "documents": [hit["document"] for hit in hits],
+            "metadatas": [hit["metadata"] for hit in hits],
+            "scores": [hit["score"] for hit in hits],
+            "strategy": "basic",
+            "search_type": "semantic"
+        }
+    
+    def _hierarchical_rag(self, question: str, broad_top_k: int = 10, final_top_k: int = 3,
+                          search_results: Dict = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        broad_results = self._vector_search(question, broad_top_k, search_results)
+        hits = self._ranked_hits(broad_results)
+        
+        if not hits:
+            return {"documents": [], "metadatas": [], "strategy": "hierarchical", "search_type": "two_stage"}
+        
+        if self._has_budget(deadline, "rerank"):
+            # Документы, метаданные и скоры переставляются вместе
+            with stage("rerank"):
+                final_hits = reranker.rerank(question, hits)[:final_top_k]
+        else:
+            final_hits = hits[:final_top_k]
+        
+        return {
+            "ids": [hit["id"] for hit in final_hits],
+            "documents": [hit["document"] for hit in final_hits],
+            "metadatas": [hit["metadata"] for hit in final_hits],
+            "scores": [hit["score"] for hit in final_hits],
+            "strategy": "hierarchical", 
+            "search_type": "two_stage"
+        }
+    
+    def _hybrid_rag(self, question: str, top_k: int = TOP_K_RESULTS, alpha: float = 0.5,
+                    search_results: Dict = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        # Каждая ветка даёт больше кандидатов, чем нужно; после слияния режем до top_k
+        candidate_k = top_k * 2
+        semantic_results = self._vector_search(question, candidate_k, search_results)
+        
+        keywords = self._extract_keywords(question)
+        
+        if keywords and self._has_budget(deadline, "keyword search"):
+            with stage("keyword_search"):
+                keyword_results = self._keyword_search(question, top_k=candidate_k)
+            
+            with stage("merge"):
+                combined_results = self._merge_results(semantic_results, keyword_results, alpha, top_k=top_k)
+            return {
+                **combined_results,
+                "strategy": "hybrid",
+                "search_type": "semantic_keyword"
+            }
+        
+        semantic_hits = self._ranked_hits(semantic_results)[:top_k]
+        return {
+            "ids": [hit["id"] for hit in semantic_hits],
+            "documents": [hit["document"] for hit in semantic_hits],
+            "metadatas": [hit["metadata"] for hit in semantic_hits],
+            "scores": [hit["score"] for hit in semantic_hits],
+            "strategy": "hybrid",
+            "search_type": "semantic_only"
+        }
+    
+    def _adaptive_rag(self, question: str, top_k: int = TOP_K_RESULTS, search_results: Dict = None,
+                      deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        question_complexity = self._assess_question_complexity(question)
+        
+        if question_complexity == "simple":
+            return self._basic_rag(question, top_k, search_results=search_results, deadline=deadline)
+        elif question_complexity == "medium":
+            return self._hybrid_rag(question, top_k, search_results=search_results, deadline=deadline)
+        else:
+            return self._hierarchical_rag(question, broad_top_k=15, final_top_k=top_k, search_results=search_results,
+                                          deadline=deadline)
+    
+    def _has_budget(self, deadline: Optional[Deadline], step: str) -> bool:
+        # Опциональный шаг поиска не должен съесть время, нужное на генерацию ответа
+        deadline = deadline or current_deadline()
+        deadline.check(step)
+        if deadline.allows(DEADLINE_LLM_RESERVE):
+            return True
+        logger.info(f"Skipping {step}: {deadline.remaining():.1f}s left before deadline")
+        return False
+    
+    def _candidate_k(self, question: str, strategy: RAGStrategy, top_k: int) -> int:
+        # Сколько кандидатов векторного поиска нужно стратегии (см. сами стратегии)
+        if strategy == RAGStrategy.ADAPTIVE:
+            strategy = {
+                "simple": RAGStrategy.BASIC,
+                "medium": RAGStrategy.HYBRID
+            }.get(self._assess_question_complexity(question))
+            if strategy is None:
+                return 15
+        if strategy == RAGStrategy.HIERARCHICAL:
+            return 10
+        if strategy == RAGStrategy.HYBRID:
+            return top_k * 2
+        return top_k
+    
+    def _vector_search(self, question: str, top_k: int, search_results: Dict = None) -> Dict:
+        # Готовый результат пакетного поиска уже отсортирован по близости - берём префикс
+        if search_results is None:
+            return vector_db.search(question, top_k=top_k)
+        return {field: [values[0][:top_k]] for field, values in search_results.items() if values}
+    
+    def _extract_keywords(self, question: str) -> List[str]:
+        stop_words = {"what", "is", "the", "a", "an", "in", "on", "at", "to", "for", "of", "with", "by"}
+        words = question.lower().split()
+        keywords = [word for word in words if len(word) > 3 and word not in stop_words]
+        return keywords[:5]
+    
+    def _keyword_search(self, question: str, top_k: int) -> Dict[str, Any]:
+        # BM25 по названию и аннотации; индекс собирается при загрузке данных
+        try:
+            ids, scores = keyword_searcher.search(question, top_k=top_k)
+            if not ids:
+                return {"ids": [[]], "documents": [[]], "metadatas": [[]], "scores": [[]]}
+            
+            found = vector_db.get_documents(ids)
+            score_by_id = dict(zip(ids, scores))
+            return {
+                "ids": [found["ids"]],
+                "documents": [found["documents"]],
+                "metadatas": [found["metadatas"]],
+                "scores": [[score_by_id[doc_id] for doc_id in found["ids"]]]
+            }
+            
+        except Exception as e:
+            logger.warning(f"Keyword search failed: {e}")
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "scores": [[]]}
+    
+    def _merge_results(self, results1: Dict, results2: Dict, alpha: float,
+                       top_k: int = TOP_K_RESULTS, method: str = HYBRID_FUSION_METHOD) -> Dict[str, Any]:
+        # results1 - семантический поиск (вес alpha), results2 - keyword (вес 1 - alpha)
+        ranked_lists = [
+            (self._ranked_hits(results1), alpha),
+            (self._ranked_hits(results2), 1.0 - alpha)
+        ]
+        
+        fused_scores = {}
+        hits_by_key = {}
+        for hits, weight in ranked_lists:
+            if method == "weighted":
+                contributions = self._normalize_scores([hit["score"] for hit in hits])
+            else:
+                contributions = [1.0 / (RRF_K + rank + 1) for rank in range(len(hits))]
+            
+            for hit, contribution in zip(hits, contributions):
+                hits_by_key.setdefault(hit["key"], hit)
+                fused_scores[hit["key"]] = fused_scores.get(hit["key"], 0.0) + weight * contribution
+        
+        # При равенстве скоров сохраняется порядок появления (сначала семантика)
+        ranked_keys = sorted(fused_scores, key=lambda key: fused_scores[key], reverse=True)[:top_k]
+        
+        return {
+            "ids": [hits_by_key[key]["id"] for key in ranked_keys],
+            "documents": [hits_by_key[key]["document"] for key in ranked_keys],
+            "metadatas": [hits_by_key[key]["metadata"] for key in ranked_keys],
+            "scores": [round(fused_scores[key], 6) for key in ranked_keys]
+        }
+    
+    def _ranked_hits(self, results: Dict) -> List[Dict[str, Any]]:
+        # Приводит ответ Chroma (вложенные списки на один запрос) к плоскому списку попаданий
+        def first(field):
+            values = results.get(field) or [[]]
+            return values[0] if values else []
+        
+        documents = first('documents')
+        metadatas = first('metadatas')
+        ids = first('ids')
+        scores = first('scores')
+        distances = first('distances')
+        
+        hits = []
+        for i, document in enumerate(documents):
+            if i < len(scores):
+                score = scores[i]
+            elif i < len(distances):
+                score = 1.0 - distances[i]
+            else:
+                score = 0.0
+            doc_id = ids[i] if i < len(ids) else None
+            hits.append({
+                "key": doc_id or document,
+                "id": doc_id,
+                "document": document,
+                "metadata": metadatas[i] if i < len(metadatas) else {},
+                "score": score
+            })
+        return hits
+    
+    def _normalize_scores(self, scores: List[float]) -> List[float]:
+        if not scores:
+            return []
+        low, high = min(scores), max(scores)
+        if high == low:
+            return [1.0] * len(scores)
+        return [(score - low) / (high - low) for score in scores]
+    
+    def _assess_question_complexity(self, question: str) -> str:
+        question_lower = question.lower()
+        
+        simple_indicators = {"what", "who", "when", "where"}
+        complex_indicators = {"how", "why", "compare", "difference", "advantages", "disadvantages"}
+        
+        if any(indicator in question_lower for indicator in complex_indicators):
+            return "complex"
+        elif any(indicator in question_lower for indicator in simple_indicators):
+            return "medium"
+        else:
+            return "simple"
+
 modular_rag = ModularRAG()
\ No newline at end of file
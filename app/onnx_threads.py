@@ -0,0 +1,32 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+def configure_onnx_threads(threads: int):
+    """Ограничивает intra-op потоки ONNX Runtime для сессий, созданных после вызова.
+
+    Chroma создаёт сессию модели эмбеддингов сама и не даёт передать
+    SessionOptions, поэтому onnxruntime.SessionOptions подменяется
+    подклассом на весь процесс. Подкласс меняет только значения по
+    умолчанию: явно заданные вызывающим настройки и isinstance работают
+    как прежде. В процессах приложения (воркер API, процесс пула загрузки)
+    других сессий ONNX, кроме модели эмбеддингов, нет.
+    """
+    if threads <= 0:
+        return
+    try:
+        import onnxruntime
+    except ImportError:
+        return
+    base_options = getattr(onnxruntime, "_base_session_options", onnxruntime.SessionOptions)
+
+    class LimitedSessionOptions(base_options):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.intra_op_num_threads = threads
+            self.inter_op_num_threads = 1
+
+    # Повторный вызов наследует от исходного класса, а не от прошлой подмены
+    onnxruntime._base_session_options = base_options
+    onnxruntime.SessionOptions = LimitedSessionOptions
+    logger.info(f"ONNX Runtime sessions limited to {threads} intra-op threads in this process")
@@ -0,0 +1,200 @@
+from typing import Dict, Any, Optional, Tuple
+import logging
+import math
+import threading
+import time
+import redis.asyncio as aioredis
+from fastapi import HTTPException, Request
+from app.config import (
+    REDIS_URL, REDIS_MAX_CONNECTIONS, RATE_LIMIT_BACKEND, RATE_LIMIT_LLM, RATE_LIMIT_CHEAP,
+    RATE_LIMIT_KEY, RATE_LIMIT_PROXY_HOPS
+)
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Атомарный token bucket: пополнение, списание и TTL за один EVALSHA.
+# Время берём у Redis, чтобы расхождение часов воркеров не влияло на лимит
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(tokens), tostring(retry_after)}
+"""
+
+def parse_rate(rate: str) -> Tuple[int, float]:
+    """"10/minute" -> (ёмкость 10, пополнение токенов в секунду)"""
+    amount, _, period = rate.partition("/")
+    period = period.strip().rstrip("s")
+    if period not in PERIODS:
+        raise ValueError(f"Unknown rate limit period: {rate}")
+    capacity = int(amount)
+    return capacity, capacity / PERIODS[period]
+
+class InMemoryBuckets:
+    """Token bucket в памяти процесса (лимит на воркер)"""
+
+    MAX_KEYS = 100_000
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, capacity: int, rate: float, cost: int) -> Tuple[bool, float, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+            allowed = tokens >= cost
+            retry_after = 0.0 if allowed else (cost - tokens) / rate
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now, capacity, rate)
+        return allowed, tokens, retry_after
+
+    def _prune(self, now: float, capacity: int, rate: float):
+        # Бакет, который успел наполниться, ничем не отличается от отсутствующего
+        refill = capacity / rate
+        for key in [key for key, (_, ts) in self._buckets.items() if now - ts >= refill]:
+            del self._buckets[key]
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+    async def close(self):
+        pass
+
+class RedisBuckets:
+    """Token bucket в Redis: один лимит на всех воркерах и репликах"""
+
+    def __init__(self, url: str, max_connections: int = REDIS_MAX_CONNECTIONS, client=None):
+        if client is None:
+            client = aioredis.Redis.from_pool(
+                aioredis.ConnectionPool.from_url(url, max_connections=max_connections)
+            )
+        self.client = client
+        self.script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def take(self, key: str, capacity: int, rate: float, cost: int) -> Tuple[bool, float, float]:
+        allowed, tokens, retry_after = await self.script(keys=[key], args=[capacity, rate, cost])
+        return bool(allowed), float(tokens), float(retry_after)
+
+    async def close(self):
+        await self.client.aclose()
+
+class RateLimiter:
+    """Лимиты запросов по бакетам: "llm" для эндпоинтов с вызовом LLM, "cheap" для остальных.
+
+    Используется как зависимость FastAPI: dependencies=[Depends(limiter.bucket("llm"))].
+    При недоступности Redis запрос пропускается: лимитер не должен ронять API.
+    """
+
+    def __init__(self, backend: str = RATE_LIMIT_BACKEND, redis_url: Optional[str] = REDIS_URL,
+                 rates: Optional[Dict[str, str]] = None, key: str = RATE_LIMIT_KEY,
+                 proxy_hops: int = RATE_LIMIT_PROXY_HOPS):
+        self.enabled = True
+        self.key = key
+        self.proxy_hops = proxy_hops
+        rates = rates or {"llm": RATE_LIMIT_LLM, "cheap": RATE_LIMIT_CHEAP}
+        self.rates = {name: parse_rate(rate) for name, rate in rates.items()}
+        if backend == "redis" and redis_url:
+            self.backend = RedisBuckets(redis_url)
+        else:
+            if backend == "redis":
+                logger.warning("RATE_LIMIT_BACKEND=redis, but REDIS_URL is not set. Limits are per worker.")
+            self.backend = InMemoryBuckets()
+
+        self.allowed = 0
+        self.rejected = 0
+        self.errors = 0
+
+    def bucket(self, name: str, cost: int = 1):
+        capacity, rate = self.rates[name]
+
+        async def check(request: Request):
+            if not self.enabled:
+                return
+            start = time.perf_counter()
+            try:
+                allowed, _, retry_after = await self.backend.take(
+                    f"ratelimit:{name}:{self.client_key(request)}", capacity, rate, cost
+                )
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Rate limiter unavailable, allowing request: {e}")
+                return
+            finally:
+                metrics.record_stages({"rate_limit": time.perf_counter() - start})
+
+            if allowed:
+                self.allowed += 1
+                return
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail=f"Rate limit exceeded: {capacity} requests per {capacity / rate:g}s ({name})",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+
+        return check
+
+    def client_key(self, request: Request) -> str:
+        if self.key == "api_key":
+            api_key = request.headers.get("x-api-key")
+            if api_key:
+                return f"key:{api_key}"
+        elif self.key == "session":
+            session_id = request.headers.get("x-session-id") or request.query_params.get("session_id")
+            # "default" - общий session_id по умолчанию, по нему клиентов не различить
+            if session_id and session_id != "default":
+                return f"session:{session_id}"
+        return f"ip:{self.client_ip(request)}"
+
+    def client_ip(self, request: Request) -> str:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded and self.proxy_hops:
+            # Каждый доверенный прокси дописывает адрес справа; левее - то, что мог подделать клиент
+            addresses = [address.strip() for address in forwarded.split(",") if address.strip()]
+            if addresses:
+                return addresses[max(0, len(addresses) - self.proxy_hops)]
+        return request.client.host if request.client else "unknown"
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis" if isinstance(self.backend, RedisBuckets) else "memory",
+            "key": self.key,
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "errors": self.errors
+        }
+
+    def reset(self):
+        """Сбрасывает in-process бакеты (общие в Redis не трогаем)"""
+        if isinstance(self.backend, InMemoryBuckets):
+            self.backend.reset()
+
+    async def close(self):
+        await self.backend.close()
+
+limiter = RateLimiter()
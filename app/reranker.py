@@ -0,0 +1,145 @@
+from collections import Counter
+from typing import Dict, Any, List
+import logging
+import threading
+import time
+import numpy as np
+from app.bm25 import keyword_searcher, tokenize
+from app.config import (
+    RERANK_LEXICAL_WEIGHT, RERANK_CROSS_ENCODER_MODEL, RERANK_BATCH_SIZE, RERANK_LATENCY_BUDGET_MS, BM25_K1
+)
+
+logger = logging.getLogger(__name__)
+
+class Reranker:
+    """Переранжирование кандидатов для hierarchical RAG.
+
+    Лексический скор считается по BM25 индексу, собранному при загрузке
+    данных, сразу для всей пачки кандидатов. Опционально поверх него
+    работает CPU cross-encoder, ограниченный бюджетом времени.
+    """
+
+    def __init__(self, searcher=keyword_searcher, lexical_weight: float = RERANK_LEXICAL_WEIGHT,
+                 cross_encoder_model: str = RERANK_CROSS_ENCODER_MODEL, batch_size: int = RERANK_BATCH_SIZE,
+                 latency_budget_ms: float = RERANK_LATENCY_BUDGET_MS):
+        self.searcher = searcher
+        self.lexical_weight = lexical_weight
+        self.cross_encoder_model = cross_encoder_model
+        self.batch_size = batch_size
+        self.latency_budget_ms = latency_budget_ms
+
+        self._cross_encoder = None
+        self._cross_encoder_failed = False
+        self._lock = threading.Lock()
+
+    def rerank(self, question: str, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Возвращает те же попадания (документ, метаданные, id вместе) в новом порядке со скором rerank"""
+        if not hits:
+            return []
+
+        lexical = self.lexical_scores(question, hits)
+        semantic = np.array([hit.get("score", 0.0) for hit in hits], dtype=np.float32)
+        combined = self.lexical_weight * _min_max(lexical) + (1.0 - self.lexical_weight) * semantic
+
+        # Стабильная сортировка: при равных скорах сохраняется порядок векторного поиска
+        order = np.argsort(-combined, kind="stable")
+        scores = combined
+
+        cross_encoder = self._get_cross_encoder()
+        if cross_encoder is not None:
+            order, scores = self._cross_encoder_rerank(cross_encoder, question, hits, order, combined)
+
+        return [{**hits[i], "score": float(scores[i])} for i in order]
+
+    def lexical_scores(self, question: str, hits: List[Dict[str, Any]]) -> np.ndarray:
+        query_terms = tokenize(question)
+        scores = np.zeros(len(hits), dtype=np.float32)
+        if not query_terms:
+            return scores
+
+        index = self.searcher.get_index() if self.searcher else None
+        if index is not None:
+            positions = index.doc_positions([hit.get("id") or "" for hit in hits])
+            scores = index.score_documents(query_terms, positions)
+            missing = np.flatnonzero(positions < 0)
+        else:
+            missing = np.arange(len(hits))
+
+        if len(missing):
+            # Документов нет в индексе (или индекса нет) - считаем tf по тексту на лету
+            scores[missing] = self._score_texts(query_terms, [hits[i]["document"] for i in missing], index)
+        return scores
+
+    def _score_texts(self, query_terms: List[str], documents: List[str], index) -> np.ndarray:
+        terms = sorted(set(query_terms))
+        counters = [Counter(tokenize(document)) for document in documents]
+        tf = np.array([[counter.get(term, 0) for term in terms] for counter in counters], dtype=np.float32)
+        lengths = np.array([sum(counter.values()) for counter in counters], dtype=np.float32)
+
+        if index is not None:
+            k1, b, avg_length = index.k1, index.meta["b"], index.avg_doc_length or 1.0
+            idf = np.array([index.idf(index.document_frequency(term) or 1) for term in terms], dtype=np.float32)
+        else:
+            k1, b, avg_length = BM25_K1, 0.75, float(lengths.mean()) or 1.0
+            idf = np.ones(len(terms), dtype=np.float32)
+
+        norms = (k1 * (1 - b + b * lengths / avg_length))[:, None]
+        return (idf * tf * (k1 + 1) / (tf + norms)).sum(axis=1)
+
+    def _cross_encoder_rerank(self, cross_encoder, question, hits, order, fallback_scores):
+        # Кросс-энкодер прогоняем пачками в порядке предварительного ранжирования,
+        # пока не кончится бюджет; непросчитанные кандидаты идут следом в прежнем порядке
+        deadline = time.perf_counter() + self.latency_budget_ms / 1000.0
+        scored = {}
+        for start in range(0, len(order), self.batch_size):
+            if time.perf_counter() >= deadline:
+                logger.info(f"Cross-encoder budget exhausted after {len(scored)}/{len(order)} candidates")
+                break
+            batch = order[start:start + self.batch_size]
+            try:
+                batch_scores = cross_encoder.predict(
+                    [(question, hits[i]["document"]) for i in batch], batch_size=self.batch_size
+                )
+            except Exception as e:
+                logger.warning(f"Cross-encoder failed: {e}")
+                break
+            scored.update(zip(batch.tolist(), np.asarray(batch_scores, dtype=np.float32).tolist()))
+
+        if not scored:
+            return order, fallback_scores
+
+        scored_order = sorted(scored, key=lambda i: scored[i], reverse=True)
+        rest = [i for i in order.tolist() if i not in scored]
+        scores = np.array(fallback_scores, dtype=np.float32)
+        # Логиты кросс-энкодера и предварительные скоры несравнимы: сводим логиты
+        # min-max в [floor + 1, floor + 2], выше лучшего непросчитанного кандидата,
+        # чтобы "score" убывал вдоль выдачи
+        floor = float(scores[rest].max()) if rest else 0.0
+        indices = np.array(list(scored), dtype=np.int64)
+        scores[indices] = floor + 1.0 + _min_max(np.array(list(scored.values()), dtype=np.float32))
+        return np.array(scored_order + rest), scores
+
+    def _get_cross_encoder(self):
+        if not self.cross_encoder_model or self._cross_encoder_failed:
+            return None
+        if self._cross_encoder is None:
+            with self._lock:
+                if self._cross_encoder is None and not self._cross_encoder_failed:
+                    try:
+                        from sentence_transformers import CrossEncoder
+                        self._cross_encoder = CrossEncoder(self.cross_encoder_model, device="cpu")
+                        logger.info(f"Cross-encoder loaded: {self.cross_encoder_model}")
+                    except Exception as e:
+                        logger.warning(f"Cross-encoder unavailable ({e}), using lexical reranking only")
+                        self._cross_encoder_failed = True
+        return self._cross_encoder
+
+def _min_max(values: np.ndarray) -> np.ndarray:
+    if len(values) == 0:
+        return values
+    low, high = float(values.min()), float(values.max())
+    if high == low:
+        return np.zeros_like(values)
+    return (values - low) / (high - low)
+
+reranker = Reranker()
@@ -0,0 +1,70 @@
+from typing import Dict, Any
+import asyncio
+import logging
+import os
+from app.database import vector_db
+from app.gemini_client import gemini_client
+from app.memory import conversation_memory
+from app.modular_rag import modular_rag
+from app.rate_limit import limiter
+from app.warmup import warmup, configure_threads
+
+logger = logging.getLogger(__name__)
+
+class Resources:
+    """Ресурсы процесса воркера API.
+
+    Синглтоны модулей создаются при импорте дёшево и подключаются при
+    первом использовании, то есть уже в воркере после fork. Контейнер
+    проверяет внешние зависимости при старте воркера (lifespan) и явно
+    закрывает клиенты и пулы при остановке.
+    """
+
+    def __init__(self):
+        self.pid = None
+
+    async def startup(self):
+        self.pid = os.getpid()
+        # До первого эмбеддинга: сессия ONNX читает число потоков при создании
+        configure_threads()
+        # ping Redis блокирующий - не держим им event loop
+        await asyncio.get_running_loop().run_in_executor(None, conversation_memory.connect)
+        logger.info(f"Worker {self.pid} started")
+        # Прогрев идёт в фоне: /health отвечает сразу, /ready - после прогрева
+        warmup.start()
+
+    async def shutdown(self):
+        await warmup.stop()
+        closers = (
+            ("conversation_memory", conversation_memory.close),
+            ("rate_limiter", limiter.close),
+            ("modular_rag", modular_rag.close),
+            ("gemini_client", gemini_client.close),
+            ("vector_db", vector_db.close)
+        )
+        for name, close in closers:
+            try:
+                result = close()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.error(f"Failed to close {name}: {e}")
+        logger.info(f"Worker {self.pid} resources closed")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "vector_db": vector_db.connected,
+            "gemini_client": gemini_client.initialized,
+            "retrieval_pool": modular_rag._executor is not None
+        }
+
+def _reset_after_fork():
+    # Клиенты и потоки, унаследованные от родителя (gunicorn --preload), в дочернем процессе не работают
+    vector_db.close()
+    gemini_client.close()
+    modular_rag.close(wait=False)
+
+resources = Resources()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,207 @@
+from typing import Dict, Any, Optional, Tuple
+import logging
+import threading
+import time
+import numpy as np
+from app.config import (
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL
+)
+from app.database import vector_db
+
+logger = logging.getLogger(__name__)
+
+class _ScopeIndex:
+    """Небольшой плоский индекс вопросов одной области (стратегия + top_k).
+
+    Массивы растут по мере заполнения: общий предел записей задаёт
+    SemanticCache, а не каждая область.
+    """
+
+    def __init__(self, dim: int, capacity: int = 16):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.expires = np.zeros(capacity, dtype=np.float64)
+        self.entries = [None] * capacity
+        self.size = 0
+
+    def search(self, query: np.ndarray, now: float) -> Tuple[int, float]:
+        if self.size == 0:
+            return -1, 0.0
+        # Векторы нормализованы, скалярное произведение = косинусное сходство
+        similarities = self.vectors[:self.size] @ query
+        similarities[self.expires[:self.size] <= now] = -1.0
+        best = int(np.argmax(similarities))
+        return best, float(similarities[best])
+
+    def expired_slot(self, now: float) -> int:
+        expired = np.flatnonzero(self.expires[:self.size] <= now)
+        return int(expired[0]) if expired.size else -1
+
+    def oldest_slot(self) -> int:
+        return int(np.argmin(self.last_used[:self.size])) if self.size else -1
+
+    def put(self, slot: int, vector: np.ndarray, entry: Dict[str, Any], tick: int, expires: float):
+        self.vectors[slot] = vector
+        self.entries[slot] = entry
+        self.last_used[slot] = tick
+        self.expires[slot] = expires
+
+    def append(self, vector: np.ndarray, entry: Dict[str, Any], tick: int, expires: float):
+        if self.size == len(self.entries):
+            self._grow()
+        self.put(self.size, vector, entry, tick, expires)
+        self.size += 1
+
+    def remove(self, slot: int):
+        """Освобождает слот, перенося на его место последнюю запись"""
+        last = self.size - 1
+        if slot != last:
+            self.put(slot, self.vectors[last], self.entries[last], self.last_used[last], self.expires[last])
+        self.entries[last] = None
+        self.size = last
+
+    def _grow(self):
+        capacity = len(self.entries) * 2
+        self.vectors = np.resize(self.vectors, (capacity, self.vectors.shape[1]))
+        self.last_used = np.resize(self.last_used, capacity)
+        self.expires = np.resize(self.expires, capacity)
+        self.entries.extend([None] * (capacity - len(self.entries)))
+
+class SemanticCache:
+    """Кэш ответов для перефразированных вопросов.
+
+    Вопрос эмбеддится той же функцией, что и коллекция ChromaDB, и
+    сравнивается с ранее отвеченными вопросами той же стратегии и top_k.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl: int = RESPONSE_CACHE_TTL, enabled: bool = SEMANTIC_CACHE_ENABLED, database=vector_db):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.database = database
+
+        self._scopes = {}
+        self._lock = threading.Lock()
+        self._tick = 0
+        self._version = None
+
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def lookup(self, question: str, strategy: str, top_k: int) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+
+        vector = self._embed(question)
+        if vector is None:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            self._check_version()
+            self.lookups += 1
+            scope = self._scopes.get((strategy, top_k))
+            if scope is None:
+                return None
+
+            slot, similarity = scope.search(vector, now)
+            if slot < 0 or similarity < self.threshold:
+                return None
+
+            self._tick += 1
+            scope.last_used[slot] = self._tick
+            self.hits += 1
+            entry = scope.entries[slot]
+
+        logger.info(f"Semantic cache hit ({similarity:.3f}): '{question}' ~ '{entry['question']}'")
+        return {**entry["response"], "similarity": round(similarity, 4)}
+
+    def store(self, question: str, strategy: str, top_k: int, response: Dict[str, Any]):
+        if not self.enabled:
+            return
+
+        vector = self._embed(question)
+        if vector is None:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            self._check_version()
+            scope = self._scopes.get((strategy, top_k))
+            if scope is None:
+                scope = _ScopeIndex(vector.shape[0])
+                self._scopes[(strategy, top_k)] = scope
+
+            self._tick += 1
+            entry = {"question": question, "response": response}
+            expires = now + self.ttl
+            # Сначала занимаем истёкшую запись своей области - это не вытеснение
+            slot = scope.expired_slot(now)
+            if slot >= 0:
+                scope.put(slot, vector, entry, self._tick, expires)
+                return
+            if self._size() >= self.max_entries and not self._release(now, scope):
+                return
+            scope.append(vector, entry, self._tick, expires)
+
+    def _size(self) -> int:
+        return sum(scope.size for scope in self._scopes.values())
+
+    def _release(self, now: float, target: _ScopeIndex) -> bool:
+        """Освобождает место под одну запись: истёкшую в любой области, иначе самую давнюю"""
+        for scope in self._scopes.values():
+            slot = scope.expired_slot(now)
+            if slot >= 0:
+                scope.remove(slot)
+                return True
+
+        victim, victim_slot = None, -1
+        for scope in self._scopes.values():
+            slot = scope.oldest_slot()
+            if slot >= 0 and (victim is None or scope.last_used[slot] < victim.last_used[victim_slot]):
+                victim, victim_slot = scope, slot
+        if victim is None:
+            # max_entries <= 0: кэшировать некуда
+            return False
+        victim.remove(victim_slot)
+        self.evictions += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            # Каждый промах ведёт к вызову LLM, поэтому доля попаданий и есть
+            # доля сэкономленных вызовов среди дошедших до этого слоя запросов
+            "llm_calls_saved_ratio": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+            "size": self._size(),
+            "evictions": self.evictions
+        }
+
+    def _embed(self, question: str) -> Optional[np.ndarray]:
+        try:
+            vector = self.database.embed_query(question)
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self):
+        version = self.database.get_collection_version()
+        if version != self._version:
+            if self._version is not None:
+                logger.info("Collection version changed, clearing semantic cache")
+            self._scopes.clear()
+            self._version = version
+
+semantic_cache = SemanticCache()
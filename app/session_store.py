@@ -0,0 +1,312 @@
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import logging
+import threading
+import time
+import redis.asyncio as aioredis
+from redis.exceptions import WatchError
+from app.config import (
+    CONVERSATION_TTL, CONVERSATION_MAX_TURNS, CONVERSATION_RECENT_TURNS, REDIS_MAX_CONNECTIONS, SESSION_MAX_COUNT, SESSION_MAX_BYTES,
+    SESSION_SWEEP_INTERVAL
+)
+from app.summarizer import fold_into_summary
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+def encode(value: Any) -> bytes:
+    """msgpack (компактнее и быстрее JSON), без него - компактный JSON"""
+    if msgpack is not None:
+        return msgpack.packb(value, use_bin_type=True)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def decode(payload: bytes) -> Any:
+    # JSON-объект начинается с "{", msgpack-словарь - никогда: читаем записи воркеров с любой кодировкой
+    if payload[:1] == b"{":
+        return json.loads(payload)
+    if msgpack is None:
+        raise ValueError("msgpack-encoded session record, but msgpack is not installed")
+    return msgpack.unpackb(payload, raw=False)
+
+def fold_turn(summary: str, conversation: Dict[str, Any]) -> str:
+    return fold_into_summary(summary, conversation["question"], conversation["answer"])
+
+def leaving_index(recent_turns: int, max_turns: int) -> int:
+    """Индекс реплики, которая при записи новой выходит из окна последних (-1 - сама новая)"""
+    return min(recent_turns, max_turns) - 1
+
+def _text_bytes(text: str) -> int:
+    return len(text.encode("utf-8")) if text else 0
+
+# Грубая оценка накладных расходов Python на запись (объекты, строки, deque)
+TURN_OVERHEAD_BYTES = 400
+SESSION_OVERHEAD_BYTES = 1000
+# Попыток записи реплики в Redis при одновременной записи в ту же сессию
+APPEND_MAX_ATTEMPTS = 10
+
+class Turn:
+    __slots__ = ("timestamp", "question", "answer", "sources", "size")
+
+    def __init__(self, conversation: Dict[str, Any]):
+        self.timestamp = conversation.get("timestamp")
+        self.question = conversation["question"]
+        self.answer = conversation["answer"]
+        self.sources = tuple(conversation.get("sources") or ())
+        self.size = TURN_OVERHEAD_BYTES + _text_bytes(self.question) + _text_bytes(self.answer) + sum(
+            _text_bytes(source) for source in self.sources
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"timestamp": self.timestamp, "question": self.question, "answer": self.answer,
+                "sources": list(self.sources)}
+
+class Session:
+    __slots__ = ("turns", "summary", "last_access", "size")
+
+    def __init__(self, max_turns: int):
+        # Новые реплики слева; maxlen сам выталкивает самую старую
+        self.turns = deque(maxlen=max_turns)
+        self.summary = ""
+        self.last_access = time.monotonic()
+        self.size = SESSION_OVERHEAD_BYTES
+
+class InMemoryConversationStore:
+    """Сессии в памяти процесса (один воркер) с ограничением по числу и объёму.
+
+    Сессии хранятся в порядке последнего обращения: при превышении
+    SESSION_MAX_COUNT или SESSION_MAX_BYTES вытесняются давно не
+    использованные, а простаивающие дольше TTL удаляет фоновый поток.
+    """
+
+    def __init__(self, max_turns: int = CONVERSATION_MAX_TURNS, max_sessions: int = SESSION_MAX_COUNT,
+                 max_bytes: int = SESSION_MAX_BYTES, ttl: int = CONVERSATION_TTL,
+                 sweep_interval: float = SESSION_SWEEP_INTERVAL, recent_turns: int = CONVERSATION_RECENT_TURNS):
+        self.max_turns = max_turns
+        self.recent_turns = recent_turns
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stop = threading.Event()
+
+        self.evicted = 0
+        self.expired = 0
+
+    async def append(self, session_id: str, conversation: Dict[str, Any]):
+        self._ensure_sweeper()
+        turn = Turn(conversation)
+        with self._lock:
+            session = self._touch(session_id)
+            if session is None:
+                session = self._sessions[session_id] = Session(self.max_turns)
+                self._bytes += session.size
+            # В сводку уходит только реплика, покидающая окно последних: остальные и так попадут в промпт
+            index = leaving_index(self.recent_turns, self.max_turns)
+            leaving = conversation if index < 0 else (
+                session.turns[index].as_dict() if index < len(session.turns) else None
+            )
+            if leaving is not None:
+                summary = fold_turn(session.summary, leaving)
+                self._resize(session, _text_bytes(summary) - _text_bytes(session.summary))
+                session.summary = summary
+            if len(session.turns) == session.turns.maxlen:
+                self._resize(session, -session.turns[-1].size)
+            session.turns.appendleft(turn)
+            self._resize(session, turn.size)
+            self._evict(keep=session_id)
+
+    async def history(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            session = self._touch(session_id)
+            return [turn.as_dict() for turn in islice(session.turns, limit)] if session else []
+
+    async def summary(self, session_id: str) -> str:
+        with self._lock:
+            session = self._touch(session_id)
+            return session.summary if session else ""
+
+    async def prompt_history(self, session_id: str, limit: int) -> Tuple[List[Dict[str, Any]], str]:
+        with self._lock:
+            session = self._touch(session_id)
+            if session is None:
+                return [], ""
+            return [turn.as_dict() for turn in islice(session.turns, limit)], session.summary
+
+    async def clear(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._bytes -= session.size
+
+    async def close(self):
+        self._stop.set()
+
+    def sweep(self) -> int:
+        """Удаляет сессии, простаивающие дольше TTL; возвращает их число"""
+        deadline = time.monotonic() - self.ttl
+        removed = 0
+        with self._lock:
+            # Порядок - по последнему обращению: просроченные лежат в начале
+            while self._sessions:
+                session_id, session = next(iter(self._sessions.items()))
+                if session.last_access > deadline:
+                    break
+                del self._sessions[session_id]
+                self._bytes -= session.size
+                removed += 1
+            self.expired += removed
+        return removed
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "turns": sum(len(session.turns) for session in self._sessions.values()),
+                "bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "evicted": self.evicted,
+                "expired": self.expired
+            }
+
+    def _touch(self, session_id: str) -> Optional[Session]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        now = time.monotonic()
+        if now - session.last_access > self.ttl:
+            # Просрочена, но фоновая очистка ещё не дошла
+            del self._sessions[session_id]
+            self._bytes -= session.size
+            self.expired += 1
+            return None
+        session.last_access = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _resize(self, session: Session, delta: int):
+        session.size += delta
+        self._bytes += delta
+
+    def _evict(self, keep: str):
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            session_id, session = self._sessions.popitem(last=False)
+            if session_id == keep:
+                # Только что записанную сессию не вытесняем
+                self._sessions[session_id] = session
+                break
+            self._bytes -= session.size
+            self.evicted += 1
+
+    def _ensure_sweeper(self):
+        # Поток заводим при первой записи, то есть уже в процессе воркера (после fork)
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._sweeper = threading.Thread(target=self._sweep_loop, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                removed = self.sweep()
+                if removed:
+                    logger.info(f"Expired {removed} idle sessions")
+            except Exception as e:
+                logger.error(f"Session sweep failed: {e}")
+
+class RedisConversationStore:
+    """Сессии в Redis, общие для всех воркеров API.
+
+    Асинхронный клиент с пулом соединений. Реплика записывается одной
+    транзакцией MULTI под WATCH (при гонке - повтор): добавление, обрезка
+    списка, сводка и продление TTL сессии. Записи кодируются msgpack
+    (если установлен).
+    """
+
+    def __init__(self, url: str, ttl: int = CONVERSATION_TTL, max_turns: int = CONVERSATION_MAX_TURNS,
+                 max_connections: int = REDIS_MAX_CONNECTIONS, client=None,
+                 recent_turns: int = CONVERSATION_RECENT_TURNS):
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.recent_turns = recent_turns
+        if client is None:
+            # Соединения открываются лениво, в цикле событий воркера
+            pool = aioredis.ConnectionPool.from_url(url, max_connections=max_connections)
+            # from_pool: клиент владеет пулом и закрывает его в close()
+            client = aioredis.Redis.from_pool(pool)
+        self.client = client
+
+    async def append(self, session_id: str, conversation: Dict[str, Any]):
+        history_key, summary_key = self._keys(session_id)
+        index = leaving_index(self.recent_turns, self.max_turns)
+        for attempt in range(APPEND_MAX_ATTEMPTS):
+            async with self.client.pipeline(transaction=True) as pipe:
+                # WATCH: если другой воркер допишет сессию между чтением и MULTI, транзакция не выполнится
+                await pipe.watch(history_key, summary_key)
+                previous = await pipe.lindex(history_key, max(index, 0))
+                summary = await pipe.get(summary_key)
+                leaving = conversation if index < 0 else (decode(previous) if previous else None)
+
+                pipe.multi()
+                pipe.lpush(history_key, encode(conversation))
+                pipe.ltrim(history_key, 0, self.max_turns - 1)
+                pipe.expire(history_key, self.ttl)
+                if leaving is not None:
+                    pipe.set(summary_key, fold_turn(summary.decode("utf-8") if summary else "", leaving), ex=self.ttl)
+                else:
+                    pipe.expire(summary_key, self.ttl)
+                try:
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    if attempt + 1 == APPEND_MAX_ATTEMPTS:
+                        raise
+                    logger.debug(f"Concurrent append to session {session_id}, retrying")
+
+    async def history(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        history_key, _ = self._keys(session_id)
+        return [decode(item) for item in await self.client.lrange(history_key, 0, limit - 1)]
+
+    async def summary(self, session_id: str) -> str:
+        _, summary_key = self._keys(session_id)
+        summary = await self.client.get(summary_key)
+        return summary.decode("utf-8") if summary else ""
+
+    async def prompt_history(self, session_id: str, limit: int) -> Tuple[List[Dict[str, Any]], str]:
+        history_key, summary_key = self._keys(session_id)
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.lrange(history_key, 0, limit - 1)
+            pipe.get(summary_key)
+            items, summary = await pipe.execute()
+        return [decode(item) for item in items], summary.decode("utf-8") if summary else ""
+
+    async def clear(self, session_id: str):
+        await self.client.delete(*self._keys(session_id))
+
+    async def close(self):
+        await self.client.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        # Объём хранит Redis (maxmemory + TTL); здесь - только загрузка пула
+        pool = getattr(self.client, "connection_pool", None)
+        return {
+            "backend": "redis",
+            "ttl": self.ttl,
+            "pool_in_use": len(getattr(pool, "_in_use_connections", ())),
+            "pool_max": getattr(pool, "max_connections", None)
+        }
+
+    @staticmethod
+    def _keys(session_id: str) -> Tuple[str, str]:
+        return f"conversation:{session_id}", f"conversation_summary:{session_id}"
@@ -0,0 +1,76 @@
+from typing import Any, Awaitable, Callable, Dict
+import asyncio
+import hashlib
+import logging
+from app.timing import stage
+from app.deadline import Deadline, current_deadline, set_deadline
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Склеивает одновременные одинаковые вычисления в одно.
+
+    Первый запрос с ключом запускает вычисление отдельной задачей, все
+    пришедшие, пока оно идёт, ждут ту же задачу и получают тот же
+    результат (или то же исключение). Задача защищена через shield:
+    отключившийся клиент не отменяет её для остальных.
+
+    Каждый ждёт задачу в пределах своего срока. Сама задача работает по
+    общему сроку: самому позднему из сроков ожидающих, а не по сроку того,
+    кто её запустил.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._deadlines: Dict[str, Deadline] = {}
+
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        deadline = current_deadline()
+        task = self._in_flight.get(key)
+        if task is None:
+            shared = deadline.copy()
+            task = asyncio.ensure_future(self._run(shared, func))
+            self._in_flight[key] = task
+            self._deadlines[key] = shared
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.executions += 1
+            return await deadline.run(asyncio.shield(task), self.name)
+
+        self.coalesced += 1
+        self._deadlines[key].extend_to(deadline)
+        logger.info(f"Coalesced {self.name} request with in-flight computation")
+        # Стадии считает запрос-лидер; ожидающим записываем время ожидания
+        with stage(f"{self.name}_wait"):
+            return await deadline.run(asyncio.shield(task), self.name)
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.executions + self.coalesced
+        return {
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / total, 3) if total else 0.0,
+            "in_flight": len(self._in_flight)
+        }
+
+    async def _run(self, deadline: Deadline, func: Callable[[], Awaitable[Any]]) -> Any:
+        # Контекст задачи - копия контекста лидера: подменяем срок только в нём
+        set_deadline(deadline)
+        return await func()
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+            del self._deadlines[key]
+        # Забираем исключение, даже если все ожидающие ушли, чтобы asyncio не ругался
+        if not task.cancelled():
+            task.exception()
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+retrieval_flight = SingleFlight("retrieval")
+llm_flight = SingleFlight("llm")
@@ -0,0 +1,45 @@
+from collections import Counter
+from typing import List
+import math
+import re
+from app.bm25 import tokenize
+from app.config import CONVERSATION_SUMMARY_MAX_TOKENS, CONVERSATION_SUMMARY_SENTENCES
+from app.context_builder import estimate_tokens, truncate_to_tokens
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+TURN_SEPARATOR = "\n\n"
+
+def split_sentences(text: str) -> List[str]:
+    # Повторы предложений (частые у LLM) выжимке не нужны
+    return list(dict.fromkeys(sentence for sentence in SENTENCE_PATTERN.split(" ".join(text.split())) if sentence))
+
+def summarize_turn(question: str, answer: str, max_sentences: int = CONVERSATION_SUMMARY_SENTENCES) -> str:
+    """Экстрактивная выжимка реплики: самые содержательные предложения ответа в исходном порядке.
+
+    Вес предложения - частоты его терминов в ответе (термины вопроса весят
+    больше), нормированные на длину. Без вызова LLM, микросекунды на реплику.
+    """
+    sentences = split_sentences(answer)
+    if len(sentences) > max_sentences:
+        frequencies = Counter(tokenize(answer))
+        question_terms = set(tokenize(question))
+
+        def score(sentence):
+            terms = tokenize(sentence)
+            if not terms:
+                return 0.0
+            weight = sum(frequencies[term] + 2 * (term in question_terms) for term in set(terms))
+            return weight / math.sqrt(len(terms))
+
+        best = sorted(range(len(sentences)), key=lambda i: (-score(sentences[i]), i))[:max_sentences]
+        sentences = [sentences[i] for i in sorted(best)]
+    return f"Q: {' '.join(question.split())}\nA: {' '.join(sentences)}"
+
+def fold_into_summary(summary: str, question: str, answer: str,
+                      max_tokens: int = CONVERSATION_SUMMARY_MAX_TOKENS) -> str:
+    """Добавляет выжимку реплики к накопленной сводке; при переполнении забываются самые старые"""
+    turns = summary.split(TURN_SEPARATOR) if summary else []
+    turns.append(summarize_turn(question, answer))
+    while len(turns) > 1 and estimate_tokens(TURN_SEPARATOR.join(turns)) > max_tokens:
+        turns.pop(0)
+    return truncate_to_tokens(TURN_SEPARATOR.join(turns), max_tokens)
@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+from typing import Dict, Optional
+import contextvars
+import threading
+import time
+
+_current_timings = contextvars.ContextVar("stage_timings", default=None)
+
+class StageTimings:
+    """Время по стадиям одного запроса (эмбеддинг, поиск, LLM и т.д.), в секундах.
+
+    Повторные замеры одной стадии суммируются. Объект общий для потоков
+    пула поиска, поэтому запись под блокировкой.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        """Миллисекунды по стадиям в порядке первого замера"""
+        with self._lock:
+            return {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        """Значение заголовка Server-Timing"""
+        entries = [f"{name};dur={ms}" for name, ms in self.as_dict().items()]
+        if total is not None:
+            entries.append(f"total;dur={round(total * 1000, 2)}")
+        return ", ".join(entries)
+
+def start_timings() -> StageTimings:
+    """Заводит замеры для текущего запроса (контекст наследуют задачи и run_blocking)"""
+    timings = StageTimings()
+    _current_timings.set(timings)
+    return timings
+
+def current_timings() -> Optional[StageTimings]:
+    return _current_timings.get()
+
+@contextmanager
+def stage(name: str):
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
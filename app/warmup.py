@@ -0,0 +1,142 @@
+from typing import Dict, Any, Optional
+import asyncio
+import logging
+import os
+import time
+from app.config import (
+    CHROMA_DB_PATH, BM25_INDEX_PATH, ONNX_INTRA_OP_THREADS, BLAS_NUM_THREADS, WARMUP_ENABLED,
+    WARMUP_PRETOUCH_INDEX, WARMUP_PRETOUCH_MAX_MB, WARMUP_LLM
+)
+from app.database import vector_db
+from app.bm25 import keyword_searcher
+from app.gemini_client import gemini_client
+from app.onnx_threads import configure_onnx_threads
+
+logger = logging.getLogger(__name__)
+
+BLAS_THREAD_VARIABLES = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+PRETOUCH_CHUNK = 1024 * 1024
+
+def configure_threads(onnx_threads: int = ONNX_INTRA_OP_THREADS, blas_threads: int = BLAS_NUM_THREADS):
+    """Ограничивает потоки ONNX Runtime и BLAS в процессе воркера.
+
+    Вызывается до первого эмбеддинга: сессия ONNX читает настройки при создании.
+    """
+    configure_onnx_threads(onnx_threads)
+    if blas_threads <= 0:
+        return
+    # Для библиотек, которые ещё не загружены
+    for variable in BLAS_THREAD_VARIABLES:
+        os.environ.setdefault(variable, str(blas_threads))
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        logger.warning("threadpoolctl not installed, BLAS_NUM_THREADS applies only to libraries loaded later")
+        return
+    # numpy уже загружен - его BLAS ограничиваем на лету
+    threadpool_limits(limits=blas_threads, user_api="blas")
+
+def pretouch_files(paths, max_bytes: int) -> int:
+    """Читает файлы индексов, чтобы первый запрос не ждал диск; возвращает прочитанные байты"""
+    touched = 0
+    for root_path in paths:
+        if not os.path.isdir(root_path):
+            continue
+        for directory, _, files in os.walk(root_path):
+            for name in sorted(files):
+                with open(os.path.join(directory, name), "rb") as f:
+                    while touched < max_bytes:
+                        chunk = f.read(min(PRETOUCH_CHUNK, max_bytes - touched))
+                        if not chunk:
+                            break
+                        touched += len(chunk)
+                if touched >= max_bytes:
+                    return touched
+    return touched
+
+class Warmup:
+    """Прогрев воркера после старта.
+
+    Модель эмбеддингов (ONNX), HNSW-индекс Chroma и BM25 загружаются при
+    первом обращении, поэтому выполняем их синтетическим запросом до того,
+    как воркер объявит готовность на /ready. Ошибка шага не блокирует
+    готовность: воркер обслуживает запросы, а ошибка видна в статусе.
+    """
+
+    def __init__(self, enabled: bool = WARMUP_ENABLED, pretouch: bool = WARMUP_PRETOUCH_INDEX,
+                 pretouch_max_mb: int = WARMUP_PRETOUCH_MAX_MB, llm: bool = WARMUP_LLM):
+        self.enabled = enabled
+        self.pretouch = pretouch
+        self.pretouch_max_bytes = pretouch_max_mb * 1024 * 1024
+        self.llm = llm
+        self.ready = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.ready = False
+        self.steps = {}
+        self.started_at = time.time()
+        self.finished_at = None
+        if not self.enabled:
+            self._finish()
+            return
+        self._task = asyncio.create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        if self.pretouch:
+            await self._step("pretouch_index", loop.run_in_executor(
+                None, pretouch_files, [CHROMA_DB_PATH, BM25_INDEX_PATH], self.pretouch_max_bytes
+            ))
+        await self._step("vector_search", loop.run_in_executor(None, self._vector_search))
+        await self._step("keyword_index", loop.run_in_executor(None, keyword_searcher.get_index))
+        if self.llm:
+            await self._step("llm", self._llm_handshake())
+        self._finish()
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "warmup_seconds": round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None,
+            "steps": self.steps
+        }
+
+    async def _step(self, name: str, awaitable):
+        start = time.perf_counter()
+        try:
+            result = await awaitable
+            self.steps[name] = {"ok": True, "seconds": round(time.perf_counter() - start, 3)}
+            if name == "pretouch_index":
+                self.steps[name]["bytes"] = result
+        except Exception as e:
+            logger.warning(f"Warmup step {name} failed: {e}")
+            self.steps[name] = {"ok": False, "seconds": round(time.perf_counter() - start, 3), "error": str(e)}
+
+    def _vector_search(self):
+        # Эмбеддинг загружает модель ONNX, запрос - HNSW-индекс сегмента
+        embedding = vector_db.embed(["warmup query"])[0]
+        if vector_db.collection.count():
+            vector_db.collection.query(query_embeddings=[embedding.tolist()], n_results=1)
+
+    async def _llm_handshake(self):
+        # count_tokens не генерирует текст, но поднимает соединение с API
+        await gemini_client.model.count_tokens_async("warmup")
+
+    def _finish(self):
+        self.ready = True
+        self.finished_at = time.time()
+        logger.info(f"Worker {os.getpid()} ready after {self.finished_at - self.started_at:.2f}s warmup: {self.steps}")
+
+warmup = Warmup()
@@ -0,0 +1,45 @@
+import logging
+import os
+import sys
+
+# Добавляем путь для импортов в Docker
+sys.path.append('/app')
+
+from app.database import vector_db
+from app.artifact import export_artifact, load_artifact
+from app.bm25 import build_index_from_collection
+from app.config import EMBEDDINGS_ARTIFACT_PATH, EMBEDDINGS_ARTIFACT_DTYPE, BM25_INDEX_PATH
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+USAGE = "usage: python scripts/embeddings_artifact.py export|load [path]"
+
+def main(argv):
+    """export - выгрузить коллекцию с эмбеддингами (в CI), load - заполнить коллекцию из артефакта"""
+    if not argv or argv[0] not in ("export", "load"):
+        print(USAGE)
+        return 2
+
+    path = argv[1] if len(argv) > 1 else EMBEDDINGS_ARTIFACT_PATH
+    if argv[0] == "export":
+        manifest = export_artifact(vector_db, path, dtype=EMBEDDINGS_ARTIFACT_DTYPE)
+        print(f"Exported {manifest['count']} documents to {path}")
+        return 0
+
+    if not os.path.exists(os.path.join(path, "manifest.json")):
+        logger.error(f"Embeddings artifact not found: {path}")
+        return 1
+    stats = load_artifact(vector_db, path)
+    print(f"Loaded {stats['papers']} documents ({stats['skipped']} unchanged)")
+
+    # load_arxiv_data.py не пересобирает индекс, если его манифест уже завершён:
+    # без этого новые документы из артефакта не находились бы по ключевым словам
+    if stats["papers"] or not os.path.exists(os.path.join(BM25_INDEX_PATH, "meta.json")):
+        logger.info(f"Rebuilding BM25 keyword index at {BM25_INDEX_PATH}")
+        index = build_index_from_collection(vector_db, BM25_INDEX_PATH)
+        logger.info(f"BM25 index ready: {index.num_docs} documents")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
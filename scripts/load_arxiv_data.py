@@ -1,99 +1,113 @@
-import json
-import logging
-import os
-import sys
-from tqdm import tqdm
-
-# Добавляем путь для импортов в Docker
-sys.path.append('/app')
-
-from app.database import vector_db
-from app.config import DATA_PATH, BATCH_SIZE
-
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-def process_arxiv_data():
-    """Загрузка и обработка данных из arXiv JSON"""
-    
-    # Проверяем существует ли уже БД
-    if os.path.exists('/app/chroma_db/chroma.sqlite3'):
-        logger.info("Vector database already exists, skipping data loading.")
-        return True
-    
-    if not os.path.exists(DATA_PATH):
-        logger.error(f"Data file not found: {DATA_PATH}")
-        return False
-    
-    try:
-        with open(DATA_PATH, 'r', encoding='utf-8') as f:
-            papers = json.load(f)
-        
-        # ОГРАНИЧИВАЕМ ДО 3000 СТАТЕЙ ДЛЯ 1GB ПАМЯТИ
-        papers = papers[:3000]
-        logger.info(f"Loading {len(papers)} papers from arXiv dataset")
-        
-        # Подготавливаем документы для векторной БД
-        documents = []
-        metadatas = []
-        ids = []
-        
-        for i, paper in enumerate(tqdm(papers, desc="Processing papers")):
-            # Создаем текстовое представление статьи
-            text_content = create_document_text(paper)
-            
-            documents.append(text_content)
-            metadatas.append({
-                "paper_id": paper.get("id", f"unknown_{i}"),
-                "title": paper.get("title", ""),
-                "authors": paper.get("authors", ""),
-                "categories": paper.get("categories", ""),
-                "year": "2020"
-            })
-            ids.append(f"arxiv_{paper.get('id', i)}")
-            
-            # Добавляем батчами для экономии памяти
-            if len(documents) >= BATCH_SIZE:
-                vector_db.add_documents(documents, metadatas, ids)
-                documents.clear()
-                metadatas.clear()
-                ids.clear()
-        
-        # Добавляем оставшиеся документы
-        if documents:
-            vector_db.add_documents(documents, metadatas, ids)
-        
-        logger.info("Successfully loaded all papers into vector database")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error loading arXiv data: {str(e)}")
-        return False
-
-def create_document_text(paper):
-    """Создает текстовое представление статьи для эмбеддингов"""
-    title = paper.get("title", "").strip()
-    abstract = paper.get("abstract", "").strip()
-    authors = paper.get("authors", "").strip()
-    categories = paper.get("categories", "").strip()
-    
-    # Форматируем текст для лучшего семантического поиска
-    document_text = f"Title: {title}\n"
-    
-    if authors:
-        document_text += f"Authors: {authors}\n"
-    
-    if categories:
-        document_text += f"Categories: {categories}\n"
-    
-    document_text += f"Abstract: {abstract}"
-    
-    return document_text
-
-if __name__ == "__main__":
-    success = process_arxiv_data()
-    if success:
-        print("Data loading completed successfully!")
-    else:
-        print("Data loading failed!")
+import logging
+import os
+import sys
+from tqdm import tqdm
+
+# Добавляем путь для импортов в Docker
+sys.path.append('/app')
+
+from app.database import vector_db
+from app.bm25 import build_index_from_collection, update_index_from_collection
+from app.ingestion import IngestionCheckpoint, IngestionPipeline, iter_papers, peak_rss_mb
+from app.config import DATA_PATH, BATCH_SIZE, BM25_INDEX_PATH, MAX_PAPERS, EMBED_WORKERS, INGEST_MANIFEST_PATH
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def process_arxiv_data():
+    """Загрузка и обработка данных из arXiv JSON"""
+    
+    if not os.path.exists(DATA_PATH):
+        # Коллекция могла быть заполнена из готового артефакта эмбеддингов
+        if vector_db.collection.count():
+            logger.info(f"Data file not found: {DATA_PATH}, using existing collection")
+            if not os.path.exists(os.path.join(BM25_INDEX_PATH, "meta.json")):
+                build_keyword_index()
+            return True
+        logger.error(f"Data file not found: {DATA_PATH}")
+        return False
+    
+    try:
+        # Статьи читаются потоково (JSON-массив, JSONL, .gz), эмбеддинги считаются
+        # в пуле процессов параллельно с разбором, в БД пишет один поток
+        logger.info(f"Streaming papers from {DATA_PATH} ({EMBED_WORKERS} embedding workers, batch {BATCH_SIZE})")
+        # Повторный запуск дозагружает только новые и изменённые статьи,
+        # прерванный - продолжает с позиции из манифеста
+        checkpoint = IngestionCheckpoint(INGEST_MANIFEST_PATH, DATA_PATH, limit=MAX_PAPERS)
+        pipeline = IngestionPipeline(vector_db)
+        stats = pipeline.run(tqdm(iter_records(), desc="Processing papers"), checkpoint=checkpoint)
+        
+        loaded, elapsed = stats["papers"], stats["seconds"]
+        logger.info(
+            f"Loaded {loaded} new or changed papers ({stats['skipped']} unchanged skipped) in {elapsed:.1f}s "
+            f"({loaded / elapsed if elapsed else 0:.1f} papers/sec, peak RSS {peak_rss_mb():.0f} MB)"
+        )
+        
+        if not os.path.exists(os.path.join(BM25_INDEX_PATH, "meta.json")):
+            build_keyword_index()
+        elif checkpoint.interrupted or pipeline.upserted_ids is None:
+            # Статьи, записанные до обрыва, этому запуску неизвестны; слишком большая дозагрузка - тоже целиком
+            build_keyword_index()
+        elif loaded:
+            update_keyword_index(pipeline.upserted_ids)
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error loading arXiv data: {str(e)}")
+        return False
+
+def iter_records():
+    """Отдаёт (id, текст, метаданные) для каждой статьи с учётом MAX_PAPERS"""
+    for i, paper in enumerate(iter_papers(DATA_PATH)):
+        if MAX_PAPERS and i >= MAX_PAPERS:
+            break
+        metadata = {
+            "paper_id": paper.get("id", f"unknown_{i}"),
+            "title": paper.get("title", ""),
+            "authors": paper.get("authors", ""),
+            "categories": paper.get("categories", ""),
+            "year": "2020"
+        }
+        yield f"arxiv_{paper.get('id', i)}", create_document_text(paper), metadata
+
+def build_keyword_index():
+    """Собирает BM25 индекс по названиям и аннотациям всех документов коллекции"""
+    logger.info(f"Building BM25 keyword index at {BM25_INDEX_PATH}")
+    index = build_index_from_collection(vector_db, BM25_INDEX_PATH)
+    logger.info(f"BM25 index ready: {index.num_docs} documents")
+    return index
+
+def update_keyword_index(ids):
+    """Индексирует только дозагруженные статьи (дельта-сегмент), не читая всю коллекцию"""
+    logger.info(f"Adding {len(ids)} papers to BM25 keyword index at {BM25_INDEX_PATH}")
+    index = update_index_from_collection(vector_db, ids, BM25_INDEX_PATH)
+    logger.info(f"BM25 index ready: {index.num_docs} documents")
+    return index
+
+def create_document_text(paper):
+    """Создает текстовое представление статьи для эмбеддингов"""
+    title = paper.get("title", "").strip()
+    abstract = paper.get("abstract", "").strip()
+    authors = paper.get("authors", "").strip()
+    categories = paper.get("categories", "").strip()
+    
+    # Форматируем текст для лучшего семантического поиска
+    document_text = f"Title: {title}\n"
+    
+    if authors:
+        document_text += f"Authors: {authors}\n"
+    
+    if categories:
+        document_text += f"Categories: {categories}\n"
+    
+    document_text += f"Abstract: {abstract}"
+    
+    return document_text
+
+if __name__ == "__main__":
+    success = process_arxiv_data()
+    if success:
+        print("Data loading completed successfully!")
+    else:
+        print("Data loading failed!")
         sys.exit(1)
\ No newline at end of file
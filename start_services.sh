@@ -71,16 +71,21 @@ wait_for_service() {
 initialize_database() {
     echo "=== DATABASE INITIALIZATION ==="
     
-    if [ ! -f /app/chroma_db/chroma.sqlite3 ]; then
-        echo "Initializing vector database..."
-        if python scripts/load_arxiv_data.py; then
-            echo "Database initialized successfully"
-        else
-            echo "Database initialization failed"
-            return 1
-        fi
+    # Готовые эмбеддинги из образа загружаются без пересчёта
+    local artifact_path="${EMBEDDINGS_ARTIFACT_PATH:-/app/data/embeddings}"
+    if [ -f "$artifact_path/manifest.json" ]; then
+        echo "Loading precomputed embeddings from $artifact_path..."
+        python scripts/embeddings_artifact.py load "$artifact_path" || return 1
+    fi
+    
+    # Загрузка идемпотентна: уже загруженные статьи пропускаются по хэшу,
+    # прерванная загрузка продолжается по манифесту
+    echo "Syncing vector database..."
+    if python scripts/load_arxiv_data.py; then
+        echo "Database initialized successfully"
     else
-        echo "Vector database already exists"
+        echo "Database initialization failed"
+        return 1
     fi
 }
 
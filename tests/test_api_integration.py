@@ -1,83 +1,193 @@
-import pytest
-from fastapi.testclient import TestClient
-
-class TestAPIIntegration:
-    """Интеграционные тесты API"""
-    
-    def test_root_endpoint(self, client):
-        """Тест корневого endpoint"""
-        response = client.get("/")
-        assert response.status_code == 200
-        data = response.json()
-        assert "message" in data
-        assert "Academic Research Assistant API" in data["message"]
-    
-    def test_health_check(self, client):
-        """Тест health check endpoint"""
-        response = client.get("/health")
-        assert response.status_code == 200
-        data = response.json()
-        assert data["status"] == "healthy"
-    
-    def test_query_endpoint_basic(self, client):
-        """Тест основного query endpoint"""
-        test_data = {
-            "question": "What is machine learning?",
-            "top_k": 2
-        }
-        
-        response = client.post("/query", json=test_data)
-        assert response.status_code == 200
-        data = response.json()
-        assert "answer" in data
-        assert "sources" in data
-        assert "context" in data
-    
-    def test_query_with_different_strategies(self, client):
-        """Тест query с разными стратегиями RAG"""
-        strategies = ["basic", "hierarchical", "hybrid", "adaptive"]
-        
-        for strategy in strategies:
-            test_data = {
-                "question": "Explain transformer models",
-                "top_k": 3,
-                "strategy": strategy
-            }
-            
-            response = client.post("/query", json=test_data)
-            assert response.status_code == 200
-            data = response.json()
-            assert data["strategy"] == strategy
-    
-    def test_conversation_endpoints(self, client):
-        """Тест endpoints для управления историей диалога"""
-        session_id = "test_session_123"
-        
-        # Очищаем историю
-        response = client.delete(f"/conversation/{session_id}")
-        assert response.status_code == 200
-        
-        # Получаем пустую историю
-        response = client.get(f"/conversation/{session_id}")
-        assert response.status_code == 200
-        data = response.json()
-        assert data["session_id"] == session_id
-        assert len(data["history"]) == 0
-    
-    def test_metrics_endpoint(self, client):
-        """Тест endpoints метрик"""
-        response = client.get("/metrics")
-        assert response.status_code == 200
-        data = response.json()
-        assert "average_response_time" in data
-        assert "success_rate" in data
-        assert "total_requests" in data
-    
-    def test_strategies_endpoint(self, client):
-        """Тест endpoints доступных стратегий"""
-        response = client.get("/strategies")
-        assert response.status_code == 200
-        data = response.json()
-        assert "available_strategies" in data
-        assert "default_strategy" in data
-        assert len(data["available_strategies"]) == 4
\ No newline at end of file
+import pytest
+import json
+from unittest.mock import MagicMock, patch
+from fastapi.testclient import TestClient
+
+from app.modular_rag import modular_rag
+from app.gemini_client import gemini_client
+from app.database import vector_db
+from app.semantic_cache import semantic_cache
+
+
+def parse_sse(body):
+    """Разбирает тело text/event-stream в список (event, data)"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = block.split("\n")
+        event = next(l[len("event: "):] for l in lines if l.startswith("event: "))
+        data = "\n".join(l[len("data: "):] for l in lines if l.startswith("data: "))
+        events.append((event, json.loads(data)))
+    return events
+
+class TestAPIIntegration:
+    """Интеграционные тесты API"""
+    
+    def test_root_endpoint(self, client):
+        """Тест корневого endpoint"""
+        response = client.get("/")
+        assert response.status_code == 200
+        data = response.json()
+        assert "message" in data
+        assert "Academic Research Assistant API" in data["message"]
+    
+    def test_health_check(self, client):
+        """Тест health check endpoint"""
+        response = client.get("/health")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "healthy"
+    
+    def test_query_endpoint_basic(self, client):
+        """Тест основного query endpoint"""
+        test_data = {
+            "question": "What is machine learning?",
+            "top_k": 2
+        }
+        
+        response = client.post("/query", json=test_data)
+        assert response.status_code == 200
+        data = response.json()
+        assert "answer" in data
+        assert "sources" in data
+        assert "context" in data
+    
+    def test_query_with_different_strategies(self, client):
+        """Тест query с разными стратегиями RAG"""
+        strategies = ["basic", "hierarchical", "hybrid", "adaptive"]
+        
+        for strategy in strategies:
+            test_data = {
+                "question": "Explain transformer models",
+                "top_k": 3,
+                "strategy": strategy
+            }
+            
+            response = client.post("/query", json=test_data)
+            assert response.status_code == 200
+            data = response.json()
+            assert data["strategy"] == strategy
+    
+    def test_conversation_endpoints(self, client):
+        """Тест endpoints для управления историей диалога"""
+        session_id = "test_session_123"
+        
+        # Очищаем историю
+        response = client.delete(f"/conversation/{session_id}")
+        assert response.status_code == 200
+        
+        # Получаем пустую историю
+        response = client.get(f"/conversation/{session_id}")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["session_id"] == session_id
+        assert len(data["history"]) == 0
+    
+    def test_metrics_endpoint(self, client):
+        """Тест endpoints метрик"""
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        data = response.json()
+        assert "average_response_time" in data
+        assert "success_rate" in data
+        assert "total_requests" in data
+    
+    def test_strategies_endpoint(self, client):
+        """Тест endpoints доступных стратегий"""
+        response = client.get("/strategies")
+        assert response.status_code == 200
+        data = response.json()
+        assert "available_strategies" in data
+        assert "default_strategy" in data
+        assert len(data["available_strategies"]) == 4
+    
+    def test_query_stream_endpoint(self, client):
+        """Тест SSE endpoint: источники приходят до частей ответа"""
+        rag_result = {
+            "documents": ["Title: Attention Is All You Need\nAbstract: Transformers..."],
+            "metadatas": [{"title": "Attention Is All You Need", "authors": "Vaswani et al."}],
+            "strategy": "basic",
+            "search_type": "semantic"
+        }
+        
+        async def fake_stream(prompt, temperature=0.1):
+            for text in ["Transformers ", "use ", "attention."]:
+                yield text
+        
+        with patch.object(modular_rag, "execute_rag", return_value=rag_result), \
+             patch.object(gemini_client, "stream_response", side_effect=fake_stream):
+            response = client.post(
+                "/query/stream",
+                params={"session_id": "stream_test"},
+                json={"question": "What is a transformer?", "top_k": 1}
+            )
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        
+        events = parse_sse(response.text)
+        names = [event for event, _ in events]
+        assert names[0] == "sources"
+        assert names[-1] == "done"
+        assert events[0][1]["sources"] == ["Source 1: Attention Is All You Need by Vaswani et al."]
+        
+        answer = "".join(data["text"] for event, data in events if event == "chunk")
+        assert answer == "Transformers use attention."
+        
+        history = client.get("/conversation/stream_test").json()["history"]
+        assert history[0]["answer"] == answer
+    
+    def test_query_batch_endpoint(self, client):
+        """Пакетный запрос: один поиск на все вопросы, порядок сохраняется, ошибки - по вопросу"""
+        def search_batch(questions, top_k):
+            return [
+                {
+                    "ids": [[f"id_{q}"]],
+                    "documents": [[f"Title: {q}\nAbstract: about {q}"]],
+                    "metadatas": [[{"title": q}]],
+                    "distances": [[0.1]],
+                    "scores": [[0.9]]
+                }
+                for q in questions
+            ]
+        
+        async def fake_generate(prompt, temperature=0.1):
+            if "about broken" in prompt:
+                raise RuntimeError("LLM unavailable")
+            return "answer for " + prompt.split("about ")[1].split("\n")[0]
+        
+        questions = ["alpha", "broken", "gamma"]
+        with patch.object(vector_db, "search_batch", side_effect=search_batch) as mock_batch, \
+             patch.object(gemini_client, "generate_response_async", side_effect=fake_generate), \
+             patch.object(semantic_cache, "enabled", False):
+            response = client.post("/query/batch", json={"questions": questions, "top_k": 1})
+        
+        assert response.status_code == 200
+        mock_batch.assert_called_once()
+        results = response.json()["results"]
+        assert [result["question"] for result in results] == questions
+        assert results[0]["answer"] == "answer for alpha"
+        assert results[0]["sources"] == ["Source 1: alpha"]
+        assert results[1]["answer"] is None
+        assert "LLM unavailable" in results[1]["error"]
+        assert results[2]["answer"] == "answer for gamma"
+        assert results[2]["error"] is None
+    
+    def test_query_batch_reports_retrieval_outage(self, client):
+        """Сбой Chroma - ошибка по каждому вопросу, а не ответ о том, что документов нет"""
+        collection = MagicMock()
+        collection.query.side_effect = RuntimeError("chroma is down")
+        questions = ["outage question one", "outage question two"]
+        with patch.dict(vector_db.__dict__, {"collection": collection}), \
+             patch.object(vector_db, "embed_queries", side_effect=lambda queries: [[0.0] * 3 for _ in queries]), \
+             patch.object(semantic_cache, "enabled", False):
+            response = client.post("/query/batch", json={"questions": questions, "top_k": 1})
+        
+        assert response.status_code == 200
+        for result in response.json()["results"]:
+            assert result["answer"] is None
+            assert result["error"] == "Retrieval failed: chroma is down"
+    
+    def test_query_batch_validation(self, client):
+        """Пустой пакет отклоняется"""
+        response = client.post("/query/batch", json={"questions": []})
+        assert response.status_code == 422
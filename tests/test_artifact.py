@@ -0,0 +1,98 @@
+import pytest
+import numpy as np
+
+from app.artifact import export_artifact, load_artifact, EmbeddingArtifact
+
+
+class FakeCollection:
+    def __init__(self, store):
+        self.store = store
+
+    def count(self):
+        return len(self.store)
+
+
+class FakeDatabase:
+    """Минимальная коллекция в памяти с тем же интерфейсом, что у VectorDatabase"""
+
+    def __init__(self):
+        self.store = {}
+        self.upserts = 0
+        self.collection = FakeCollection(self.store)
+
+    def iter_embedded(self, batch_size=5000, include_embeddings=True):
+        items = list(self.store.items())
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            embeddings = np.array([value[2] for _, value in batch]) if include_embeddings else None
+            yield [key for key, _ in batch], [value[0] for _, value in batch], [value[1] for _, value in batch], embeddings
+
+    def get_content_hashes(self, ids):
+        return {doc_id: self.store[doc_id][1].get("content_hash") for doc_id in ids if doc_id in self.store}
+
+    def upsert_documents(self, documents, metadatas, ids, embeddings=None):
+        self.upserts += 1
+        for doc_id, document, metadata, embedding in zip(ids, documents, metadatas, embeddings):
+            self.store[doc_id] = (document, metadata, np.asarray(embedding, dtype=np.float32))
+
+    def get_collection_version(self):
+        return "v1"
+
+
+def make_source(count=25, dim=8):
+    database = FakeDatabase()
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        metadata = {"paper_id": f"2001.{i:05d}", "title": f"Статья {i}"}
+        if i % 3 == 0:
+            metadata["year"] = 2020
+        database.store[f"arxiv_{i}"] = (f"Title: Статья {i}\nAbstract: текст {i}", metadata,
+                                        rng.standard_normal(dim).astype(np.float32))
+    return database
+
+
+class TestEmbeddingArtifact:
+    """Тесты выгрузки и загрузки готовых эмбеддингов"""
+
+    @pytest.mark.parametrize("dtype", ["float16", "float32"])
+    def test_round_trip(self, tmp_path, dtype):
+        """Документы, метаданные и эмбеддинги переживают выгрузку и загрузку"""
+        source = make_source()
+        path = str(tmp_path / "artifact")
+        manifest = export_artifact(source, path, dtype=dtype, batch_size=7)
+        assert manifest["count"] == 25 and manifest["dim"] == 8
+
+        artifact = EmbeddingArtifact(path)
+        assert artifact.embeddings.dtype == np.dtype(dtype)
+        assert isinstance(artifact.embeddings, np.memmap)
+
+        target = FakeDatabase()
+        stats = load_artifact(target, path, batch_size=10)
+        assert stats["papers"] == 25
+
+        tolerance = 1e-2 if dtype == "float16" else 0
+        for doc_id, (document, metadata, embedding) in source.store.items():
+            loaded_document, loaded_metadata, loaded_embedding = target.store[doc_id]
+            assert loaded_document == document
+            assert {k: v for k, v in loaded_metadata.items() if k != "content_hash"} == metadata
+            assert loaded_embedding.dtype == np.float32
+            np.testing.assert_allclose(loaded_embedding, embedding, atol=tolerance)
+
+    def test_reload_is_noop(self, tmp_path):
+        """Повторная загрузка того же артефакта ничего не пишет"""
+        path = str(tmp_path / "artifact")
+        export_artifact(make_source(), path)
+        target = FakeDatabase()
+        load_artifact(target, path, batch_size=10)
+        upserts = target.upserts
+
+        stats = load_artifact(target, path, batch_size=10)
+        assert stats["papers"] == 0
+        assert stats["skipped"] == 25
+        assert target.upserts == upserts
+
+    def test_empty_collection(self, tmp_path):
+        path = str(tmp_path / "artifact")
+        export_artifact(FakeDatabase(), path)
+        assert EmbeddingArtifact.exists(path)
+        assert load_artifact(FakeDatabase(), path)["papers"] == 0
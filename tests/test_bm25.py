@@ -0,0 +1,205 @@
+import pytest
+import os
+import time
+import numpy as np
+from unittest.mock import patch
+
+from app.bm25 import (
+    BM25IndexBuilder, BM25Index, KeywordSearcher, SegmentedIndex, tokenize, extract_title_abstract,
+    build_index_from_collection, update_index_from_collection, delta_path
+)
+from app.modular_rag import ModularRAG, RAGStrategy
+from app.database import vector_db
+
+
+@pytest.fixture
+def corpus(real_arxiv_data):
+    """Документы в формате create_document_text"""
+    extra = [
+        {"id": "1706.03762", "title": "Attention Is All You Need", "authors": "Vaswani et al.",
+         "categories": "cs.CL", "abstract": "We propose the Transformer, based solely on attention mechanisms."},
+        {"id": "1810.04805", "title": "BERT: Pre-training of Deep Bidirectional Transformers", "authors": "Devlin et al.",
+         "categories": "cs.CL", "abstract": "We introduce BERT, a language representation model built on transformers."},
+    ]
+    return {
+        f"arxiv_{p['id']}": (
+            f"Title: {p['title']}\nAuthors: {p['authors']}\nCategories: {p['categories']}\nAbstract: {p['abstract']}"
+        )
+        for p in real_arxiv_data + extra
+    }
+
+
+@pytest.fixture
+def index_path(tmp_path, corpus):
+    builder = BM25IndexBuilder()
+    for doc_id, document in corpus.items():
+        builder.add(doc_id, extract_title_abstract(document))
+    path = str(tmp_path / "bm25")
+    builder.build(path)
+    return path
+
+
+class TestBM25Index:
+    """Тесты BM25 индекса для keyword-поиска"""
+
+    def test_tokenize_drops_stop_words(self):
+        """Токенизация убирает стоп-слова и пунктуацию"""
+        assert tokenize("What is the Proton form-factor ratio?") == ["proton", "form", "factor", "ratio"]
+
+    def test_extract_title_abstract_skips_authors(self):
+        """В индекс попадают только название и аннотация"""
+        text = extract_title_abstract("Title: T\nAuthors: Someone\nCategories: x\nAbstract: Body text")
+        assert text == "T\nBody text"
+
+    def test_search_ranks_relevant_documents(self, index_path):
+        """Релевантный документ оказывается первым"""
+        index = BM25Index.load(index_path)
+        ids, scores = index.search("proton elastic form factor", top_k=3)
+
+        assert ids[0] == "arxiv_0706.0128"
+        assert scores == sorted(scores, reverse=True)
+
+        ids, _ = index.search("baryons Tevatron", top_k=1)
+        assert ids == ["arxiv_0706.3868"]
+
+    def test_unknown_terms_return_nothing(self, index_path):
+        """Неизвестные термины не дают результатов"""
+        index = BM25Index.load(index_path)
+        assert index.search("zzzz qqqq", top_k=3) == ([], [])
+
+    def test_index_is_memory_mapped(self, index_path):
+        """Массивы индекса открываются через mmap, а не читаются в память"""
+        index = BM25Index.load(index_path)
+        assert isinstance(index.postings, np.memmap)
+        assert isinstance(index.terms, np.memmap)
+        assert index.postings.dtype == np.int32
+        assert index.freqs.dtype == np.uint16
+
+    def test_query_latency_milliseconds(self, tmp_path):
+        """Запрос к индексу на тысячах документов занимает миллисекунды"""
+        rng = np.random.default_rng(0)
+        vocabulary = np.array([f"term{i}" for i in range(2000)])
+        builder = BM25IndexBuilder()
+        for i, words in enumerate(rng.choice(vocabulary, size=(10000, 50))):
+            builder.add(f"doc_{i}", " ".join(words))
+        index = builder.build(str(tmp_path / "bm25"))
+
+        start_time = time.perf_counter()
+        for _ in range(20):
+            ids, _ = index.search("term1 term22 term333 term4444", top_k=10)
+        per_query = (time.perf_counter() - start_time) / 20
+
+        assert len(ids) == 10
+        assert per_query < 0.02
+
+    def test_searcher_reloads_rebuilt_index(self, tmp_path):
+        """KeywordSearcher подхватывает пересобранный индекс"""
+        path = str(tmp_path / "bm25")
+        searcher = KeywordSearcher(path)
+        assert searcher.search("proton", top_k=1) == ([], [])
+
+        builder = BM25IndexBuilder()
+        builder.add("p1", "proton form factor")
+        builder.build(path)
+        with patch("app.bm25.COLLECTION_VERSION_CHECK_INTERVAL", 0):
+            assert searcher.search("proton", top_k=1)[0] == ["p1"]
+
+
+
+class DocumentStore:
+    """Коллекция в памяти: iter_documents/get_documents, как у VectorDatabase"""
+
+    def __init__(self, documents):
+        self.documents = dict(documents)
+        self.requested = []
+
+    def iter_documents(self, batch_size=5000):
+        items = list(self.documents.items())
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            yield [doc_id for doc_id, _ in batch], [document for _, document in batch]
+
+    def get_documents(self, ids):
+        self.requested.extend(ids)
+        found = [doc_id for doc_id in ids if doc_id in self.documents]
+        return {"ids": found, "documents": [self.documents[i] for i in found], "metadatas": [{} for _ in found]}
+
+
+class TestDeltaSegment:
+    """Дозагруженные документы индексируются отдельным сегментом"""
+
+    def test_update_indexes_only_new_documents(self, tmp_path, corpus):
+        path = str(tmp_path / "bm25")
+        store = DocumentStore(corpus)
+        build_index_from_collection(store, path)
+
+        store.documents["new_1"] = "Title: Quantum Chromodynamics Lattice\nAbstract: Gluon lattice simulations."
+        store.documents["arxiv_1706.03762"] = "Title: Renamed\nAbstract: Recurrent networks only."
+        index = update_index_from_collection(store, ["new_1", "arxiv_1706.03762"], path)
+
+        # Из коллекции прочитаны только дозагруженные документы
+        assert store.requested == ["new_1", "arxiv_1706.03762"]
+        assert isinstance(index, SegmentedIndex)
+        assert index.num_docs == len(store.documents)
+        assert index.search("gluon lattice", top_k=1)[0] == ["new_1"]
+        # Новая версия документа перекрывает старую из основного индекса
+        assert "arxiv_1706.03762" not in index.search("transformer attention mechanisms", top_k=10)[0]
+        assert index.search("recurrent", top_k=1)[0] == ["arxiv_1706.03762"]
+
+        positions = index.doc_positions(["new_1", "arxiv_0706.0128", "missing"])
+        scores = index.score_documents(tokenize("gluon proton"), positions)
+        assert positions[2] == -1
+        assert scores[0] > 0 and scores[1] > 0 and scores[2] == 0
+
+    def test_delta_accumulates_and_compacts(self, tmp_path, corpus):
+        path = str(tmp_path / "bm25")
+        store = DocumentStore(corpus)
+        build_index_from_collection(store, path)
+
+        store.documents["new_1"] = "Title: Gluon\nAbstract: Lattice."
+        update_index_from_collection(store, ["new_1"], path, max_delta_docs=2)
+        store.documents["new_2"] = "Title: Neutrino\nAbstract: Oscillations."
+        index = update_index_from_collection(store, ["new_2"], path, max_delta_docs=2)
+        # Прошлая дельта пересобрана вместе с новыми документами
+        assert sorted(index.delta.doc_ids.tolist()) == ["new_1", "new_2"]
+
+        store.documents["new_3"] = "Title: Muon\nAbstract: Decay."
+        index = update_index_from_collection(store, ["new_3"], path, max_delta_docs=2)
+        assert isinstance(index, BM25Index)
+        assert index.num_docs == len(store.documents)
+        assert not os.path.exists(delta_path(path))
+
+    def test_searcher_picks_up_delta(self, tmp_path, corpus):
+        path = str(tmp_path / "bm25")
+        store = DocumentStore(corpus)
+        build_index_from_collection(store, path)
+        searcher = KeywordSearcher(path)
+        assert searcher.search("gluon", top_k=1) == ([], [])
+
+        store.documents["new_1"] = "Title: Gluon\nAbstract: Lattice."
+        update_index_from_collection(store, ["new_1"], path)
+        with patch("app.bm25.COLLECTION_VERSION_CHECK_INTERVAL", 0):
+            assert searcher.search("gluon", top_k=1)[0] == ["new_1"]
+
+class TestHybridKeywordLeg:
+    """BM25 как keyword-часть hybrid-стратегии"""
+
+    def test_hybrid_uses_bm25(self, index_path, corpus):
+        """Hybrid RAG добавляет документы, найденные BM25"""
+        semantic = {
+            "ids": [["arxiv_1706.03762"]],
+            "documents": [[corpus["arxiv_1706.03762"]]],
+            "metadatas": [[{"title": "Attention Is All You Need"}]],
+            "distances": [[0.2]]
+        }
+
+        def get_documents(ids):
+            return {"ids": ids, "documents": [corpus[i] for i in ids], "metadatas": [{"paper_id": i} for i in ids]}
+
+        with patch("app.modular_rag.keyword_searcher", KeywordSearcher(index_path)), \
+             patch.object(vector_db, "search", return_value=semantic), \
+             patch.object(vector_db, "get_documents", side_effect=get_documents):
+            result = ModularRAG().execute_rag("proton elastic form factor measurements", RAGStrategy.HYBRID, top_k=2)
+
+        assert result["search_type"] == "semantic_keyword"
+        assert any("Proton Elastic Form Factor" in doc for doc in result["documents"])
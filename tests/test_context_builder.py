@@ -0,0 +1,113 @@
+import pytest
+from unittest.mock import patch
+
+from app.context_builder import ContextBuilder, estimate_tokens, truncate_to_tokens
+from app.metrics import PerformanceMetrics
+from app.modular_rag import modular_rag
+from app.gemini_client import gemini_client
+from app.semantic_cache import semantic_cache
+
+
+def make_documents(count, words=100):
+    return [f"Title: Paper {i}\nAbstract: " + " ".join([f"word{i}"] * words) for i in range(count)]
+
+
+class TestContextBuilder:
+    """Тесты сборки контекста в пределах бюджета токенов"""
+
+    def test_fits_without_changes(self):
+        documents = make_documents(2, words=10)
+        built = ContextBuilder(max_tokens=1000).build(documents, [{"title": "A"}, {"title": "B"}])
+        assert built.documents == documents
+        assert built.dropped == 0 and built.truncated == 0
+        assert "[Source 1] A" in built.text and "[Source 2] B" in built.text
+
+    def test_budget_enforced(self):
+        documents = make_documents(10)
+        built = ContextBuilder(max_tokens=500, history_share=0.0).build(documents, [{}] * 10)
+        assert estimate_tokens(built.text) <= 500
+        assert built.source_tokens <= 500
+        assert built.dropped > 0
+
+    def test_lowest_scored_dropped_first(self):
+        documents = make_documents(3)
+        scores = [0.2, 0.9, 0.5]
+        # Влезают ровно два источника
+        budget = 2 * (estimate_tokens(documents[0]) + 10)
+        built = ContextBuilder(max_tokens=budget, history_share=0.0, min_section_tokens=1000).build(
+            documents, [{}, {}, {}], scores
+        )
+        assert built.documents == [documents[1], documents[2]]
+        assert built.dropped == 1
+
+    def test_lowest_scored_truncated(self):
+        documents = make_documents(2)
+        budget = estimate_tokens(documents[0]) + 70
+        built = ContextBuilder(max_tokens=budget, history_share=0.0, min_section_tokens=20).build(
+            documents, [{}, {}], [0.1, 0.9]
+        )
+        assert built.truncated == 1
+        assert built.documents[1] == documents[1]
+        assert built.documents[0].endswith("[...]")
+        assert built.source_tokens <= budget
+
+    def test_history_budget_drops_oldest(self):
+        history = [
+            {"question": f"Question {i}?", "answer": " ".join(["answer"] * 60)}
+            for i in range(5)
+        ]
+        built = ContextBuilder(max_tokens=1000, history_share=0.2, min_section_tokens=1000).build(
+            make_documents(1, words=5), [{}], history=history
+        )
+        assert built.history_tokens <= 200
+        assert 0 < built.history_turns < 5
+        # Новейшая реплика (первая в списке) сохраняется, старейшая - нет
+        assert "Question 0?" in built.text
+        assert "Question 4?" not in built.text
+
+    def test_unused_history_budget_goes_to_sources(self):
+        documents = make_documents(4)
+        builder = ContextBuilder(max_tokens=4 * (estimate_tokens(documents[0]) + 10), history_share=0.5)
+        built = builder.build(documents, [{}] * 4)
+        assert built.history_tokens == 0
+        assert built.documents == documents
+
+    def test_truncate_to_tokens(self):
+        text = " ".join(["token"] * 200)
+        truncated = truncate_to_tokens(text, 50)
+        assert estimate_tokens(truncated) <= 50
+        assert truncated.endswith(" [...]")
+        assert truncate_to_tokens("short", 50) == "short"
+
+
+class TestPromptMetrics:
+    """Размер промпта попадает в метрики"""
+
+    def test_query_records_prompt_tokens(self, client, no_rate_limit):
+        def execute_rag(question, strategy=None, **kwargs):
+            return {
+                "documents": ["Title: Attention Is All You Need\nAbstract: Transformers..."],
+                "metadatas": [{"title": "Attention Is All You Need"}],
+                "scores": [0.9],
+                "strategy": "basic",
+                "search_type": "semantic"
+            }
+
+        async def generate(prompt, temperature=0.1):
+            return "Transformers rely on self-attention."
+
+        fresh = PerformanceMetrics()
+        with patch.object(modular_rag, "execute_rag", side_effect=execute_rag), \
+             patch.object(gemini_client, "generate_response_async", side_effect=generate), \
+             patch.object(semantic_cache, "enabled", False), \
+             patch("app.main.metrics", fresh):
+            response = client.post("/query", json={"question": "What are transformers in prompt test?", "top_k": 1})
+
+        assert response.status_code == 200
+        assert response.json()["context"] == ["Title: Attention Is All You Need\nAbstract: Transformers..."]
+
+        prompt_tokens = fresh.get_metrics()["prompt_tokens"]
+        assert prompt_tokens["prompt"]["count"] == 1
+        assert prompt_tokens["sources"]["mean"] > 0
+        assert sum(h["count"] for h in prompt_tokens["llm_latency_by_prompt_size"].values()) == 1
+        assert 'rag_prompt_tokens_count{part="prompt"} 1' in fresh.prometheus()
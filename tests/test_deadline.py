@@ -0,0 +1,185 @@
+import pytest
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+from google.api_core import exceptions as google_exceptions
+
+from app.deadline import Deadline, DeadlineExceeded, current_deadline
+from app.modular_rag import ModularRAG, RAGStrategy, modular_rag
+from app.database import vector_db
+from app.gemini_client import GeminiClient, gemini_client, ERROR_RESPONSE
+from app.llm_governor import LLMGovernor
+from app.semantic_cache import semantic_cache
+
+BROAD = {
+    "ids": [["p1", "p2", "p3"]],
+    "documents": [["Transformer attention", "Graph networks", "Protein folding"]],
+    "metadatas": [[{"title": "p1"}, {"title": "p2"}, {"title": "p3"}]],
+    "distances": [[0.3, 0.4, 0.5]]
+}
+
+RAG_RESULT = {
+    "documents": ["Title: Attention Is All You Need\nAbstract: Transformers..."],
+    "metadatas": [{"title": "Attention Is All You Need"}],
+    "strategy": "basic",
+    "search_type": "semantic"
+}
+
+
+class TestDeadline:
+    """Тесты срока запроса"""
+
+    def test_unbounded(self):
+        deadline = Deadline()
+        assert deadline.remaining() == float("inf")
+        assert deadline.timeout() is None
+        assert not deadline.expired
+        deadline.check()
+
+    def test_expires(self):
+        deadline = Deadline(0.01)
+        assert deadline.allows(0.005)
+        assert not deadline.allows(1)
+        time.sleep(0.02)
+        assert deadline.expired
+        with pytest.raises(DeadlineExceeded):
+            deadline.check("llm")
+
+    def test_run_cancels_slow_work(self):
+        cancelled = False
+
+        async def slow():
+            nonlocal cancelled
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(Deadline(0.02).run(slow(), "llm"))
+        assert cancelled
+
+
+class TestRetrievalBudget:
+    """Опциональные шаги поиска пропускаются при малом остатке"""
+
+    def test_rerank_skipped_when_budget_short(self):
+        with patch.object(vector_db, "search", return_value=BROAD), \
+             patch("app.modular_rag.reranker") as reranker:
+            result = ModularRAG().execute_rag("how do transformers work", RAGStrategy.HIERARCHICAL,
+                                              deadline=Deadline(1.0), top_k=2)
+        reranker.rerank.assert_not_called()
+        assert result["documents"] == ["Transformer attention", "Graph networks"]
+
+    def test_rerank_runs_with_enough_budget(self):
+        with patch.object(vector_db, "search", return_value=BROAD), \
+             patch("app.modular_rag.reranker") as reranker:
+            reranker.rerank.side_effect = lambda question, hits: list(reversed(hits))
+            result = ModularRAG().execute_rag("how do transformers work", RAGStrategy.HIERARCHICAL,
+                                              deadline=Deadline(60), top_k=2)
+        reranker.rerank.assert_called_once()
+        assert result["documents"][0] == "Protein folding"
+
+    def test_keyword_leg_skipped_when_budget_short(self):
+        rag = ModularRAG()
+        with patch.object(vector_db, "search", return_value=BROAD), \
+             patch.object(rag, "_keyword_search") as keyword_search:
+            result = rag.execute_rag("what is transformer attention", RAGStrategy.HYBRID,
+                                     deadline=Deadline(1.0), top_k=2)
+        keyword_search.assert_not_called()
+        assert result["search_type"] == "semantic_only"
+
+    def test_expired_deadline_stops_retrieval(self):
+        deadline = Deadline(0.001)
+        time.sleep(0.01)
+        with patch.object(vector_db, "search") as search, pytest.raises(DeadlineExceeded):
+            ModularRAG().execute_rag("question", RAGStrategy.BASIC, deadline=deadline)
+        search.assert_not_called()
+
+
+class TestGenerationDeadline:
+    """Генерация отменяется по сроку и не повторяется, если повтор не успеет"""
+
+    def make_client(self, model):
+        client = GeminiClient(api_key="test")
+        client.model = model
+        client._generation_config = lambda temperature: None
+        return client
+
+    def test_slow_generation_cancelled(self):
+        async def slow(*args, **kwargs):
+            await asyncio.sleep(1)
+
+        model = MagicMock()
+        model.generate_content_async = AsyncMock(side_effect=slow)
+        governor = LLMGovernor()
+        with patch("app.gemini_client.llm_governor", governor), pytest.raises(DeadlineExceeded):
+            asyncio.run(self.make_client(model).generate_response_async("prompt", deadline=Deadline(0.05)))
+
+        # Истёкший срок - не сбой провайдера
+        assert governor.get_stats()["failures"] == 0
+        assert governor.in_flight == 0
+
+    def test_no_retry_past_deadline(self):
+        model = MagicMock()
+        model.generate_content_async = AsyncMock(
+            side_effect=google_exceptions.ResourceExhausted("Quota exceeded. Please retry in 10s.")
+        )
+        with patch("app.gemini_client.llm_governor", LLMGovernor()):
+            answer = asyncio.run(self.make_client(model).generate_response_async("prompt", deadline=Deadline(2)))
+        assert answer == ERROR_RESPONSE
+        assert model.generate_content_async.call_count == 1
+
+
+class TestQueryDeadline:
+    """Срок запроса в API"""
+
+    def test_query_returns_504_after_deadline(self, client, no_rate_limit):
+        async def slow_generate(prompt, temperature=0.1):
+            await asyncio.sleep(1)
+            return "late answer"
+
+        with patch.object(modular_rag, "execute_rag", return_value=RAG_RESULT), \
+             patch.object(gemini_client, "generate_response_async", side_effect=slow_generate), \
+             patch.object(semantic_cache, "enabled", False):
+            start = time.perf_counter()
+            response = client.post("/query", params={"session_id": "deadline_test"},
+                                   headers={"X-Request-Timeout": "0.2"},
+                                   json={"question": "What is attention in deadline test?", "top_k": 1})
+            elapsed = time.perf_counter() - start
+
+        assert response.status_code == 504
+        assert "Deadline" in response.json()["detail"]
+        assert elapsed < 0.9
+
+    def test_field_overrides_header(self, client, no_rate_limit):
+        seen = {}
+
+        def execute_rag(question, strategy=None, deadline=None, **kwargs):
+            seen["seconds"] = current_deadline().seconds
+            return RAG_RESULT
+
+        async def generate(prompt, temperature=0.1):
+            return "answer"
+
+        with patch.object(modular_rag, "execute_rag", side_effect=execute_rag), \
+             patch.object(gemini_client, "generate_response_async", side_effect=generate), \
+             patch.object(semantic_cache, "enabled", False):
+            response = client.post("/query", params={"session_id": "deadline_field_test"},
+                                   headers={"X-Request-Timeout": "5"},
+                                   json={"question": "What is attention in field test?", "top_k": 1, "timeout": 12})
+
+        assert response.status_code == 200
+        assert seen["seconds"] == 12
+
+    def test_invalid_header(self, client, no_rate_limit):
+        response = client.post("/query", headers={"X-Request-Timeout": "soon"}, json={"question": "anything"})
+        assert response.status_code == 400
+
+    @pytest.mark.parametrize("value", ["nan", "inf", "-inf"])
+    def test_non_finite_header(self, client, no_rate_limit, value):
+        """float() принимает "nan" и "inf", но срок из них не получится"""
+        response = client.post("/query", headers={"X-Request-Timeout": value}, json={"question": "anything"})
+        assert response.status_code == 400
+        assert "X-Request-Timeout" in response.json()["detail"]
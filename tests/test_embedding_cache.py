@@ -0,0 +1,98 @@
+import pytest
+import numpy as np
+from unittest.mock import MagicMock, patch
+
+from app.memory import ConversationMemory
+from app.database import vector_db
+from app.modular_rag import ModularRAG, RAGStrategy
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    def setex(self, key, ttl, value):
+        self.store[key] = value
+
+    def get(self, key):
+        return self.store.get(key)
+
+
+class TestEmbeddingCache:
+    """Тесты кэша эмбеддингов в ConversationMemory"""
+
+    def test_roundtrip_float32(self):
+        """Эмбеддинг возвращается как float32 без потерь"""
+        memory = ConversationMemory()
+        embedding = np.random.rand(384).astype(np.float32)
+        memory.cache_embedding("q", embedding)
+
+        cached = memory.get_cached_embedding("q")
+        assert cached.dtype == np.float32
+        np.testing.assert_array_equal(cached, embedding)
+
+    def test_memory_tier_is_bounded(self):
+        """In-memory кэш вытесняет давно не использованные эмбеддинги"""
+        memory = ConversationMemory(embedding_cache_size=2)
+        memory.cache_embedding("a", [1.0, 2.0])
+        memory.cache_embedding("b", [3.0, 4.0])
+        memory.get_cached_embedding("a")
+        memory.cache_embedding("c", [5.0, 6.0])
+
+        assert memory.get_cached_embedding("a") is not None
+        assert memory.get_cached_embedding("b") is None
+        assert len(memory._memory_cache) == 2
+
+    def test_expired_embedding_is_dropped(self):
+        """Просроченный эмбеддинг не возвращается и удаляется"""
+        memory = ConversationMemory()
+        with patch("app.memory.time.monotonic", return_value=100.0):
+            memory.cache_embedding("q", [1.0], ttl=10)
+        with patch("app.memory.time.monotonic", return_value=111.0):
+            assert memory.get_cached_embedding("q") is None
+        assert len(memory._memory_cache) == 0
+
+    def test_redis_stores_compact_bytes(self):
+        """В Redis хранятся сырые float32 байты, а не JSON"""
+        memory = ConversationMemory()
+        memory.redis_client = FakeRedis()
+        embedding = np.arange(384, dtype=np.float32)
+        memory.cache_embedding("q", embedding)
+
+        payload = memory.redis_client.store["embedding:q"]
+        assert isinstance(payload, bytes)
+        assert len(payload) == 384 * 4
+        np.testing.assert_array_equal(memory.get_cached_embedding("q"), embedding)
+
+
+class TestSearchUsesEmbeddingCache:
+    """VectorDatabase.search ищет по готовым эмбеддингам"""
+
+    @pytest.fixture
+    def fake_backend(self):
+        embed = MagicMock(side_effect=lambda texts: [np.full(4, float(len(t)), dtype=np.float32) for t in texts])
+        collection = MagicMock()
+        collection.query.return_value = {
+            "ids": [["a"]], "documents": [["doc"]], "metadatas": [[{}]], "distances": [[0.1]]
+        }
+        with patch.object(vector_db, "embedding_function", embed), \
+             patch.object(vector_db, "collection", collection):
+            yield embed, collection
+
+    def test_repeated_query_embeds_once(self, fake_backend):
+        """Повторный вопрос берёт эмбеддинг из кэша"""
+        embed, collection = fake_backend
+        vector_db.search("embedding cache question", top_k=1)
+        vector_db.search("embedding cache question", top_k=1)
+
+        assert embed.call_count == 1
+        params = collection.query.call_args.kwargs
+        assert "query_texts" not in params
+        assert len(params["query_embeddings"]) == 1
+
+    def test_hybrid_embeds_question_once(self, fake_backend):
+        """Hybrid-стратегия считает эмбеддинг вопроса один раз на оба поиска"""
+        embed, collection = fake_backend
+        ModularRAG().execute_rag("transformer attention mechanisms explained", RAGStrategy.HYBRID, top_k=1)
+
+        assert embed.call_count == 1
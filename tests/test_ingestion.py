@@ -0,0 +1,361 @@
+import pytest
+import gzip
+import json
+import time
+import threading
+import tracemalloc
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from app.ingestion import iter_papers, IngestionPipeline, IngestionCheckpoint, content_hash
+
+
+def make_papers(count):
+    return [
+        {"id": f"2001.{i:05d}", "title": f"Paper {i}", "authors": "A. Author",
+         "categories": "cs.LG", "abstract": "Text with a bracket ] and brace } inside. " * 5}
+        for i in range(count)
+    ]
+
+
+class TestStreamingReader:
+    """Тесты потокового чтения данных arXiv"""
+
+    def test_json_array(self, tmp_path):
+        """JSON-массив читается по одной статье, даже если элемент режется буфером"""
+        papers = make_papers(50)
+        path = tmp_path / "papers.json"
+        path.write_text(json.dumps(papers, indent=2), encoding="utf-8")
+
+        assert list(iter_papers(str(path), chunk_size=64)) == papers
+
+    def test_jsonl(self, tmp_path):
+        """JSONL с пустыми строками"""
+        papers = make_papers(20)
+        path = tmp_path / "papers.jsonl"
+        path.write_text("\n".join(json.dumps(p) for p in papers) + "\n\n", encoding="utf-8")
+
+        assert list(iter_papers(str(path), chunk_size=100)) == papers
+
+    def test_gzip_jsonl(self, tmp_path):
+        """Сжатый JSONL распознаётся по сигнатуре gzip"""
+        papers = make_papers(10)
+        path = tmp_path / "papers.jsonl.gz"
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            for paper in papers:
+                f.write(json.dumps(paper) + "\n")
+
+        assert list(iter_papers(str(path))) == papers
+
+    def test_empty_array(self, tmp_path):
+        path = tmp_path / "empty.json"
+        path.write_text("  [ ]  ", encoding="utf-8")
+        assert list(iter_papers(str(path))) == []
+
+    def test_truncated_array_raises(self, tmp_path):
+        """Обрезанный файл даёт ошибку, а не тихую потерю данных"""
+        path = tmp_path / "broken.json"
+        path.write_text(json.dumps(make_papers(3))[:-30], encoding="utf-8")
+
+        with pytest.raises(ValueError):
+            list(iter_papers(str(path), chunk_size=64))
+
+    def test_memory_does_not_grow_with_corpus(self, tmp_path):
+        """Пиковая память чтения не зависит от размера файла"""
+        path = tmp_path / "large.json"
+        path.write_text(json.dumps(make_papers(20000)), encoding="utf-8")
+        file_size = path.stat().st_size
+
+        tracemalloc.start()
+        count = sum(1 for _ in iter_papers(str(path), chunk_size=64 * 1024))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert count == 20000
+        assert peak < file_size / 10
+
+
+class RecordingDatabase:
+    def __init__(self, delay=0.0, fail_on_batch=None):
+        self.delay = delay
+        self.fail_on_batch = fail_on_batch
+        self.batches = []
+        self.stored = {}
+
+    def upsert_documents(self, documents, metadatas, ids, embeddings=None):
+        if self.fail_on_batch is not None and len(self.batches) == self.fail_on_batch:
+            raise RuntimeError("write failed")
+        time.sleep(self.delay)
+        self.batches.append((ids, documents, metadatas, embeddings))
+        for doc_id, metadata in zip(ids, metadatas):
+            self.stored[doc_id] = metadata
+
+    def get_content_hashes(self, ids):
+        return {doc_id: self.stored[doc_id]["content_hash"] for doc_id in ids if doc_id in self.stored}
+
+
+def fake_embed(documents, delay=0.0):
+    time.sleep(delay)
+    return np.array([[len(document), 1.0] for document in documents], dtype=np.float32)
+
+
+def make_records(count):
+    return [(f"id_{i}", "x" * (i % 7 + 1), {"n": i}) for i in range(count)]
+
+
+class TestIngestionPipeline:
+    """Тесты конвейера загрузки: разбор -> эмбеддинги -> запись"""
+
+    def test_writes_all_records_in_order(self):
+        """Все записи доходят до БД в исходном порядке вместе со своими эмбеддингами"""
+        records = make_records(23)
+        database = RecordingDatabase()
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            stats = IngestionPipeline(database, workers=3, batch_size=5, executor=executor,
+                                      embed_fn=fake_embed).run(iter(records))
+
+        assert stats["papers"] == 23
+        assert stats["batches"] == 5
+        written = [(i, d, m) for ids, docs, metas, _ in database.batches for i, d, m in zip(ids, docs, metas)]
+        assert [(i, d, {k: v for k, v in m.items() if k != "content_hash"}) for i, d, m in written] == records
+        assert all(m["content_hash"] == content_hash(d, m) for _, d, m in written)
+        for ids, docs, _, embeddings in database.batches:
+            assert embeddings.shape == (len(ids), 2)
+            assert embeddings[:, 0].tolist() == [len(d) for d in docs]
+
+    def test_stages_overlap(self):
+        """Эмбеддинг и запись идут параллельно: время ближе к самой медленной стадии, чем к сумме"""
+        batches, embed_delay, write_delay = 16, 0.03, 0.01
+        records = make_records(batches * 4)
+        sequential = batches * (embed_delay + write_delay)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            start = time.perf_counter()
+            IngestionPipeline(RecordingDatabase(delay=write_delay), workers=4, batch_size=4, executor=executor,
+                              embed_fn=lambda docs: fake_embed(docs, embed_delay)).run(iter(records))
+            elapsed = time.perf_counter() - start
+
+        assert elapsed < sequential * 0.6
+
+    def test_backpressure_limits_read_ahead(self):
+        """Медленный писатель не даёт разбору убежать вперёд на весь файл"""
+        consumed = []
+
+        def records():
+            for record in make_records(400):
+                consumed.append(record)
+                yield record
+
+        database = RecordingDatabase(delay=0.02)
+        pipeline = IngestionPipeline(database, workers=2, batch_size=10, queue_size=2,
+                                     executor=ThreadPoolExecutor(max_workers=2), embed_fn=fake_embed)
+        max_ahead = []
+        original_add = database.upsert_documents
+
+        def tracking_add(*args, **kwargs):
+            original_add(*args, **kwargs)
+            written = sum(len(batch[0]) for batch in database.batches)
+            max_ahead.append(len(consumed) - written)
+
+        database.upsert_documents = tracking_add
+        pipeline.run(records())
+
+        # Очереди по 2 батча + до workers*2 батчей в работе + текущие батчи стадий
+        assert max(max_ahead) <= 10 * (2 + 2 + 2 * 2 + 3)
+
+    def test_write_error_propagates(self):
+        """Ошибка записи прерывает загрузку и пробрасывается наружу"""
+        database = RecordingDatabase(fail_on_batch=1)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            pipeline = IngestionPipeline(database, workers=2, batch_size=5, queue_size=1,
+                                         executor=executor, embed_fn=fake_embed)
+            with pytest.raises(RuntimeError):
+                pipeline.run(iter(make_records(200)))
+
+    def test_embedding_error_propagates(self):
+        def broken_embed(documents):
+            raise ValueError("model failed")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            pipeline = IngestionPipeline(RecordingDatabase(), workers=2, batch_size=5, queue_size=1,
+                                         executor=executor, embed_fn=broken_embed)
+            with pytest.raises(ValueError):
+                pipeline.run(iter(make_records(200)))
+
+
+    def test_embedding_error_with_slow_source_does_not_hang(self):
+        """Разбор, задержавшийся на чтении источника, после ошибки всё равно завершается"""
+        def broken_embed(documents):
+            raise ValueError("model failed")
+
+        def slow_records():
+            records = make_records(100)
+            yield from records[:12]
+            # Ошибка эмбеддинга случается, пока разбор ждёт источник с неполным батчем
+            time.sleep(1.5)
+            yield from records[12:]
+
+        errors = []
+
+        def run():
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                pipeline = IngestionPipeline(RecordingDatabase(), workers=1, batch_size=5, queue_size=1,
+                                             executor=executor, embed_fn=broken_embed)
+                try:
+                    pipeline.run(slow_records())
+                except ValueError as e:
+                    errors.append(e)
+
+        runner = threading.Thread(target=run, daemon=True)
+        runner.start()
+        runner.join(timeout=10)
+        assert not runner.is_alive()
+        assert len(errors) == 1
+
+def run_pipeline(database, records, checkpoint=None, batch_size=5):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pipeline = IngestionPipeline(database, workers=2, batch_size=batch_size, executor=executor, embed_fn=fake_embed)
+        return pipeline.run(iter(records), checkpoint=checkpoint)
+
+
+class TestIncrementalIngestion:
+    """Тесты повторной и прерванной загрузки"""
+
+    def test_rerun_skips_unchanged(self):
+        """Повторная загрузка того же корпуса ничего не эмбеддит"""
+        database = RecordingDatabase()
+        records = make_records(20)
+        run_pipeline(database, records)
+
+        stats = run_pipeline(database, records)
+        assert stats["papers"] == 0
+        assert stats["skipped"] == 20
+        assert len(database.batches) == 4
+
+    def test_only_new_and_changed_are_upserted(self):
+        database = RecordingDatabase()
+        records = make_records(20)
+        run_pipeline(database, records)
+
+        records[3] = ("id_3", "updated abstract", {"n": 3})
+        records.append(("id_new", "new paper", {"n": 99}))
+        stats = run_pipeline(database, records)
+
+        assert stats["papers"] == 2
+        assert stats["skipped"] == 19
+        upserted = [doc_id for ids, _, _, _ in database.batches[4:] for doc_id in ids]
+        assert upserted == ["id_3", "id_new"]
+
+    def test_metadata_change_changes_hash(self):
+        assert content_hash("text", {"title": "a"}) != content_hash("text", {"title": "b"})
+        assert content_hash("text", {"title": "a"}) == content_hash("text", {"title": "a", "content_hash": "x"})
+
+    def test_resume_after_interruption(self, tmp_path):
+        """После падения загрузка продолжается с последнего записанного батча"""
+        source = tmp_path / "papers.jsonl"
+        source.write_text("data", encoding="utf-8")
+        manifest = str(tmp_path / "manifest.json")
+        records = make_records(30)
+
+        failing = RecordingDatabase(fail_on_batch=3)
+        with pytest.raises(RuntimeError):
+            run_pipeline(failing, records, IngestionCheckpoint(manifest, str(source)))
+
+        checkpoint = IngestionCheckpoint(manifest, str(source))
+        assert checkpoint.position == 15
+        assert not checkpoint.completed
+
+        consumed = []
+
+        def tracked():
+            for record in records:
+                consumed.append(record)
+                yield record
+
+        database = RecordingDatabase()
+        database.stored = dict(failing.stored)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            stats = IngestionPipeline(database, workers=2, batch_size=5, executor=executor,
+                                      embed_fn=fake_embed).run(tracked(), checkpoint=checkpoint)
+
+        assert stats["papers"] == 15
+        assert stats["skipped"] == 0
+        assert IngestionCheckpoint(manifest, str(source)).completed
+
+        # Завершённая загрузка того же файла не читает его повторно
+        consumed.clear()
+        stats = IngestionPipeline(database, workers=2, batch_size=5).run(tracked(), checkpoint=IngestionCheckpoint(manifest, str(source)))
+        assert stats["papers"] == 0
+        assert consumed == []
+
+    def test_changed_source_resets_position(self, tmp_path):
+        """Изменение файла источника сбрасывает позицию манифеста"""
+        source = tmp_path / "papers.jsonl"
+        source.write_text("data", encoding="utf-8")
+        manifest = str(tmp_path / "manifest.json")
+        IngestionCheckpoint(manifest, str(source)).save(100, completed=True)
+
+        source.write_text("rewritten data", encoding="utf-8")
+        checkpoint = IngestionCheckpoint(manifest, str(source))
+        assert checkpoint.position == 0
+        assert not checkpoint.completed
+
+    def test_appended_source_resumes(self, tmp_path):
+        """Дописанные в конец статьи загружаются без повторного чтения прежних"""
+        source = tmp_path / "papers.jsonl"
+        records = make_records(30)
+        source.write_text("".join(f"{json.dumps(r[0])}\n" for r in records[:20]), encoding="utf-8")
+        manifest = str(tmp_path / "manifest.json")
+        database = RecordingDatabase()
+        run_pipeline(database, records[:20], IngestionCheckpoint(manifest, str(source)))
+
+        with open(source, "a", encoding="utf-8") as f:
+            f.write("".join(f"{json.dumps(r[0])}\n" for r in records[20:]))
+        checkpoint = IngestionCheckpoint(manifest, str(source))
+        assert checkpoint.appended
+        assert checkpoint.position == 20
+        assert not checkpoint.completed and not checkpoint.interrupted
+
+        consumed = []
+
+        def tracked():
+            for record in records:
+                consumed.append(record)
+                yield record
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            pipeline = IngestionPipeline(database, workers=2, batch_size=5, executor=executor, embed_fn=fake_embed)
+            stats = pipeline.run(tracked(), checkpoint=checkpoint)
+
+        # Прежние записи только пропущены по позиции, без хэшей и обращений к БД
+        assert stats["papers"] == 10
+        assert stats["skipped"] == 0
+        assert pipeline.upserted_ids == [record[0] for record in records[20:]]
+        assert IngestionCheckpoint(manifest, str(source)).completed
+
+    def test_upserted_ids_tracking_is_bounded(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            pipeline = IngestionPipeline(RecordingDatabase(), workers=2, batch_size=5, executor=executor,
+                                         embed_fn=fake_embed, max_tracked_ids=12)
+            pipeline.run(iter(make_records(20)))
+        assert pipeline.upserted_ids is None
+
+    def test_capped_run_resumes_without_cap(self, tmp_path):
+        """Загрузка с лимитом статей не считается завершённой для загрузки без лимита"""
+        source = tmp_path / "papers.jsonl"
+        source.write_text("data", encoding="utf-8")
+        manifest = str(tmp_path / "manifest.json")
+        records = make_records(30)
+
+        database = RecordingDatabase()
+        run_pipeline(database, records[:10], IngestionCheckpoint(manifest, str(source), limit=10))
+        assert IngestionCheckpoint(manifest, str(source), limit=10).completed
+
+        checkpoint = IngestionCheckpoint(manifest, str(source))
+        assert not checkpoint.completed
+        assert checkpoint.position == 10
+
+        stats = run_pipeline(database, records, checkpoint)
+        assert stats["papers"] == 20
+        assert stats["skipped"] == 0
+        assert len(database.stored) == 30
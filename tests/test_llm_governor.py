@@ -0,0 +1,222 @@
+import pytest
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from google.api_core import exceptions as google_exceptions
+
+from app.gemini_client import GeminiClient, ERROR_RESPONSE
+from app.llm_governor import (
+    LLMGovernor, CircuitBreaker, CircuitOpenError, QueueTimeoutError, error_status, retry_after_seconds, full_jitter
+)
+
+
+def make_response(text="answer"):
+    return SimpleNamespace(prompt_feedback=SimpleNamespace(block_reason=None), parts=[text], text=text)
+
+
+def make_client(model):
+    client = GeminiClient(api_key="test")
+    client.model = model
+    client._generation_config = lambda temperature: None
+    return client
+
+
+class TestErrorClassification:
+    """Разбор ошибок провайдера"""
+
+    def test_status(self):
+        assert error_status(google_exceptions.ResourceExhausted("Quota exceeded")) == 429
+        assert error_status(google_exceptions.InvalidArgument("bad prompt")) == 400
+        assert error_status(RuntimeError("503 Service Unavailable")) == 503
+        assert error_status(ConnectionError("reset by peer")) is None
+
+    def test_retry_after(self):
+        error = RuntimeError("limited")
+        error.response = SimpleNamespace(headers={"Retry-After": "7"})
+        assert retry_after_seconds(error) == 7.0
+
+        delay = SimpleNamespace(seconds=3, nanos=500_000_000)
+        grpc_error = google_exceptions.ResourceExhausted("Quota", details=[SimpleNamespace(retry_delay=delay)])
+        assert retry_after_seconds(grpc_error) == 3.5
+
+        assert retry_after_seconds(RuntimeError("429 Quota exceeded. Please retry in 12.5s.")) == 12.5
+        assert retry_after_seconds(RuntimeError("boom")) is None
+
+    def test_full_jitter_bounds(self):
+        delays = [full_jitter(attempt=3, base=1.0, cap=5.0) for _ in range(200)]
+        assert all(0 <= delay <= 5.0 for delay in delays)
+        # Паузы разные: одновременно упавшие запросы не повторяют разом
+        assert len(set(delays)) > 100
+
+
+class TestRetryDelay:
+    """Решение о повторе"""
+
+    def test_client_error_not_retried(self):
+        governor = LLMGovernor()
+        assert governor.retry_delay(google_exceptions.PermissionDenied("bad key"), attempt=0) is None
+
+    def test_last_attempt_not_retried(self):
+        governor = LLMGovernor(max_retries=2)
+        assert governor.retry_delay(RuntimeError("boom"), attempt=0) is not None
+        assert governor.retry_delay(RuntimeError("boom"), attempt=1) is None
+
+    def test_retry_after_honored(self):
+        governor = LLMGovernor(backoff_base=0.5, backoff_max=20)
+        delay = governor.retry_delay(RuntimeError("429 Please retry in 4s"), attempt=0)
+        assert 4.0 <= delay <= 4.5
+        # Дольше backoff_max не ждём - запрос получит ошибку сразу
+        assert governor.retry_delay(RuntimeError("429 Please retry in 60s"), attempt=0) is None
+
+
+class TestCircuitBreaker:
+    """Тесты circuit breaker"""
+
+    def test_opens_and_recovers(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.before_call()
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+        time.sleep(0.06)
+        assert breaker.before_call() is True
+        # Пока идёт пробный вызов, остальные отклоняются
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        breaker.before_call()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert breaker.opens == 2
+
+
+class TestAdaptiveConcurrency:
+    """AIMD-ограничение параллелизма"""
+
+    def test_limits_in_flight(self):
+        governor = LLMGovernor(max_concurrency=2)
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            async with governor.slot():
+                peak = max(peak, governor.in_flight)
+                await asyncio.sleep(0.01)
+
+        async def scenario():
+            await asyncio.gather(*(call() for _ in range(6)))
+
+        asyncio.run(scenario())
+        assert peak == 2
+        assert governor.in_flight == 0
+        assert governor.get_stats()["calls"] == 6
+
+    def test_throttle_halves_once_per_generation(self):
+        governor = LLMGovernor(max_concurrency=8, min_concurrency=1, breaker=CircuitBreaker(failure_threshold=100))
+        started = asyncio.Event()
+
+        async def throttled():
+            async with governor.slot():
+                await started.wait()
+                raise google_exceptions.ResourceExhausted("Quota exceeded")
+
+        async def scenario():
+            calls = [asyncio.ensure_future(throttled()) for _ in range(4)]
+            await asyncio.sleep(0)
+            started.set()
+            return await asyncio.gather(*calls, return_exceptions=True)
+
+        asyncio.run(scenario())
+        # Четыре 429 от одного поколения вызовов - одно уменьшение
+        assert governor.concurrency_limit == 4
+        assert governor.get_stats()["throttled"] == 4
+
+        async def succeed():
+            async with governor.slot():
+                pass
+
+        async def recover():
+            for _ in range(20):
+                await succeed()
+
+        asyncio.run(recover())
+        assert governor.concurrency_limit > 4
+
+    def test_queue_timeout(self):
+        governor = LLMGovernor(max_concurrency=1, queue_timeout=0.02)
+
+        async def hold():
+            async with governor.slot():
+                await asyncio.sleep(0.1)
+
+        async def scenario():
+            holder = asyncio.ensure_future(hold())
+            await asyncio.sleep(0)
+            with pytest.raises(QueueTimeoutError):
+                async with governor.slot():
+                    pass
+            await holder
+
+        asyncio.run(scenario())
+        assert governor.in_flight == 0
+        assert governor.get_stats()["rejected"] == 1
+
+
+class TestGeminiClientRetries:
+    """GeminiClient повторяет через governor"""
+
+    def test_retries_then_succeeds(self):
+        model = MagicMock()
+        model.generate_content_async = AsyncMock(side_effect=[
+            google_exceptions.ServiceUnavailable("overloaded"), make_response("answer")
+        ])
+        governor = LLMGovernor(backoff_base=0.01, backoff_max=0.05)
+        with patch("app.gemini_client.llm_governor", governor):
+            answer = asyncio.run(make_client(model).generate_response_async("prompt"))
+        assert answer == "answer"
+        assert governor.get_stats()["retries"] == 1
+
+    def test_open_breaker_fails_fast(self):
+        model = MagicMock()
+        model.generate_content_async = AsyncMock(side_effect=google_exceptions.InternalServerError("down"))
+        governor = LLMGovernor(max_retries=3, backoff_base=0.001, backoff_max=0.01,
+                               breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        client = make_client(model)
+        with patch("app.gemini_client.llm_governor", governor):
+            assert asyncio.run(client.generate_response_async("prompt")) == ERROR_RESPONSE
+            calls = model.generate_content_async.call_count
+            assert asyncio.run(client.generate_response_async("prompt")) == ERROR_RESPONSE
+
+        # Цепь разомкнулась после двух ошибок, второй запрос до провайдера не дошёл
+        assert calls == 2
+        assert model.generate_content_async.call_count == 2
+        assert governor.get_stats()["circuit_breaker"]["state"] == "open"
+        assert governor.get_stats()["rejected"] == 1
+
+    def test_sync_client_error_not_retried(self):
+        model = MagicMock()
+        model.generate_content.side_effect = google_exceptions.InvalidArgument("bad request")
+        governor = LLMGovernor()
+        with patch("app.gemini_client.llm_governor", governor):
+            assert make_client(model).generate_response("prompt") == ERROR_RESPONSE
+        assert model.generate_content.call_count == 1
+        assert governor.breaker.state == "closed"
+
+
+class TestMetricsEndpoint:
+    """Состояние governor на /metrics"""
+
+    def test_metrics_include_governor(self, client):
+        data = client.get("/metrics").json()
+        assert data["llm"]["circuit_breaker"]["state"] in ("closed", "open", "half_open")
+        assert "concurrency_limit" in data["llm"]
@@ -0,0 +1,93 @@
+import pytest
+import numpy as np
+from unittest.mock import patch
+
+from app.metrics import LatencyHistogram, PerformanceMetrics, LATENCY_BUCKETS
+from app.modular_rag import modular_rag
+from app.semantic_cache import semantic_cache
+
+
+@pytest.fixture
+def fresh_metrics():
+    """Подменяет глобальные метрики пустыми на время теста"""
+    fresh = PerformanceMetrics()
+    with patch("app.main.metrics", fresh):
+        yield fresh
+
+
+class TestLatencyHistogram:
+    """Тесты гистограммы задержек"""
+
+    def test_quantiles_close_to_exact(self):
+        """Оценка p50/p95/p99 в пределах ширины корзины от точного значения"""
+        rng = np.random.default_rng(0)
+        samples = rng.lognormal(mean=-1.0, sigma=0.8, size=20000)
+        histogram = LatencyHistogram()
+        for value in samples:
+            histogram.observe(float(value))
+
+        for q in (0.5, 0.95, 0.99):
+            exact = float(np.quantile(samples, q))
+            index = np.searchsorted(LATENCY_BUCKETS, exact)
+            width = LATENCY_BUCKETS[index] - (LATENCY_BUCKETS[index - 1] if index else 0.0)
+            assert abs(histogram.quantile(q) - exact) <= width
+
+    def test_memory_is_fixed(self):
+        histogram = LatencyHistogram()
+        for i in range(10000):
+            histogram.observe(i / 1000)
+        assert len(histogram.counts) == len(LATENCY_BUCKETS) + 1
+        assert histogram.count == 10000
+        assert histogram.quantile(0.99) <= histogram.max
+
+    def test_empty(self):
+        assert LatencyHistogram().summary()["p99"] == 0.0
+
+
+class TestMetricsEndpoints:
+    """Тесты сбора метрик через middleware"""
+
+    def test_health_and_metrics_polling_excluded(self, client, fresh_metrics):
+        for _ in range(5):
+            client.get("/health")
+            client.get("/metrics")
+        client.get("/strategies")
+
+        data = client.get("/metrics").json()
+        assert data["total_requests"] == 1
+        assert list(data["latency"]["by_endpoint"]) == ["GET /strategies"]
+
+    def test_route_template_used_as_endpoint(self, client, fresh_metrics):
+        client.get("/conversation/one")
+        client.get("/conversation/two")
+        by_endpoint = client.get("/metrics").json()["latency"]["by_endpoint"]
+        assert by_endpoint["GET /conversation/{session_id}"]["count"] == 2
+
+    def test_failed_query_counted_once(self, client, fresh_metrics, no_rate_limit):
+        """Ошибка /query учитывается один раз, со статусом 500 и стратегией"""
+        with patch.object(modular_rag, "execute_rag", side_effect=RuntimeError("boom")), \
+             patch.object(semantic_cache, "enabled", False):
+            response = client.post("/query", json={"question": "failing question", "strategy": "hybrid"})
+
+        assert response.status_code == 500
+        data = client.get("/metrics").json()
+        assert data["total_requests"] == 1
+        assert data["error_count"] == 1
+        assert data["latency"]["by_status"]["500"]["count"] == 1
+        assert data["latency"]["by_strategy"]["hybrid"]["count"] == 1
+
+    def test_prometheus_exposition(self, client, fresh_metrics):
+        client.get("/strategies")
+        client.get("/strategies")
+
+        response = client.get("/metrics/prometheus")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+
+        lines = response.text.splitlines()
+        assert "# TYPE rag_request_duration_seconds histogram" in lines
+        labels = 'method="GET",endpoint="/strategies",strategy="none",status="200"'
+        assert f'rag_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+        assert f"rag_request_duration_seconds_count{{{labels}}} 2" in lines
+        buckets = [int(line.rsplit(" ", 1)[1]) for line in lines if line.startswith("rag_request_duration_seconds_bucket")]
+        assert buckets == sorted(buckets)
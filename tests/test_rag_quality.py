@@ -1,78 +1,182 @@
-import pytest
-import json
-from unittest.mock import Mock, patch
-from app.modular_rag import ModularRAG, RAGStrategy
-from app.database import vector_db
-
-class TestRAGQuality:
-    """Тесты качества RAG системы"""
-    
-    def test_basic_rag_returns_documents(self, sample_arxiv_data):
-        """Тест что basic RAG возвращает документы"""
-        rag = ModularRAG()
-        question = "What are transformers in AI?"
-        
-        with patch.object(vector_db, 'search') as mock_search:
-            mock_search.return_value = {
-                'documents': [[
-                    "Title: Attention Is All You Need\nAbstract: The dominant sequence transduction models...",
-                    "Title: BERT: Pre-training of Deep Bidirectional Transformers\nAbstract: We introduce a new language representation model..."
-                ]],
-                'metadatas': [[
-                    {"title": "Attention Is All You Need", "authors": "Vaswani et al."},
-                    {"title": "BERT: Pre-training of Deep Bidirectional Transformers", "authors": "Devlin et al."}
-                ]]
-            }
-            
-            result = rag.execute_rag(question, RAGStrategy.BASIC)
-            
-            assert 'documents' in result
-            assert len(result['documents']) > 0
-            assert result['strategy'] == 'basic'
-    
-    def test_hierarchical_rag_reranking(self):
-        """Тест что hierarchical RAG выполняет переранжирование"""
-        rag = ModularRAG()
-        question = "transformer architecture attention mechanism"
-        
-        with patch.object(vector_db, 'search') as mock_search:
-            mock_search.return_value = {
-                'documents': [[
-                    "Title: Some Paper\nAbstract: Unrelated content here...",
-                    "Title: Attention Is All You Need\nAbstract: Transformer architecture with attention...",
-                    "Title: Another Paper\nAbstract: More unrelated content..."
-                ]],
-                'metadatas': [[{}, {}, {}]]
-            }
-            
-            result = rag.execute_rag(question, RAGStrategy.HIERARCHICAL)
-            
-            assert 'documents' in result
-            assert len(result['documents']) > 0
-    
-    def test_adaptive_rag_strategy_selection(self):
-        """Тест что adaptive RAG выбирает стратегию по сложности вопроса"""
-        rag = ModularRAG()
-        
-        simple_question = "What is AI?"
-        result_simple = rag.execute_rag(simple_question, RAGStrategy.ADAPTIVE)
-        
-        complex_question = "How does the self-attention mechanism in transformers differ from traditional RNN approaches and what are the computational advantages?"
-        result_complex = rag.execute_rag(complex_question, RAGStrategy.ADAPTIVE)
-        
-        assert 'documents' in result_simple
-        assert 'documents' in result_complex
-    
-    def test_hybrid_rag_keyword_extraction(self):
-        """Тест что hybrid RAG извлекает ключевые слова"""
-        rag = ModularRAG()
-        question = "What are the main advantages of transformer models over recurrent neural networks?"
-        
-        keywords = rag._extract_keywords(question)
-        
-        assert len(keywords) > 0
-        assert 'advantages' in keywords
-        assert 'transformer' in keywords
-        assert 'recurrent' in keywords
-        assert 'what' not in keywords
-        assert 'the' not in keywords
\ No newline at end of file
+import pytest
+import json
+from unittest.mock import Mock, patch
+from app.modular_rag import ModularRAG, RAGStrategy
+from app.database import vector_db
+
+class TestRAGQuality:
+    """Тесты качества RAG системы"""
+    
+    def test_basic_rag_returns_documents(self, sample_arxiv_data):
+        """Тест что basic RAG возвращает документы"""
+        rag = ModularRAG()
+        question = "What are transformers in AI?"
+        
+        with patch.object(vector_db, 'search') as mock_search:
+            mock_search.return_value = {
+                'documents': [[
+                    "Title: Attention Is All You Need\nAbstract: The dominant sequence transduction models...",
+                    "Title: BERT: Pre-training of Deep Bidirectional Transformers\nAbstract: We introduce a new language representation model..."
+                ]],
+                'metadatas': [[
+                    {"title": "Attention Is All You Need", "authors": "Vaswani et al."},
+                    {"title": "BERT: Pre-training of Deep Bidirectional Transformers", "authors": "Devlin et al."}
+                ]]
+            }
+            
+            result = rag.execute_rag(question, RAGStrategy.BASIC)
+            
+            assert 'documents' in result
+            assert len(result['documents']) > 0
+            assert result['strategy'] == 'basic'
+    
+    def test_hierarchical_rag_reranking(self):
+        """Тест что hierarchical RAG выполняет переранжирование"""
+        rag = ModularRAG()
+        question = "transformer architecture attention mechanism"
+        
+        with patch.object(vector_db, 'search') as mock_search:
+            mock_search.return_value = {
+                'documents': [[
+                    "Title: Some Paper\nAbstract: Unrelated content here...",
+                    "Title: Attention Is All You Need\nAbstract: Transformer architecture with attention...",
+                    "Title: Another Paper\nAbstract: More unrelated content..."
+                ]],
+                'metadatas': [[{}, {}, {}]]
+            }
+            
+            result = rag.execute_rag(question, RAGStrategy.HIERARCHICAL)
+            
+            assert 'documents' in result
+            assert len(result['documents']) > 0
+    
+    def test_adaptive_rag_strategy_selection(self):
+        """Тест что adaptive RAG выбирает стратегию по сложности вопроса"""
+        rag = ModularRAG()
+        
+        simple_question = "What is AI?"
+        result_simple = rag.execute_rag(simple_question, RAGStrategy.ADAPTIVE)
+        
+        complex_question = "How does the self-attention mechanism in transformers differ from traditional RNN approaches and what are the computational advantages?"
+        result_complex = rag.execute_rag(complex_question, RAGStrategy.ADAPTIVE)
+        
+        assert 'documents' in result_simple
+        assert 'documents' in result_complex
+    
+    def test_hybrid_rag_keyword_extraction(self):
+        """Тест что hybrid RAG извлекает ключевые слова"""
+        rag = ModularRAG()
+        question = "What are the main advantages of transformer models over recurrent neural networks?"
+        
+        keywords = rag._extract_keywords(question)
+        
+        assert len(keywords) > 0
+        assert 'advantages' in keywords
+        assert 'transformer' in keywords
+        assert 'recurrent' in keywords
+        assert 'what' not in keywords
+        assert 'the' not in keywords
+    
+    def _fusion_inputs(self):
+        semantic = {
+            'ids': [["a", "b", "c"]],
+            'documents': [["doc a", "doc b", "doc c"]],
+            'metadatas': [[{"title": "A"}, {"title": "B"}, {"title": "C"}]],
+            'distances': [[0.1, 0.2, 0.6]]
+        }
+        keyword = {
+            'ids': [["c", "d"]],
+            'documents': [["doc c", "doc d"]],
+            'metadatas': [[{"title": "C"}, {"title": "D"}]],
+            'scores': [[12.0, 3.0]]
+        }
+        return semantic, keyword
+    
+    def test_merge_results_rrf_truncates_to_top_k(self):
+        """RRF поднимает документ, найденный обеими ветками, и режет до top_k"""
+        rag = ModularRAG()
+        semantic, keyword = self._fusion_inputs()
+        
+        merged = rag._merge_results(semantic, keyword, alpha=0.5, top_k=2, method="rrf")
+        
+        assert merged['ids'] == ["c", "a"]
+        assert len(merged['documents']) == 2
+        assert [meta["title"] for meta in merged['metadatas']] == ["C", "A"]
+        assert merged['documents'] == ["doc c", "doc a"]
+        assert merged['scores'] == sorted(merged['scores'], reverse=True)
+    
+    def test_merge_results_weighted_respects_alpha(self):
+        """Взвешенное слияние: alpha=1 - только семантика, alpha=0 - только keyword"""
+        rag = ModularRAG()
+        semantic, keyword = self._fusion_inputs()
+        
+        semantic_only = rag._merge_results(semantic, keyword, alpha=1.0, top_k=3, method="weighted")
+        keyword_only = rag._merge_results(semantic, keyword, alpha=0.0, top_k=1, method="weighted")
+        
+        assert semantic_only['ids'] == ["a", "b", "c"]
+        assert keyword_only['ids'] == ["c"]
+        assert keyword_only['metadatas'] == [{"title": "C"}]
+    
+    def test_hybrid_returns_at_most_top_k(self):
+        """Hybrid больше не возвращает до 2*top_k документов"""
+        rag = ModularRAG()
+        semantic, keyword = self._fusion_inputs()
+        
+        with patch.object(vector_db, 'search', return_value=semantic), \
+             patch.object(rag, '_keyword_search', return_value=keyword):
+            result = rag.execute_rag("transformer attention mechanisms", RAGStrategy.HYBRID, top_k=2)
+        
+        assert len(result['documents']) == 2
+        assert len(result['metadatas']) == 2
+        assert result['search_type'] == "semantic_keyword"
+    
+    def test_batch_rag_single_vector_query(self):
+        """Пакетный RAG делает один векторный поиск и отдаёт каждой стратегии нужный префикс"""
+        rag = ModularRAG()
+        
+        def search_batch(questions, top_k):
+            return [
+                {
+                    "ids": [[f"{q}_{i}" for i in range(top_k)]],
+                    "documents": [[f"doc {q} {i}" for i in range(top_k)]],
+                    "metadatas": [[{"title": f"{q} {i}"} for i in range(top_k)]],
+                    "distances": [[0.1 * i for i in range(top_k)]],
+                    "scores": [[1.0 - 0.1 * i for i in range(top_k)]]
+                }
+                for q in questions
+            ]
+        
+        with patch.object(vector_db, 'search_batch', side_effect=search_batch) as mock_batch, \
+             patch.object(vector_db, 'search') as mock_search:
+            results = rag.execute_rag_batch(["q1", "q2", "q3"], RAGStrategy.BASIC, top_k=2)
+        
+        mock_batch.assert_called_once_with(["q1", "q2", "q3"], top_k=2)
+        mock_search.assert_not_called()
+        assert [result['ids'] for result in results] == [["q1_0", "q1_1"], ["q2_0", "q2_1"], ["q3_0", "q3_1"]]
+    
+    def test_batch_rag_candidate_k_per_strategy(self):
+        """Кандидатов запрашивается столько, сколько нужно самой требовательной стратегии"""
+        rag = ModularRAG()
+        
+        assert rag._candidate_k("anything", RAGStrategy.HYBRID, 3) == 6
+        assert rag._candidate_k("anything", RAGStrategy.HIERARCHICAL, 3) == 10
+        assert rag._candidate_k("How does it work", RAGStrategy.ADAPTIVE, 3) == 15
+        assert rag._candidate_k("transformers", RAGStrategy.ADAPTIVE, 3) == 3
+    
+    def test_batch_rag_reports_failures_in_place(self):
+        """Ошибка одного вопроса не роняет пакет"""
+        rag = ModularRAG()
+        empty = {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]], "scores": [[]]}
+        original = rag.execute_rag
+        
+        def flaky(question, strategy, **kwargs):
+            if question == "bad":
+                raise RuntimeError("boom")
+            return original(question, strategy, **kwargs)
+        
+        with patch.object(vector_db, 'search_batch', return_value=[empty, empty]), \
+             patch.object(rag, 'execute_rag', side_effect=flaky):
+            results = rag.execute_rag_batch(["good", "bad"], RAGStrategy.BASIC, top_k=2)
+        
+        assert results[0]['documents'] == []
+        assert isinstance(results[1], RuntimeError)
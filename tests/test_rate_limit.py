@@ -0,0 +1,157 @@
+import pytest
+import asyncio
+import time
+from fastapi import FastAPI, Depends
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from app.rate_limit import RateLimiter, RedisBuckets, parse_rate
+
+
+def make_app(limiter):
+    app = FastAPI()
+
+    @app.get("/cheap", dependencies=[Depends(limiter.bucket("cheap"))])
+    async def cheap():
+        return {"ok": True}
+
+    @app.post("/llm", dependencies=[Depends(limiter.bucket("llm"))])
+    async def llm():
+        return {"ok": True}
+
+    @app.post("/batch", dependencies=[Depends(limiter.bucket("llm", cost=2))])
+    async def batch():
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def make_request(headers=None, query="", client=("10.0.0.1", 1234)):
+    return Request({
+        "type": "http",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        "query_string": query.encode(),
+        "client": client
+    })
+
+
+class TestTokenBucket:
+    """Тесты token bucket лимитера"""
+
+    def test_parse_rate(self):
+        assert parse_rate("10/minute") == (10, 10 / 60)
+        assert parse_rate("5/seconds") == (5, 5.0)
+        with pytest.raises(ValueError):
+            parse_rate("10/fortnight")
+
+    def test_burst_then_429_with_retry_after(self):
+        client = make_app(RateLimiter(backend="memory", rates={"llm": "3/minute", "cheap": "100/minute"}))
+        statuses = [client.post("/llm").status_code for _ in range(4)]
+        assert statuses == [200, 200, 200, 429]
+
+        response = client.post("/llm")
+        assert int(response.headers["Retry-After"]) >= 1
+        assert "Rate limit exceeded" in response.json()["detail"]
+
+    def test_buckets_are_separate(self):
+        client = make_app(RateLimiter(backend="memory", rates={"llm": "1/minute", "cheap": "100/minute"}))
+        assert client.post("/llm").status_code == 200
+        assert client.post("/llm").status_code == 429
+        assert all(client.get("/cheap").status_code == 200 for _ in range(10))
+
+    def test_batch_costs_more(self):
+        client = make_app(RateLimiter(backend="memory", rates={"llm": "3/minute", "cheap": "100/minute"}))
+        assert client.post("/batch").status_code == 200
+        assert client.post("/batch").status_code == 429
+        assert client.post("/llm").status_code == 200
+
+    def test_refill(self):
+        limiter = RateLimiter(backend="memory", rates={"llm": "2/second", "cheap": "100/minute"})
+        client = make_app(limiter)
+        assert [client.post("/llm").status_code for _ in range(3)] == [200, 200, 429]
+        time.sleep(0.6)
+        assert client.post("/llm").status_code == 200
+
+    def test_disabled(self):
+        limiter = RateLimiter(backend="memory", rates={"llm": "1/minute", "cheap": "1/minute"})
+        limiter.enabled = False
+        client = make_app(limiter)
+        assert all(client.post("/llm").status_code == 200 for _ in range(5))
+
+    def test_overhead_under_millisecond(self):
+        limiter = RateLimiter(backend="memory", rates={"llm": "1000000/minute", "cheap": "1/minute"})
+        check = limiter.bucket("llm")
+        request = make_request({"X-Forwarded-For": "1.2.3.4"})
+
+        async def scenario():
+            start = time.perf_counter()
+            for _ in range(1000):
+                await check(request)
+            return (time.perf_counter() - start) / 1000
+
+        assert asyncio.run(scenario()) < 0.001
+
+
+class TestClientKey:
+    """Выбор ключа клиента"""
+
+    def test_forwarded_ip_uses_trusted_hop(self):
+        limiter = RateLimiter(backend="memory", proxy_hops=1)
+        # Левые адреса мог подставить клиент, последний дописал наш балансировщик
+        request = make_request({"X-Forwarded-For": "6.6.6.6, 203.0.113.7"})
+        assert limiter.client_key(request) == "ip:203.0.113.7"
+        assert RateLimiter(backend="memory", proxy_hops=0).client_key(request) == "ip:10.0.0.1"
+        assert limiter.client_key(make_request()) == "ip:10.0.0.1"
+
+    def test_forwarded_header_ignored_by_default(self):
+        """Без настроенного прокси X-Forwarded-For не доверяем: его присылает сам клиент"""
+        request = make_request({"X-Forwarded-For": "6.6.6.6"})
+        assert RateLimiter(backend="memory").client_key(request) == "ip:10.0.0.1"
+
+    def test_api_key(self):
+        limiter = RateLimiter(backend="memory", key="api_key")
+        assert limiter.client_key(make_request({"X-API-Key": "secret"})) == "key:secret"
+        assert limiter.client_key(make_request()) == "ip:10.0.0.1"
+
+    def test_session(self):
+        limiter = RateLimiter(backend="memory", key="session")
+        assert limiter.client_key(make_request(query="session_id=abc")) == "session:abc"
+        assert limiter.client_key(make_request({"X-Session-ID": "xyz"})) == "session:xyz"
+        # Общий session_id по умолчанию не различает клиентов
+        assert limiter.client_key(make_request(query="session_id=default")) == "ip:10.0.0.1"
+
+
+class FakeScriptClient:
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = []
+
+    def register_script(self, script):
+        assert "HMGET" in script and "PEXPIRE" in script
+
+        async def run(keys, args):
+            self.calls.append((keys, args))
+            if self.error:
+                raise self.error
+            return self.result
+
+        return run
+
+
+class TestRedisBuckets:
+    """Redis-бакеты: один вызов скрипта на запрос"""
+
+    def test_script_call(self):
+        fake = FakeScriptClient(result=[0, "0.5", "3.2"])
+        buckets = RedisBuckets("redis://unused", client=fake)
+        allowed, tokens, retry_after = asyncio.run(buckets.take("ratelimit:llm:ip:1", 10, 10 / 60, 1))
+        assert (allowed, tokens, retry_after) == (False, 0.5, 3.2)
+        assert fake.calls == [(["ratelimit:llm:ip:1"], [10, 10 / 60, 1])]
+
+    def test_redis_failure_allows_request(self):
+        limiter = RateLimiter(backend="memory", rates={"llm": "1/minute", "cheap": "1/minute"})
+        limiter.backend = RedisBuckets("redis://unused", client=FakeScriptClient(error=ConnectionError("down")))
+        client = make_app(limiter)
+        assert client.post("/llm").status_code == 200
+        assert limiter.get_stats()["errors"] == 1
@@ -0,0 +1,133 @@
+import pytest
+import time
+from unittest.mock import patch
+
+from app.bm25 import BM25IndexBuilder, KeywordSearcher
+from app.reranker import Reranker
+from app.modular_rag import ModularRAG, RAGStrategy
+from app.database import vector_db
+
+
+DOCS = {
+    "p1": "Title: Some Paper\nAbstract: Unrelated content about galaxies.",
+    "p2": "Title: Attention Is All You Need\nAbstract: Transformer architecture with attention mechanism.",
+    "p3": "Title: Another Paper\nAbstract: Recurrent networks for speech.",
+}
+
+
+def make_hits(ids, scores=None):
+    scores = scores or [0.5] * len(ids)
+    return [
+        {"key": i, "id": i, "document": DOCS[i], "metadata": {"paper_id": i}, "score": s}
+        for i, s in zip(ids, scores)
+    ]
+
+
+class NoIndex:
+    def get_index(self):
+        return None
+
+
+class FakeCrossEncoder:
+    def __init__(self, delay=0.0, logit=0.0):
+        self.delay = delay
+        self.logit = logit
+        self.calls = 0
+
+    def predict(self, pairs, batch_size=16):
+        self.calls += 1
+        time.sleep(self.delay)
+        return [self.logit + float("attention" in document.lower()) for _, document in pairs]
+
+
+@pytest.fixture
+def searcher(tmp_path):
+    builder = BM25IndexBuilder()
+    for doc_id, document in DOCS.items():
+        builder.add(doc_id, document)
+    builder.build(str(tmp_path / "bm25"))
+    return KeywordSearcher(str(tmp_path / "bm25"))
+
+
+class TestReranker:
+    """Тесты переранжирования для hierarchical RAG"""
+
+    def test_lexical_match_moves_up_with_metadata(self, searcher):
+        """Документ с совпадающими терминами поднимается вместе со своими метаданными"""
+        reranker = Reranker(searcher=searcher)
+        ranked = reranker.rerank("transformer architecture attention mechanism", make_hits(["p1", "p2", "p3"]))
+
+        assert [hit["id"] for hit in ranked][0] == "p2"
+        for hit in ranked:
+            assert hit["metadata"]["paper_id"] == hit["id"]
+            assert hit["document"] == DOCS[hit["id"]]
+
+    def test_uses_precomputed_index(self, searcher):
+        """Кандидаты из индекса скорятся без токенизации текста"""
+        reranker = Reranker(searcher=searcher)
+        with patch("app.reranker.Counter", side_effect=AssertionError("text should not be tokenized")):
+            scores = reranker.lexical_scores("attention", make_hits(["p1", "p2", "p3"]))
+
+        assert scores[1] > 0
+        assert scores[0] == 0 and scores[2] == 0
+
+    def test_token_match_not_substring(self):
+        """Совпадение по токенам: 'net' не совпадает с 'networks'"""
+        reranker = Reranker(searcher=NoIndex())
+        scores = reranker.lexical_scores("net", make_hits(["p3"]))
+        assert scores[0] == 0
+
+    def test_fallback_without_index(self):
+        """Без индекса скоринг идёт по тексту кандидатов"""
+        reranker = Reranker(searcher=NoIndex())
+        ranked = reranker.rerank("recurrent speech", make_hits(["p1", "p2", "p3"]))
+        assert ranked[0]["id"] == "p3"
+
+    def test_cross_encoder_batches(self, searcher):
+        """Кросс-энкодер прогоняется пачками и определяет итоговый порядок"""
+        cross_encoder = FakeCrossEncoder()
+        reranker = Reranker(searcher=searcher, batch_size=2, latency_budget_ms=1000)
+        with patch.object(reranker, "_get_cross_encoder", return_value=cross_encoder):
+            ranked = reranker.rerank("papers", make_hits(["p1", "p3", "p2"]))
+
+        assert cross_encoder.calls == 2
+        assert ranked[0]["id"] == "p2"
+
+    def test_cross_encoder_respects_latency_budget(self, searcher):
+        """После исчерпания бюджета оставшиеся кандидаты не отправляются в кросс-энкодер"""
+        cross_encoder = FakeCrossEncoder(delay=0.05)
+        reranker = Reranker(searcher=searcher, batch_size=1, latency_budget_ms=10)
+        with patch.object(reranker, "_get_cross_encoder", return_value=cross_encoder):
+            ranked = reranker.rerank("papers", make_hits(["p1", "p3", "p2"]))
+
+        assert cross_encoder.calls == 1
+        assert len(ranked) == 3
+
+    def test_scores_follow_order_with_partial_cross_encoder(self, searcher):
+        """Отрицательные логиты просчитанных кандидатов не оказываются ниже скоров непросчитанных"""
+        cross_encoder = FakeCrossEncoder(delay=0.05, logit=-5.0)
+        reranker = Reranker(searcher=searcher, batch_size=1, latency_budget_ms=10)
+        with patch.object(reranker, "_get_cross_encoder", return_value=cross_encoder):
+            ranked = reranker.rerank("papers", make_hits(["p1", "p3", "p2"], [0.9, 0.6, 0.3]))
+
+        scores = [hit["score"] for hit in ranked]
+        assert cross_encoder.calls == 1
+        assert ranked[0]["id"] == "p1"
+        assert scores == sorted(scores, reverse=True)
+        assert scores[0] > scores[1]
+
+    def test_hierarchical_keeps_sources_aligned(self, searcher):
+        """Hierarchical RAG: источники соответствуют переранжированным документам"""
+        broad = {
+            "ids": [["p1", "p2", "p3"]],
+            "documents": [[DOCS["p1"], DOCS["p2"], DOCS["p3"]]],
+            "metadatas": [[{"paper_id": "p1"}, {"paper_id": "p2"}, {"paper_id": "p3"}]],
+            "distances": [[0.3, 0.4, 0.5]]
+        }
+        with patch("app.modular_rag.reranker", Reranker(searcher=searcher)), \
+             patch.object(vector_db, "search", return_value=broad):
+            result = ModularRAG().execute_rag("transformer attention mechanism", RAGStrategy.HIERARCHICAL, top_k=2)
+
+        assert result["ids"][0] == "p2"
+        assert [meta["paper_id"] for meta in result["metadatas"]] == result["ids"]
+        assert len(result["documents"]) == 2
@@ -0,0 +1,86 @@
+import pytest
+import asyncio
+import os
+import subprocess
+import sys
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.database import VectorDatabase, vector_db
+from app.gemini_client import GeminiClient, gemini_client
+from app.modular_rag import ModularRAG, modular_rag
+from app.resources import resources, _reset_after_fork
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestLazyImport:
+    """Импорт приложения не открывает Chroma и не настраивает Gemini"""
+
+    def test_import_is_cheap_and_needs_no_key(self):
+        env = {key: value for key, value in os.environ.items() if key != "GEMINI_API_KEY"}
+        script = (
+            "import sys, app.main; "
+            "print(','.join(name for name in ('chromadb', 'google.generativeai') if name in sys.modules))"
+        )
+        result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env,
+                                capture_output=True, text=True, timeout=120)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == ""
+
+
+class TestLazyResources:
+    """Тесты ленивых синглтонов"""
+
+    def test_vector_db_connects_on_first_use(self):
+        database = VectorDatabase()
+        assert not database.connected
+        assert database.collection is not None
+        assert database.connected
+        database.close()
+        assert not database.connected
+        # Следующее обращение подключает заново
+        assert database.collection is not None
+
+    def test_unknown_attribute_does_not_connect(self):
+        database = VectorDatabase()
+        with pytest.raises(AttributeError):
+            database.missing
+        assert not database.connected
+
+    def test_missing_api_key_fails_fast(self):
+        client = GeminiClient(api_key=None)
+        assert not client.initialized
+        with pytest.raises(ValueError):
+            asyncio.run(client.generate_response_async("prompt"))
+
+    def test_retrieval_pool_created_lazily(self):
+        rag = ModularRAG()
+        assert rag._executor is None
+        assert asyncio.run(rag.run_blocking(lambda: 42)) == 42
+        assert rag._executor is not None
+        rag.close()
+        assert rag._executor is None
+
+
+class TestLifespan:
+    """Старт и остановка воркера"""
+
+    def test_shutdown_releases_resources(self):
+        with TestClient(app) as client:
+            vector_db.collection
+            response = client.get("/health")
+            assert response.status_code == 200
+            assert response.json()["resources"]["pid"] == os.getpid()
+            assert resources.pid == os.getpid()
+
+        assert not vector_db.connected
+        assert not gemini_client.initialized
+        assert modular_rag._executor is None
+
+    def test_reset_after_fork(self):
+        vector_db.collection
+        asyncio.run(modular_rag.run_blocking(lambda: None))
+        _reset_after_fork()
+        assert not vector_db.connected
+        assert modular_rag._executor is None
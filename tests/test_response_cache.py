@@ -0,0 +1,175 @@
+import pytest
+import json
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from app.cache import ResponseCache, normalize_question
+from app.modular_rag import modular_rag
+from app.gemini_client import gemini_client, ERROR_RESPONSE
+from app.semantic_cache import semantic_cache
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.version = "v1"
+
+    def get_collection_version(self):
+        return self.version
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def setex(self, key, ttl, value):
+        self.store[key] = value.encode("utf-8")
+
+
+def make_cache(redis_client=None, **kwargs):
+    memory = MagicMock()
+    memory.redis_client = redis_client
+    return ResponseCache(memory=memory, database=FakeDatabase(), **kwargs)
+
+
+ANSWER = {
+    "answer": "Transformers use self-attention.",
+    "sources": ["Source 1: Attention Is All You Need"],
+    "context": ["Title: Attention Is All You Need"],
+    "strategy": "basic"
+}
+
+
+class TestResponseCache:
+    """Тесты кэша ответов по точному совпадению"""
+
+    def test_normalized_question_hits(self):
+        """Регистр, пробелы и финальный знак вопроса не влияют на ключ"""
+        cache = make_cache()
+        cache.set("What is a transformer?", "basic", 3, ANSWER)
+
+        assert normalize_question("  What  is a TRANSFORMER? ") == "what is a transformer"
+        assert cache.get("what is a   transformer", "basic", 3) == ANSWER
+        assert cache.get("What is a transformer?", "hybrid", 3) is None
+        assert cache.get("What is a transformer?", "basic", 5) is None
+        assert cache.hits == 1
+        assert cache.misses == 2
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняется давно не использованная запись"""
+        cache = make_cache(max_entries=2)
+        cache.set("q1", "basic", 3, ANSWER)
+        cache.set("q2", "basic", 3, ANSWER)
+        cache.get("q1", "basic", 3)
+        cache.set("q3", "basic", 3, ANSWER)
+
+        assert cache.get("q1", "basic", 3) is not None
+        assert cache.get("q2", "basic", 3) is None
+        assert cache.evictions == 1
+
+    def test_ttl_expiry(self):
+        """Записи истекают по TTL"""
+        cache = make_cache(ttl=10)
+        with patch("app.cache.time.monotonic", return_value=100.0):
+            cache.set("q", "basic", 3, ANSWER)
+        with patch("app.cache.time.monotonic", return_value=111.0):
+            assert cache.get("q", "basic", 3) is None
+
+    def test_collection_version_invalidates(self):
+        """После загрузки новых документов старые ответы не отдаются"""
+        cache = make_cache()
+        cache.set("q", "basic", 3, ANSWER)
+        cache.database.version = "v2"
+
+        assert cache.get("q", "basic", 3) is None
+        assert cache.get_stats()["size"] == 0
+
+    def test_redis_tier_shared_between_processes(self):
+        """Ответ, сохранённый одним процессом, находится другим через Redis"""
+        redis_client = FakeRedis()
+        writer = make_cache(redis_client=redis_client)
+        reader = make_cache(redis_client=redis_client)
+
+        writer.set("q", "basic", 3, ANSWER)
+        assert reader.get("q", "basic", 3) == ANSWER
+        assert reader.redis_hits == 1
+        stored = json.loads(next(iter(redis_client.store.values())))
+        assert stored["answer"] == ANSWER["answer"]
+
+
+@pytest.mark.usefixtures("no_rate_limit")
+class TestResponseCacheAPI:
+    """Кэш ответов в /query"""
+
+    RAG_RESULT = {
+        "documents": ["Title: Attention Is All You Need\nAbstract: Transformers..."],
+        "metadatas": [{"title": "Attention Is All You Need"}],
+        "strategy": "basic",
+        "search_type": "semantic"
+    }
+
+    def test_repeated_question_skips_llm(self, client):
+        """Повторный вопрос отвечается из кэша без поиска и LLM"""
+        with patch.object(modular_rag, "execute_rag", return_value=self.RAG_RESULT) as mock_rag, \
+             patch.object(gemini_client, "generate_response_async", return_value="Cached answer") as mock_llm:
+            first = client.post("/query", params={"session_id": "cache_first"}, json={"question": "Cache me?", "top_k": 1})
+            second = client.post("/query", params={"session_id": "cache_second"}, json={"question": "cache me", "top_k": 1})
+
+        assert first.status_code == 200 and second.status_code == 200
+        assert second.json()["answer"] == "Cached answer"
+        assert mock_rag.call_count == 1
+        assert mock_llm.call_count == 1
+
+        cache_stats = client.get("/metrics").json()["response_cache"]
+        assert cache_stats["hits"] >= 1
+
+    def test_fallback_answer_not_cached(self, client):
+        """Ответ-заглушка при сбое LLM не кэшируется"""
+        with patch.object(modular_rag, "execute_rag", return_value=self.RAG_RESULT), \
+             patch.object(gemini_client, "generate_response_async", return_value=ERROR_RESPONSE) as mock_llm:
+            client.post("/query", json={"question": "Flaky question", "top_k": 1})
+            client.post("/query", json={"question": "Flaky question", "top_k": 1})
+
+        assert mock_llm.call_count == 2
+
+    def test_cache_io_runs_off_event_loop(self, client):
+        """Redis и файл версии коллекции читаются в пуле потоков, а не в event loop"""
+        threads = []
+
+        def record_thread(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+
+        with patch.object(modular_rag, "execute_rag", return_value=self.RAG_RESULT), \
+             patch.object(gemini_client, "generate_response_async", return_value="Answer"), \
+             patch("app.main.response_cache.get", side_effect=record_thread), \
+             patch("app.main.response_cache.set", side_effect=record_thread):
+            client.post("/query", params={"session_id": "cache_threads"},
+                        json={"question": "Where does the cache run?", "top_k": 1})
+
+        assert len(threads) == 2
+        assert all(name.startswith("rag-retrieval") for name in threads)
+
+    def test_follow_up_not_shared_between_sessions(self, client):
+        """Ответ на уточняющий вопрос зависит от истории сессии и не отдаётся другой сессии"""
+        async def generate(prompt, temperature=0.1):
+            topic = "graphs" if "graph networks" in prompt else "transformers"
+            return f"The second paper about {topic}."
+
+        with patch.object(modular_rag, "execute_rag", return_value=self.RAG_RESULT), \
+             patch.object(gemini_client, "generate_response_async", side_effect=generate) as mock_llm, \
+             patch.object(semantic_cache, "enabled", False):
+            client.post("/query", params={"session_id": "history_a"},
+                        json={"question": "Tell me about transformers", "top_k": 1})
+            client.post("/query", params={"session_id": "history_b"},
+                        json={"question": "Tell me about graph networks", "top_k": 1})
+            first = client.post("/query", params={"session_id": "history_a"},
+                                json={"question": "What about the second paper?", "top_k": 1})
+            second = client.post("/query", params={"session_id": "history_b"},
+                                 json={"question": "What about the second paper?", "top_k": 1})
+
+        assert mock_llm.call_count == 4
+        assert first.json()["answer"] == "The second paper about transformers."
+        assert second.json()["answer"] == "The second paper about graphs."
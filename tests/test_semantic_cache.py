@@ -0,0 +1,198 @@
+import pytest
+import re
+import zlib
+import numpy as np
+from unittest.mock import patch
+
+from app.semantic_cache import SemanticCache
+from app.modular_rag import modular_rag
+from app.gemini_client import gemini_client
+
+
+SYNONYMS = {"explain": "what", "transformers": "transformer", "is": "", "a": ""}
+
+
+def bag_of_words_embed(texts, dim=64):
+    """Детерминированные эмбеддинги: мешок слов с простыми синонимами"""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            word = SYNONYMS.get(word, word)
+            if word:
+                vectors[i, zlib.crc32(word.encode()) % dim] += 1.0
+    return vectors
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.version = "v1"
+
+    def embed_query(self, query):
+        return bag_of_words_embed([query])[0]
+
+    def get_collection_version(self):
+        return self.version
+
+
+RESPONSE = {
+    "answer": "Transformers use self-attention.",
+    "sources": ["Source 1: Attention Is All You Need"],
+    "context": ["Title: Attention Is All You Need"],
+    "strategy": "basic"
+}
+
+
+class TestSemanticCache:
+    """Тесты семантического кэша ответов"""
+
+    def test_paraphrase_hits(self):
+        """Перефразированный вопрос получает сохранённый ответ"""
+        cache = SemanticCache(threshold=0.9, database=FakeDatabase())
+        cache.store("what is a transformer", "basic", 3, RESPONSE)
+
+        hit = cache.lookup("explain transformers", "basic", 3)
+        assert hit is not None
+        assert hit["answer"] == RESPONSE["answer"]
+        assert hit["similarity"] >= 0.9
+
+    def test_unrelated_question_misses(self):
+        """Непохожий вопрос не получает чужой ответ"""
+        cache = SemanticCache(threshold=0.9, database=FakeDatabase())
+        cache.store("what is a transformer", "basic", 3, RESPONSE)
+
+        assert cache.lookup("proton form factor measurements", "basic", 3) is None
+
+    def test_scoped_by_strategy_and_top_k(self):
+        """Ответы разных стратегий и top_k не смешиваются"""
+        cache = SemanticCache(threshold=0.9, database=FakeDatabase())
+        cache.store("what is a transformer", "basic", 3, RESPONSE)
+
+        assert cache.lookup("what is a transformer", "hybrid", 3) is None
+        assert cache.lookup("what is a transformer", "basic", 5) is None
+
+    def test_bounded_size_evicts_least_recently_used(self):
+        """Размер ограничен, вытесняется давно не использованный вопрос"""
+        cache = SemanticCache(threshold=0.99, max_entries=2, database=FakeDatabase())
+        cache.store("proton form factor", "basic", 3, RESPONSE)
+        cache.store("heavy baryon observation", "basic", 3, RESPONSE)
+        cache.lookup("proton form factor", "basic", 3)
+        cache.store("neural machine translation", "basic", 3, RESPONSE)
+
+        assert cache.lookup("proton form factor", "basic", 3) is not None
+        assert cache.lookup("heavy baryon observation", "basic", 3) is None
+        assert cache.get_stats()["size"] == 2
+        assert cache.evictions == 1
+
+    def test_bound_is_shared_across_scopes(self):
+        """Предел max_entries общий для всех стратегий и top_k"""
+        cache = SemanticCache(threshold=0.99, max_entries=2, database=FakeDatabase())
+        cache.store("proton form factor", "basic", 3, RESPONSE)
+        cache.store("heavy baryon observation", "hybrid", 3, RESPONSE)
+        cache.store("neural machine translation", "basic", 5, RESPONSE)
+
+        assert cache.get_stats()["size"] == 2
+        assert cache.evictions == 1
+        assert cache.lookup("proton form factor", "basic", 3) is None
+        assert cache.lookup("heavy baryon observation", "hybrid", 3) is not None
+        assert cache.lookup("neural machine translation", "basic", 5) is not None
+
+    def test_expired_entries_reused_before_eviction(self):
+        """Место истёкших записей занимается раньше, чем вытесняются живые"""
+        cache = SemanticCache(threshold=0.99, max_entries=2, database=FakeDatabase())
+        with patch("app.semantic_cache.time.monotonic", return_value=0.0):
+            cache.store("proton form factor", "basic", 3, RESPONSE)
+        with patch("app.semantic_cache.time.monotonic", return_value=cache.ttl - 1.0):
+            cache.store("heavy baryon observation", "basic", 3, RESPONSE)
+        with patch("app.semantic_cache.time.monotonic", return_value=cache.ttl + 1.0):
+            cache.store("neural machine translation", "hybrid", 3, RESPONSE)
+
+            assert cache.evictions == 0
+            assert cache.get_stats()["size"] == 2
+            assert cache.lookup("heavy baryon observation", "basic", 3) is not None
+            assert cache.lookup("neural machine translation", "hybrid", 3) is not None
+
+    def test_collection_change_clears_cache(self):
+        """После изменения коллекции сохранённые ответы не используются"""
+        database = FakeDatabase()
+        cache = SemanticCache(threshold=0.9, database=database)
+        cache.store("what is a transformer", "basic", 3, RESPONSE)
+        database.version = "v2"
+
+        assert cache.lookup("what is a transformer", "basic", 3) is None
+
+    def test_llm_calls_saved_ratio(self):
+        """Статистика показывает долю сэкономленных вызовов LLM"""
+        cache = SemanticCache(threshold=0.9, database=FakeDatabase())
+        cache.lookup("what is a transformer", "basic", 3)
+        cache.store("what is a transformer", "basic", 3, RESPONSE)
+        cache.lookup("explain transformers", "basic", 3)
+        cache.lookup("what is a transformer?", "basic", 3)
+        cache.lookup("proton form factor", "basic", 3)
+
+        stats = cache.get_stats()
+        assert stats["lookups"] == 4
+        assert stats["hits"] == 2
+        assert stats["llm_calls_saved_ratio"] == 0.5
+
+
+@pytest.mark.usefixtures("no_rate_limit")
+class TestSemanticCacheAPI:
+    """Семантический кэш в /query"""
+
+    def test_paraphrase_skips_llm(self, client):
+        """Перефразировка отвечается без поиска и вызова LLM"""
+        from app.semantic_cache import semantic_cache
+
+        rag_result = {
+            "documents": ["Title: Attention Is All You Need\nAbstract: Transformers..."],
+            "metadatas": [{"title": "Attention Is All You Need"}],
+            "strategy": "basic",
+            "search_type": "semantic"
+        }
+
+        with patch.object(semantic_cache, "database", FakeDatabase()), \
+             patch.object(semantic_cache, "threshold", 0.9), \
+             patch.object(modular_rag, "execute_rag", return_value=rag_result) as mock_rag, \
+             patch.object(gemini_client, "generate_response_async", return_value="Self-attention.") as mock_llm:
+            first = client.post("/query", params={"session_id": "paraphrase_first"},
+                                json={"question": "What is a transformer?", "top_k": 1})
+            second = client.post("/query", params={"session_id": "paraphrase_second"},
+                                 json={"question": "Explain transformers", "top_k": 1})
+
+        assert first.status_code == 200 and second.status_code == 200
+        assert second.json()["answer"] == "Self-attention."
+        assert mock_rag.call_count == 1
+        assert mock_llm.call_count == 1
+        assert client.get("/metrics").json()["semantic_cache"]["hits"] == 1
+
+    def test_follow_up_paraphrase_not_shared_between_sessions(self, client):
+        """Перефразированный уточняющий вопрос не получает ответ, построенный на чужой истории"""
+        from app.semantic_cache import semantic_cache
+
+        rag_result = {
+            "documents": ["Title: Attention Is All You Need\nAbstract: Transformers..."],
+            "metadatas": [{"title": "Attention Is All You Need"}],
+            "strategy": "basic",
+            "search_type": "semantic"
+        }
+
+        async def generate(prompt, temperature=0.1):
+            topic = "graphs" if "graph networks" in prompt else "transformers"
+            return f"The second paper about {topic}."
+
+        with patch.object(semantic_cache, "database", FakeDatabase()), \
+             patch.object(semantic_cache, "threshold", 0.9), \
+             patch.object(modular_rag, "execute_rag", return_value=rag_result), \
+             patch.object(gemini_client, "generate_response_async", side_effect=generate) as mock_llm:
+            client.post("/query", params={"session_id": "follow_up_a"},
+                        json={"question": "Tell me about transformers", "top_k": 1})
+            client.post("/query", params={"session_id": "follow_up_b"},
+                        json={"question": "Tell me about graph networks", "top_k": 1})
+            first = client.post("/query", params={"session_id": "follow_up_a"},
+                                json={"question": "What is the second paper?", "top_k": 1})
+            second = client.post("/query", params={"session_id": "follow_up_b"},
+                                 json={"question": "Explain the second paper", "top_k": 1})
+
+        assert mock_llm.call_count == 4
+        assert first.json()["answer"] == "The second paper about transformers."
+        assert second.json()["answer"] == "The second paper about graphs."
@@ -0,0 +1,331 @@
+import pytest
+import asyncio
+import time
+from unittest.mock import patch
+
+from app import session_store
+from app.session_store import RedisConversationStore, InMemoryConversationStore, encode, decode
+from app.memory import ConversationMemory
+from redis.exceptions import WatchError
+
+
+class FakePipeline:
+    def __init__(self, redis, transaction):
+        self.redis = redis
+        self.transaction = transaction
+        self.commands = []
+        self.watched = None
+        self.immediate = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def watch(self, *keys):
+        self.redis.round_trips.append(("watch", list(keys)))
+        self.watched = {key: self.redis.versions.get(key, 0) for key in keys}
+        self.immediate = True
+
+    def multi(self):
+        self.immediate = False
+
+    def __getattr__(self, name):
+        if self.immediate:
+            # После WATCH команды выполняются сразу, до MULTI
+            async def run(*args, **kwargs):
+                self.redis.round_trips.append(("command", [name]))
+                await asyncio.sleep(0)
+                return getattr(self.redis, f"_{name}")(*args, **kwargs)
+            return run
+
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+        return queue
+
+    async def execute(self):
+        self.redis.round_trips.append(("multi" if self.transaction else "pipeline", [c[0] for c in self.commands]))
+        if self.watched and any(self.redis.versions.get(key, 0) != version for key, version in self.watched.items()):
+            raise WatchError("Watched variable changed.")
+        return [getattr(self.redis, f"_{name}")(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+class FakeAsyncRedis:
+    """Минимальная модель асинхронного клиента Redis: команды, пайплайны и WATCH"""
+
+    def __init__(self):
+        self.store = {}
+        self.ttls = {}
+        self.versions = {}
+        self.round_trips = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self, transaction)
+
+    def _touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _lindex(self, key, index):
+        items = self.store.get(key, [])
+        return items[index] if index < len(items) else None
+
+    def _get(self, key):
+        return self.store.get(key)
+
+    def _set(self, key, value, ex=None):
+        self._touch(key)
+        self.store[key] = value.encode("utf-8") if isinstance(value, str) else value
+        self.ttls[key] = ex
+
+    def _lpush(self, key, value):
+        self._touch(key)
+        self.store.setdefault(key, []).insert(0, value)
+
+    def _ltrim(self, key, start, stop):
+        self._touch(key)
+        self.store[key] = self.store.get(key, [])[start:stop + 1]
+
+    def _expire(self, key, ttl):
+        if key in self.store:
+            self.ttls[key] = ttl
+
+    def _lrange(self, key, start, stop):
+        return self.store.get(key, [])[start:stop + 1]
+
+    async def get(self, key):
+        return self._get(key)
+
+    async def lrange(self, key, start, stop):
+        return self._lrange(key, start, stop)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self._touch(key)
+            self.store.pop(key, None)
+
+    async def aclose(self):
+        pass
+
+
+class TestRedisConversationStore:
+    """Тесты Redis-хранилища сессий"""
+
+    def make_store(self, **kwargs):
+        redis = FakeAsyncRedis()
+        return RedisConversationStore("redis://unused", client=redis, **kwargs), redis
+
+    def test_write_is_single_transaction_with_ttl(self):
+        store, redis = self.make_store(ttl=600, max_turns=3)
+
+        async def scenario():
+            for i in range(5):
+                await store.append("s", {"question": f"Q{i}?", "answer": f"Answer {i}."})
+            return await store.history("s", 10)
+
+        history = asyncio.run(scenario())
+        assert [turn["question"] for turn in history] == ["Q4?", "Q3?", "Q2?"]
+        assert redis.ttls["conversation:s"] == 600
+        assert redis.ttls["conversation_summary:s"] == 600
+
+        # Запись реплики: WATCH, два чтения и одна транзакция MULTI
+        writes = [trip for trip in redis.round_trips if trip[0] == "multi"]
+        assert len(writes) == 5
+        assert writes[-1][1] == ["lpush", "ltrim", "expire", "set"]
+        assert len(redis.round_trips) == 20
+
+    def test_concurrent_appends_keep_every_turn_in_summary(self):
+        """Одновременные записи в одну сессию не теряют реплики в сводке"""
+        store, redis = self.make_store()
+
+        async def scenario():
+            await store.append("default", {"question": "Q0?", "answer": "Answer 0."})
+            await asyncio.gather(store.append("default", {"question": "Q1?", "answer": "Answer 1."}),
+                                 store.append("default", {"question": "Q2?", "answer": "Answer 2."}))
+            return await store.prompt_history("default", 1)
+
+        history, summary = asyncio.run(scenario())
+        newest = history[0]["question"]
+        older = "Q1?" if newest == "Q2?" else "Q2?"
+        # Обе старые реплики в сводке, последняя - только в истории
+        assert "Q0?" in summary and older in summary
+        assert newest not in summary
+        # Одна из транзакций отклонена WATCH и повторена
+        assert len([trip for trip in redis.round_trips if trip[0] == "multi"]) == 4
+
+    def test_prompt_history_in_one_round_trip(self):
+        store, redis = self.make_store()
+
+        async def scenario():
+            await store.append("s", {"question": "First?", "answer": "First answer."})
+            await store.append("s", {"question": "Second?", "answer": "Second answer."})
+            redis.round_trips.clear()
+            return await store.prompt_history("s", 1)
+
+        history, summary = asyncio.run(scenario())
+        assert [turn["question"] for turn in history] == ["Second?"]
+        assert "First?" in summary
+        assert len(redis.round_trips) == 1
+
+    def test_summary_skips_recent_window(self):
+        store, redis = self.make_store(recent_turns=2)
+
+        async def scenario():
+            for i in range(3):
+                await store.append("s", {"question": f"Q{i}?", "answer": f"Answer {i}."})
+            return await store.prompt_history("s", 2)
+
+        history, summary = asyncio.run(scenario())
+        assert [turn["question"] for turn in history] == ["Q2?", "Q1?"]
+        assert "Q0?" in summary
+        assert "Q1?" not in summary and "Q2?" not in summary
+
+    def test_clear_removes_history_and_summary(self):
+        store, redis = self.make_store()
+
+        async def scenario():
+            await store.append("s", {"question": "First?", "answer": "First answer."})
+            await store.append("s", {"question": "Second?", "answer": "Second answer."})
+            await store.clear("s")
+            return await store.prompt_history("s", 5)
+
+        assert asyncio.run(scenario()) == ([], "")
+        assert redis.store == {}
+
+
+class TestEncoding:
+    """Кодирование записей сессии"""
+
+    def test_json_fallback_roundtrip(self):
+        record = {"question": "Что такое BERT?", "answer": "Encoder.", "sources": ["a"]}
+        with patch.object(session_store, "msgpack", None):
+            payload = encode(record)
+            assert payload.startswith(b"{")
+            assert decode(payload) == record
+
+    def test_msgpack_roundtrip(self):
+        msgpack = pytest.importorskip("msgpack")
+        record = {"question": "Что такое BERT?", "answer": "Encoder.", "sources": ["a"]}
+        payload = encode(record)
+        assert payload == msgpack.packb(record, use_bin_type=True)
+        assert decode(payload) == record
+        # Записи, сделанные воркером без msgpack, по-прежнему читаются
+        with patch.object(session_store, "msgpack", None):
+            legacy = encode(record)
+        assert decode(legacy) == record
+
+
+class TestBackendSelection:
+    """Выбор хранилища сессий"""
+
+    def test_default_is_in_memory(self):
+        assert isinstance(ConversationMemory().sessions, InMemoryConversationStore)
+
+    def test_redis_unavailable_falls_back_to_memory(self):
+        memory = ConversationMemory(backend="redis")
+        assert isinstance(memory.sessions, InMemoryConversationStore)
+
+    def test_redis_backend_selected(self):
+        with patch("app.memory.redis.Redis.from_url") as from_url:
+            from_url.return_value.ping.return_value = True
+            memory = ConversationMemory("redis://localhost:6379/0", backend="redis")
+        assert isinstance(memory.sessions, RedisConversationStore)
+        asyncio.run(memory.close())
+
+
+def turn(i, answer="Answer."):
+    return {"question": f"Q{i}?", "answer": answer, "sources": ["Paper"]}
+
+
+class TestBoundedInMemoryStore:
+    """Тесты ограниченного in-process хранилища сессий"""
+
+    def test_lru_eviction_by_count(self):
+        store = InMemoryConversationStore(max_sessions=2)
+
+        async def scenario():
+            await store.append("a", turn(1))
+            await store.append("b", turn(2))
+            await store.history("a", 1)
+            await store.append("c", turn(3))
+            return await store.history("a", 1), await store.history("b", 1), await store.history("c", 1)
+
+        a, b, c = asyncio.run(scenario())
+        assert a and c and not b
+        stats = store.get_stats()
+        assert stats["sessions"] == 2
+        assert stats["evicted"] == 1
+        asyncio.run(store.close())
+
+    def test_byte_budget_enforced(self):
+        store = InMemoryConversationStore(max_bytes=20_000)
+
+        async def scenario():
+            for i in range(50):
+                await store.append(f"s{i}", turn(i, answer="x" * 1000))
+
+        asyncio.run(scenario())
+        stats = store.get_stats()
+        assert stats["bytes"] <= 20_000
+        assert 0 < stats["sessions"] < 50
+        assert stats["evicted"] == 50 - stats["sessions"]
+        asyncio.run(store.close())
+
+    def test_bytes_stay_consistent(self):
+        store = InMemoryConversationStore(max_turns=3)
+
+        async def scenario():
+            for i in range(10):
+                await store.append("s", turn(i, answer=f"Answer number {i}. " * 5))
+            await store.clear("s")
+
+        asyncio.run(scenario())
+        assert store.get_stats()["bytes"] == 0
+        asyncio.run(store.close())
+
+    def test_turns_bounded_newest_first(self):
+        store = InMemoryConversationStore(max_turns=3)
+
+        async def scenario():
+            for i in range(5):
+                await store.append("s", turn(i))
+            return await store.prompt_history("s", 10)
+
+        history, summary = asyncio.run(scenario())
+        assert [item["question"] for item in history] == ["Q4?", "Q3?", "Q2?"]
+        assert history[0]["sources"] == ["Paper"]
+        assert "Q3?" in summary
+        asyncio.run(store.close())
+
+    def test_idle_sessions_expire(self):
+        store = InMemoryConversationStore(ttl=10)
+        with patch("app.session_store.time.monotonic", return_value=100.0):
+            asyncio.run(store.append("old", turn(1)))
+        with patch("app.session_store.time.monotonic", return_value=105.0):
+            asyncio.run(store.append("fresh", turn(2)))
+        with patch("app.session_store.time.monotonic", return_value=112.0):
+            assert store.sweep() == 1
+            assert asyncio.run(store.history("old", 1)) == []
+            assert asyncio.run(store.history("fresh", 1))
+        # Просроченная сессия не читается, даже если очистка ещё не прошла
+        with patch("app.session_store.time.monotonic", return_value=200.0):
+            assert asyncio.run(store.summary("fresh")) == ""
+        assert store.get_stats()["expired"] == 2
+        asyncio.run(store.close())
+
+    def test_background_sweeper(self):
+        store = InMemoryConversationStore(ttl=0.05, sweep_interval=0.01)
+        asyncio.run(store.append("s", turn(1)))
+        deadline = time.monotonic() + 2
+        while store.get_stats()["sessions"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert store.get_stats()["sessions"] == 0
+        asyncio.run(store.close())
+
+    def test_memory_reported_in_metrics(self, client):
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        memory = response.json()["memory"]
+        assert memory["sessions"]["backend"] == "memory"
+        assert "bytes" in memory["sessions"]
+        assert "entries" in memory["embedding_cache"]
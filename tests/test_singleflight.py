@@ -0,0 +1,150 @@
+import pytest
+import asyncio
+import time
+import httpx
+from unittest.mock import patch
+
+from app.main import app
+from app.modular_rag import modular_rag
+from app.gemini_client import gemini_client
+from app.cache import response_cache
+from app.semantic_cache import semantic_cache
+from app.singleflight import SingleFlight, retrieval_flight, llm_flight
+from app.deadline import start_deadline, current_deadline, DeadlineExceeded
+
+
+class TestSingleFlight:
+    """Тесты склейки одновременных одинаковых вычислений"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight("test")
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"value": 42}
+
+        async def scenario():
+            return await asyncio.gather(*(flight.do("key", compute) for _ in range(10)))
+
+        results = asyncio.run(scenario())
+        assert len(calls) == 1
+        assert all(result == {"value": 42} for result in results)
+        assert flight.get_stats()["coalesced"] == 9
+        assert flight.get_stats()["in_flight"] == 0
+
+    def test_different_keys_run_separately(self):
+        flight = SingleFlight("test")
+
+        async def scenario():
+            return await asyncio.gather(flight.do("a", lambda: asyncio.sleep(0.01, "a")),
+                                        flight.do("b", lambda: asyncio.sleep(0.01, "b")))
+
+        assert asyncio.run(scenario()) == ["a", "b"]
+        assert flight.executions == 2
+        assert flight.coalesced == 0
+
+    def test_error_reaches_all_waiters_and_is_not_cached(self):
+        """Ошибка получают все ожидающие, следующий запрос вычисляет заново"""
+        flight = SingleFlight("test")
+        attempts = []
+
+        async def failing():
+            attempts.append(1)
+            await asyncio.sleep(0.01)
+            raise RuntimeError("backend down")
+
+        async def scenario():
+            first = await asyncio.gather(*(flight.do("key", failing) for _ in range(3)), return_exceptions=True)
+            second = await asyncio.gather(flight.do("key", failing), return_exceptions=True)
+            return first + second
+
+        results = asyncio.run(scenario())
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert len(attempts) == 2
+
+    def test_cancelled_waiter_does_not_cancel_others(self):
+        flight = SingleFlight("test")
+
+        async def compute():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def scenario():
+            first = asyncio.ensure_future(flight.do("key", compute))
+            second = asyncio.ensure_future(flight.do("key", compute))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        assert asyncio.run(scenario()) == "done"
+
+    def test_waiters_keep_their_own_deadlines(self):
+        """Короткий срок лидера не обрывает общее вычисление для запроса с долгим сроком"""
+        flight = SingleFlight("test")
+        seen = {}
+
+        async def compute():
+            await asyncio.sleep(0.2)
+            # К этому моменту срок общего вычисления продлён до срока второго запроса
+            seen["remaining"] = current_deadline().remaining()
+            return "done"
+
+        async def call(seconds, delay=0.0):
+            await asyncio.sleep(delay)
+            start_deadline(seconds)
+            return await flight.do("key", compute)
+
+        async def scenario():
+            return await asyncio.gather(call(0.05), call(10, delay=0.01), return_exceptions=True)
+
+        leader, follower = asyncio.run(scenario())
+        assert isinstance(leader, DeadlineExceeded)
+        assert follower == "done"
+        assert seen["remaining"] > 5
+        assert flight.get_stats()["coalesced"] == 1
+
+    def test_identical_queries_coalesce_end_to_end(self, no_rate_limit):
+        """Одинаковые одновременные /query делят поиск и вызов LLM"""
+        rag_calls = []
+        llm_calls = []
+
+        def slow_execute_rag(question, strategy=None, **kwargs):
+            rag_calls.append(question)
+            time.sleep(0.05)
+            return {
+                "documents": ["Title: Attention Is All You Need\nAbstract: Transformers..."],
+                "metadatas": [{"title": "Attention Is All You Need"}],
+                "strategy": "basic",
+                "search_type": "semantic"
+            }
+
+        async def slow_generate(prompt, temperature=0.1):
+            llm_calls.append(prompt)
+            await asyncio.sleep(0.1)
+            return "Transformers rely on self-attention."
+
+        async def scenario():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+                return await asyncio.gather(*(
+                    ac.post("/query", params={"session_id": f"flight_{i}"},
+                            json={"question": "Popular question about transformers", "top_k": 1})
+                    for i in range(6)
+                ))
+
+        retrieval_before = retrieval_flight.coalesced
+        llm_before = llm_flight.coalesced
+        with patch.object(modular_rag, "execute_rag", side_effect=slow_execute_rag), \
+             patch.object(gemini_client, "generate_response_async", side_effect=slow_generate), \
+             patch.object(response_cache, "enabled", False), \
+             patch.object(semantic_cache, "enabled", False):
+            responses = asyncio.run(scenario())
+
+        assert all(response.status_code == 200 for response in responses)
+        assert {response.json()["answer"] for response in responses} == {"Transformers rely on self-attention."}
+        assert len(rag_calls) == 1
+        assert len(llm_calls) == 1
+        assert retrieval_flight.coalesced - retrieval_before == 5
+        assert llm_flight.coalesced - llm_before == 5
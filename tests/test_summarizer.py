@@ -0,0 +1,123 @@
+import pytest
+import asyncio
+from unittest.mock import patch
+
+from app.summarizer import summarize_turn, fold_into_summary
+from app.context_builder import ContextBuilder, estimate_tokens
+from app.memory import ConversationMemory
+from app.session_store import InMemoryConversationStore
+from app.modular_rag import modular_rag
+from app.gemini_client import gemini_client
+from app.semantic_cache import semantic_cache
+
+LONG_ANSWER = (
+    "Transformers are neural networks built on self-attention. "
+    "They were introduced in 2017 for machine translation. "
+    "The weather was nice that year. "
+    "Self-attention lets transformers relate every token to every other token. "
+    "Many follow-up models such as BERT reuse the transformer encoder."
+)
+
+
+class TestExtractiveSummary:
+    """Тесты экстрактивной выжимки истории"""
+
+    def test_summarize_turn_keeps_relevant_sentences(self):
+        summary = summarize_turn("What is self-attention in transformers?", LONG_ANSWER, max_sentences=2)
+        assert summary.startswith("Q: What is self-attention in transformers?\nA: ")
+        assert "weather" not in summary
+        assert "self-attention" in summary
+        # Предложения в исходном порядке
+        answer = summary.split("\nA: ", 1)[1]
+        assert LONG_ANSWER.index(answer.split(". ")[0]) < LONG_ANSWER.index(answer.split(". ")[1])
+
+    def test_short_answer_kept_verbatim(self):
+        assert summarize_turn("Q?", "Short answer.") == "Q: Q?\nA: Short answer."
+
+    def test_fold_forgets_oldest_when_full(self):
+        summary = ""
+        for i in range(20):
+            summary = fold_into_summary(summary, f"Question {i}?", LONG_ANSWER, max_tokens=120)
+        assert estimate_tokens(summary) <= 120
+        assert "Question 19?" in summary
+        assert "Question 0?" not in summary
+
+
+class TestConversationCompaction:
+    """Старые реплики сворачиваются в сводку, в промпт идёт сводка и последняя реплика"""
+
+    def test_previous_turn_folded_on_store(self):
+        memory = ConversationMemory()
+
+        async def scenario():
+            await memory.store_conversation("s", "First question?", LONG_ANSWER, [])
+            assert await memory.get_conversation_summary("s") == ""
+
+            await memory.store_conversation("s", "Second question?", "Second answer.", [])
+            summary = await memory.get_conversation_summary("s")
+            assert "First question?" in summary
+            assert "Second question?" not in summary
+
+            await memory.clear_conversation("s")
+            assert await memory.get_conversation_summary("s") == ""
+
+        asyncio.run(scenario())
+
+    def test_recent_window_not_duplicated_in_summary(self):
+        """При RECENT_TURNS=2 в сводку уходят только реплики старше двух последних"""
+        store = InMemoryConversationStore(recent_turns=2)
+
+        async def scenario():
+            for i in range(4):
+                await store.append("s", {"question": f"Question {i}?", "answer": f"Answer {i}."})
+            return await store.prompt_history("s", 2)
+
+        history, summary = asyncio.run(scenario())
+        assert [turn["question"] for turn in history] == ["Question 3?", "Question 2?"]
+        assert "Question 0?" in summary and "Question 1?" in summary
+        assert "Question 2?" not in summary and "Question 3?" not in summary
+
+    def test_summary_in_context(self):
+        built = ContextBuilder(max_tokens=1000).build(
+            ["Title: Paper\nAbstract: text"], [{}],
+            history=[{"question": "Latest?", "answer": "Latest answer."}],
+            summary="Q: Earlier?\nA: Earlier answer."
+        )
+        assert built.text.index("Summary of earlier conversation:") < built.text.index("Previous conversation:")
+        assert "Q: Earlier?" in built.text and "Q: Latest?" in built.text
+        assert built.summary_tokens > 0
+        assert built.history_tokens >= built.summary_tokens
+
+    def test_prompt_size_flat_over_long_session(self, client, no_rate_limit):
+        prompts = []
+
+        def execute_rag(question, strategy=None, **kwargs):
+            return {
+                "documents": ["Title: Attention Is All You Need\nAbstract: Transformers..."],
+                "metadatas": [{"title": "Attention Is All You Need"}],
+                "strategy": "basic",
+                "search_type": "semantic"
+            }
+
+        async def generate(prompt, temperature=0.1):
+            prompts.append(prompt)
+            return " ".join([LONG_ANSWER] * 8)
+
+        memory = ConversationMemory()
+        with patch.object(modular_rag, "execute_rag", side_effect=execute_rag), \
+             patch.object(gemini_client, "generate_response_async", side_effect=generate), \
+             patch.object(semantic_cache, "enabled", False), \
+             patch("app.main.conversation_memory", memory):
+            for i in range(8):
+                response = client.post("/query", params={"session_id": "long_session"},
+                                       json={"question": f"Follow-up question number {i}?", "top_k": 1})
+                assert response.status_code == 200
+
+        # Длинные ответы не копятся в промпте: после свёртки размер перестаёт расти
+        assert len(prompts[-1]) <= len(prompts[3]) * 1.2
+        assert prompts[-1].count(LONG_ANSWER) <= 8
+        summary = asyncio.run(memory.get_conversation_summary("long_session"))
+        assert "Follow-up question number 6?" in summary
+        assert "Follow-up question number 7?" not in summary
+        # Повторяющиеся предложения ответа попадают в выжимку один раз
+        assert summary.count("Self-attention lets transformers") == summary.count("Q: ")
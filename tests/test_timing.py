@@ -0,0 +1,78 @@
+import pytest
+import contextvars
+import time
+from unittest.mock import patch
+
+from app.timing import StageTimings, start_timings, stage
+from app.metrics import PerformanceMetrics
+from app.modular_rag import modular_rag
+from app.gemini_client import gemini_client
+from app.semantic_cache import semantic_cache
+
+
+class TestStageTimings:
+    """Тесты замеров по стадиям"""
+
+    def test_stage_accumulates(self):
+        def scenario():
+            timings = start_timings()
+            for _ in range(2):
+                with stage("search"):
+                    time.sleep(0.005)
+            return timings
+
+        # Отдельный контекст, чтобы замеры не протекали в другие тесты
+        timings = contextvars.copy_context().run(scenario)
+        assert timings.stages["search"] >= 0.01
+        assert list(timings.as_dict()) == ["search"]
+
+    def test_stage_without_timings_is_noop(self):
+        StageTimings()
+        with stage("anything"):
+            pass
+
+    def test_server_timing_format(self):
+        timings = StageTimings()
+        timings.add("embedding", 0.0123)
+        timings.add("llm", 1.5)
+        assert timings.server_timing(total=2.0) == "embedding;dur=12.3, llm;dur=1500.0, total;dur=2000.0"
+
+
+class TestQueryTimings:
+    """Стадии /query попадают в заголовок, ответ и метрики"""
+
+    def test_query_reports_stages(self, client, no_rate_limit):
+        def execute_rag(question, strategy=None, **kwargs):
+            # Выполняется в пуле потоков: замер должен дойти до запроса
+            with stage("vector_search"):
+                time.sleep(0.01)
+            return {
+                "documents": ["Title: Attention Is All You Need\nAbstract: Transformers..."],
+                "metadatas": [{"title": "Attention Is All You Need"}],
+                "strategy": "basic",
+                "search_type": "semantic"
+            }
+
+        async def generate(prompt, temperature=0.1):
+            return "Transformers rely on self-attention."
+
+        fresh = PerformanceMetrics()
+        with patch.object(modular_rag, "execute_rag", side_effect=execute_rag), \
+             patch.object(gemini_client, "generate_response_async", side_effect=generate), \
+             patch.object(semantic_cache, "enabled", False), \
+             patch("app.main.metrics", fresh):
+            response = client.post("/query", params={"session_id": "timing_test"},
+                                   json={"question": "What are transformers in timing test?", "top_k": 1})
+
+        assert response.status_code == 200
+        header = response.headers["Server-Timing"]
+        for name in ("vector_search", "history", "prompt_build", "llm", "memory_store", "total"):
+            assert f"{name};dur=" in header
+
+        timings = response.json()["timings"]
+        assert timings["vector_search"] >= 10
+        assert set(timings) >= {"cache_lookup", "history", "prompt_build", "llm", "memory_store"}
+
+        stages = fresh.get_metrics()["stages"]
+        assert stages["vector_search"]["count"] == 1
+        assert stages["llm"]["count"] == 1
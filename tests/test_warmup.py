@@ -0,0 +1,114 @@
+import pytest
+import asyncio
+import os
+import numpy as np
+from unittest.mock import MagicMock, patch
+
+from app import warmup as warmup_module
+from app.warmup import Warmup, pretouch_files, configure_threads
+from app.onnx_threads import configure_onnx_threads
+from app.database import vector_db
+
+
+def run_warmup(warmup):
+    async def scenario():
+        warmup.start()
+        before = warmup.status()["ready"]
+        if warmup._task is not None:
+            await warmup._task
+        return before
+
+    return asyncio.run(scenario())
+
+
+class TestWarmup:
+    """Тесты прогрева воркера"""
+
+    def test_ready_after_warmup(self):
+        collection = MagicMock()
+        collection.count.return_value = 10
+        warmup = Warmup(pretouch=False)
+        with patch.object(vector_db, "embed", return_value=np.zeros((1, 4), dtype=np.float32)), \
+             patch.object(vector_db, "collection", collection):
+            assert run_warmup(warmup) is False
+
+        status = warmup.status()
+        assert status["ready"] is True
+        assert status["steps"]["vector_search"]["ok"] is True
+        assert status["steps"]["keyword_index"]["ok"] is True
+        collection.query.assert_called_once()
+
+    def test_failed_step_does_not_block_readiness(self):
+        warmup = Warmup(pretouch=False)
+        with patch.object(vector_db, "embed", side_effect=RuntimeError("model download failed")):
+            run_warmup(warmup)
+
+        status = warmup.status()
+        assert status["ready"] is True
+        assert status["steps"]["vector_search"]["ok"] is False
+        assert "model download failed" in status["steps"]["vector_search"]["error"]
+
+    def test_disabled_is_ready_immediately(self):
+        warmup = Warmup(enabled=False)
+        run_warmup(warmup)
+        assert warmup.status()["ready"] is True
+        assert warmup.status()["steps"] == {}
+
+    def test_pretouch_reads_files_up_to_limit(self, tmp_path):
+        (tmp_path / "segment").mkdir()
+        (tmp_path / "segment" / "data_level0.bin").write_bytes(b"x" * 3000)
+        (tmp_path / "header.bin").write_bytes(b"y" * 500)
+        assert pretouch_files([str(tmp_path), str(tmp_path / "missing")], max_bytes=10_000) == 3500
+        assert pretouch_files([str(tmp_path)], max_bytes=1000) == 1000
+
+
+class TestReadyEndpoint:
+    """/ready отвечает 503 до конца прогрева"""
+
+    def test_ready_endpoint(self, client):
+        warmup = Warmup(enabled=False)
+        with patch("app.main.warmup", warmup):
+            response = client.get("/ready")
+            assert response.status_code == 503
+            assert response.json()["ready"] is False
+
+            run_warmup(warmup)
+            response = client.get("/ready")
+            assert response.status_code == 200
+            assert response.json()["ready"] is True
+
+
+class TestThreadConfiguration:
+    """Настройка потоков ONNX и BLAS"""
+
+    def test_blas_threads_limited(self, monkeypatch):
+        for variable in warmup_module.BLAS_THREAD_VARIABLES:
+            monkeypatch.delenv(variable, raising=False)
+        with patch("app.warmup.configure_onnx_threads") as onnx, \
+             patch("threadpoolctl.threadpool_limits") as limits:
+            configure_threads(onnx_threads=2, blas_threads=3)
+        onnx.assert_called_once_with(2)
+        limits.assert_called_once_with(limits=3, user_api="blas")
+        assert os.environ["OMP_NUM_THREADS"] == "3"
+
+    def test_zero_keeps_library_defaults(self, monkeypatch):
+        monkeypatch.delenv("OMP_NUM_THREADS", raising=False)
+        with patch("app.warmup.configure_onnx_threads"), patch("threadpoolctl.threadpool_limits") as limits:
+            configure_threads(onnx_threads=0, blas_threads=0)
+        limits.assert_not_called()
+        assert "OMP_NUM_THREADS" not in os.environ
+
+    def test_onnx_session_options_limited(self, monkeypatch):
+        onnxruntime = pytest.importorskip("onnxruntime")
+        # Исходный класс вернётся после теста
+        monkeypatch.setattr(onnxruntime, "SessionOptions", onnxruntime.SessionOptions)
+        monkeypatch.setattr(onnxruntime, "_base_session_options", onnxruntime.SessionOptions, raising=False)
+
+        configure_onnx_threads(2)
+        configure_onnx_threads(3)
+        options = onnxruntime.SessionOptions()
+        assert options.intra_op_num_threads == 3
+        assert options.inter_op_num_threads == 1
+        # Подмена - подкласс исходных опций, а не его обёртка
+        assert isinstance(options, onnxruntime._base_session_options)
+        assert onnxruntime.SessionOptions.__mro__[1] is onnxruntime._base_session_options